@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Cold-start budget of the check_multi.py subcommands
+
+Every subcommand is started with --help (or without arguments where the plugin has no
+--help) a number of times and the median wall time is compared to the startup time of
+a bare interpreter on the same machine. The startup of a subcommand may cost at most
+--budget milliseconds more than the bare interpreter, and must not import the modules
+given with --forbid (requests and urllib3 by default); a plugin has to import those
+where it sends requests.
+
+Exits 1 when a subcommand is over budget, so it can run on the pollers after an update:
+
+    python3 benchmarks/cold_start.py --budget 40 --runs 20
+
+Needs Python 3.7 or later for -X importtime.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from check_multi import SUBCOMMANDS # pylint: disable=wrong-import-position
+
+# Subcommands without argparse print their usage when started without arguments
+HELP_ARGS = {
+    'nsx-alarms': [],
+    'trend': ['--help'],
+}
+
+
+def command(subcommand):
+    return [sys.executable, os.path.join(BASE_DIR, 'check_multi.py'), subcommand] + HELP_ARGS.get(subcommand, ['--help'])
+
+
+def wall_time(cmd, runs):
+    """
+    Median wall time of cmd in milliseconds
+    """
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def imported_modules(cmd):
+    """
+    Names of the modules imported by cmd, from the -X importtime report
+    """
+    result = subprocess.run(cmd[:1] + ['-X', 'importtime'] + cmd[1:], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            check=False, universal_newlines=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.rsplit('|', 1)[1].strip())
+    return modules
+
+
+def commandline(args):
+    parser = argparse.ArgumentParser(description='Check the startup time of the check_multi.py subcommands against a budget')
+    parser.add_argument('--runs', type=int, default=10, help='Starts per subcommand. Defaults to 10')
+    parser.add_argument('--budget', type=float, default=40,
+                        help='Milliseconds a subcommand may take more than a bare interpreter. Defaults to 40')
+    parser.add_argument('--forbid', action='append', help='Modules that must not be imported at startup. Defaults to requests and urllib3')
+    parser.add_argument('--subcommand', action='append', choices=sorted(SUBCOMMANDS), help='Only measure these subcommands')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    return parser.parse_args(args)
+
+
+def main(args):
+    forbidden = set(args.forbid or ['requests', 'urllib3'])
+    baseline = wall_time([sys.executable, '-c', 'pass'], args.runs)
+
+    results = []
+    for subcommand in args.subcommand or SUBCOMMANDS:
+        cmd = command(subcommand)
+        median = wall_time(cmd, args.runs)
+        imported = sorted(forbidden & imported_modules(cmd))
+        results.append({
+            'subcommand': subcommand,
+            'median_ms': round(median, 1),
+            'over_baseline_ms': round(median - baseline, 1),
+            'forbidden_imports': imported,
+            'ok': median - baseline <= args.budget and not imported,
+        })
+
+    if args.json:
+        print(json.dumps({'baseline_ms': round(baseline, 1), 'budget_ms': args.budget, 'results': results}, indent=2))
+    else:
+        print("interpreter startup %.1f ms, budget +%.1f ms, %d runs each\n" % (baseline, args.budget, args.runs))
+        print("%-16s %10s %10s  %s" % ('subcommand', 'median', '+baseline', 'result'))
+        for result in results:
+            verdict = 'ok' if result['ok'] else 'OVER BUDGET'
+            if result['forbidden_imports']:
+                verdict = 'imports %s' % ', '.join(result['forbidden_imports'])
+            print("%-16s %8.1fms %8.1fms  %s" % (result['subcommand'], result['median_ms'], result['over_baseline_ms'], verdict))
+
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(commandline(sys.argv[1:])))
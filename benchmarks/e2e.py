@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+End-to-end wall time of the plugins against the local mock API
+
+Starts mock_api.py in this process on a free port with TLS, runs every check a number
+of times as the monitoring system would (a new interpreter per run) and reports the
+p50 and p99 wall time, the API requests per run and the exit codes:
+
+    python3 benchmarks/e2e.py --runs 20 --latency 20 --alarms 5000 --vms 2000
+
+--cold gives every run an empty cache directory, otherwise the token and response caches
+of the plugins are used like on a poller. The payload, latency and error options are the
+ones of mock_api.py serve. Needs the openssl command unless --certfile and --keyfile are
+given.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+import mock_api
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name: (plugin, arguments), {url}, {hostport} and {credentials} are filled in
+CHECKS = [
+    ('nsxt-cluster-status', 'check_vmware_nsxt.py', ['-A', '{url}', '-u', 'monitor', '-p', 'secret', '--insecure', '-m', 'cluster-status']),
+    ('nsxt-alarms', 'check_vmware_nsxt.py', ['-A', '{url}', '-u', 'monitor', '-p', 'secret', '--insecure', '-m', 'alarms']),
+    ('nsxt-capacity', 'check_vmware_nsxt.py', ['-A', '{url}', '-u', 'monitor', '-p', 'secret', '--insecure', '-m', 'capacity-usage']),
+    ('nsxt-all', 'check_vmware_nsxt.py', ['-A', '{url}', '-u', 'monitor', '-p', 'secret', '--insecure', '-m', 'all']),
+    ('nsx-alarms', 'check_nsx_alarms.py', ['{credentials}', '{hostport}']),
+    ('nsxt-backup', 'check_nsxt_backup.py', ['-n', '{hostport}', '-u', 'monitor', '-p', 'secret', '-i', '-a', '24']),
+    ('nsx-backup', 'nsx_backup_check.py', ['--nsx-manager', '{url}', '--credential-file', '{credentials}', '--time-period', '24']),
+    ('veeam-backup-vm', 'check_veeam_backup.py', ['--url', '{url}', '--credentials_file', '{credentials}', '--max_backup_age', '26',
+                                                  '--vm_name', 'vm00001']),
+    ('veeam-backup-all', 'check_veeam_backup.py', ['--url', '{url}', '--credentials_file', '{credentials}', '--max_backup_age', '26',
+                                                   '--all_vms']),
+    ('veeam-jobs', 'check_veeam_backupjobs.py', ['--url', '{url}', '--credentials_file', '{credentials}', '--max_backup_age', '24']),
+    ('veeam-jobs-details', 'check_veeam_backupjobs.py', ['--url', '{url}', '--credentials_file', '{credentials}', '--max_backup_age', '24',
+                                                         '--details']),
+    ('veeam-repo', 'check_veeam-EM-Repo-space.py', ['{url}', '{credentials}', 'Repository 0001', '80', '90']),
+    ('veeam-repo-xml', 'check_veeam-EM-Repo-space.py', ['{url}', '{credentials}', 'Repository 0001', '80', '90', '--report_format', 'xml']),
+]
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def mock_request(server, method, path):
+    """
+    Call a control endpoint of the mock, it runs in this process so the certificate is skipped
+    """
+    import ssl # pylint: disable=import-outside-toplevel
+    request = urllib.request.Request(server.url + path, method=method, data=b'' if method == 'POST' else None)
+    with urllib.request.urlopen(request, context=ssl._create_unverified_context()) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def run_check(server, plugin, arguments, env):
+    """
+    Run a check once, returns (wall time in ms, exit code, first output line, requests)
+    """
+    mock_request(server, 'POST', '/_mock/reset')
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(BASE_DIR, plugin)] + arguments, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, env=env, check=False, universal_newlines=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    stats = mock_request(server, 'GET', '/_mock/stats')
+    return elapsed, result.returncode, (result.stdout.splitlines() or [''])[0], stats['requests']
+
+
+def commandline(args):
+    parser = argparse.ArgumentParser(description='End-to-end wall time of the plugins against the local mock API')
+    parser.add_argument('--runs', type=int, default=10, help='Measured runs per check. Defaults to 10')
+    parser.add_argument('--warmup', type=int, default=1, help='Unmeasured runs per check first. Defaults to 1')
+    parser.add_argument('--checks', action='append', choices=[name for name, _, _ in CHECKS], help='Only run these checks')
+    parser.add_argument('--cold', action='store_true', help='Empty cache directory for every run')
+    parser.add_argument('--certfile', help='TLS certificate of the mock, default is a throw-away certificate')
+    parser.add_argument('--keyfile', help='TLS private key of the mock')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='Print the output of the last run of every check')
+
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds the mock adds to every response')
+    parser.add_argument('--jitter', type=float, default=0, help='Random milliseconds added on top of --latency')
+    parser.add_argument('--error_rate', type=float, default=0, help='Share of requests answered with --error_status')
+    parser.add_argument('--error_status', type=int, default=500, help='Status of injected errors, 0 closes the connection')
+    parser.add_argument('--error_paths', help='Only inject errors for paths matching this regular expression')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data')
+    parser.add_argument('--alarms', type=int, default=250, help='NSX alarms. Defaults to 250')
+    parser.add_argument('--capacity_items', type=int, default=15, help='NSX capacity usage entries. Defaults to 15')
+    parser.add_argument('--backups', type=int, default=10, help='NSX backups per type. Defaults to 10')
+    parser.add_argument('--vms', type=int, default=200, help='Veeam VMs with restore points. Defaults to 200')
+    parser.add_argument('--restore_points', type=int, default=7, help='Restore points per VM. Defaults to 7')
+    parser.add_argument('--jobs', type=int, default=100, help='Veeam jobs. Defaults to 100')
+    parser.add_argument('--repositories', type=int, default=20, help='EM repositories. Defaults to 20')
+    return parser.parse_args(args)
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix='e2e-')
+    try:
+        certfile, keyfile = args.certfile, args.keyfile
+        if not certfile:
+            certfile, keyfile = mock_api.self_signed_certificate(workdir)
+
+        data = mock_api.MockData(args.alarms, args.capacity_items, args.backups, args.vms, args.restore_points, args.jobs,
+                                 args.repositories, args.seed)
+        mock = mock_api.MockAPI(data, args.latency / 1000.0, args.jitter / 1000.0, args.error_rate, args.error_status,
+                                args.error_paths, args.seed)
+        server = mock_api.start_server(mock_api.MockHandler, mock, certfile=certfile, keyfile=keyfile)
+
+        credentials = os.path.join(workdir, 'credentials')
+        with open(credentials, 'w') as credentials_file:
+            credentials_file.write('monitor\nsecret\n')
+        values = {'url': server.url, 'hostport': '%s:%d' % server.server_address, 'credentials': credentials}
+
+        results = []
+        for name, plugin, arguments in CHECKS:
+            if args.checks and name not in args.checks:
+                continue
+            arguments = [argument.format(**values) for argument in arguments]
+
+            times, codes, requests = [], {}, []
+            for run in range(args.warmup + args.runs):
+                # The plugins keep their caches below TMPDIR
+                tmpdir = os.path.join(workdir, 'tmp-%s-%d' % (name, run) if args.cold else 'tmp')
+                os.makedirs(tmpdir, exist_ok=True)
+                env = dict(os.environ, TMPDIR=tmpdir)
+                # requests prefers these to session.verify = False, the mock certificate is self-signed
+                env.pop('REQUESTS_CA_BUNDLE', None)
+                env.pop('CURL_CA_BUNDLE', None)
+                elapsed, code, output, counts = run_check(server, plugin, arguments, env)
+                if run < args.warmup:
+                    continue
+                times.append(elapsed)
+                codes[code] = codes.get(code, 0) + 1
+                requests.append(counts)
+
+            totals = [sum(counts.values()) for counts in requests]
+            results.append({
+                'check': name,
+                'p50_ms': round(percentile(times, 50), 1),
+                'p99_ms': round(percentile(times, 99), 1),
+                'requests': round(sum(totals) / len(totals), 1),
+                'requests_by_endpoint': requests[-1],
+                'exit_codes': codes,
+                'output': output,
+            })
+        server.shutdown()
+        server.server_close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({'runs': args.runs, 'cold': args.cold, 'latency_ms': args.latency, 'results': results}, indent=2))
+        return 0
+
+    print("%d runs per check, %s cache, %.0f ms mock latency\n" % (args.runs, 'cold' if args.cold else 'warm', args.latency))
+    print("%-20s %10s %10s %9s  %s" % ('check', 'p50', 'p99', 'requests', 'exit codes'))
+    for result in results:
+        codes = ', '.join('%dx %d' % (count, code) for code, count in sorted(result['exit_codes'].items()))
+        print("%-20s %8.1fms %8.1fms %9.1f  %s" % (result['check'], result['p50_ms'], result['p99_ms'], result['requests'], codes))
+        if args.verbose:
+            print("    %s" % result['output'])
+            print("    %s" % ', '.join('%s=%d' % item for item in sorted(result['requests_by_endpoint'].items())))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(commandline(sys.argv[1:])))
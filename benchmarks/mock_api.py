@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the NSX-T Manager, Veeam B&R REST and Veeam Enterprise Manager APIs
+
+Only uses the standard library. One server answers all endpoints the plugins use:
+
+* NSX-T: /api/v1/cluster/status, /api/v1/alarms, /api/v1/capacity/usage,
+  /api/v1/cluster/backups/history, /policy/api/v1/cluster/backups/overview
+* VBR: /api/oauth2/token, /api/v1/restorePoints, /api/v1/backupObjects[/<id>/restorePoints],
+  /api/v1/backups/<id>, /api/v1/jobs/states, /api/v1/sessions[/<id>/taskSessions]
+* EM: /api/sessionMngr/, /api/logonSessions/<id>, /api/reports/summary/repository
+
+The payloads come from payloads.py, their sizes are set with --alarms, --vms, --jobs and
+friends. --latency and --jitter delay every response, --error_rate answers a share of the
+requests (optionally only those matching --error_paths) with --error_status, status 0
+closes the connection instead. GET /_mock/stats returns the request counts per endpoint,
+POST /_mock/reset clears them.
+
+record forwards everything to a real server and stores the responses with tokens,
+passwords and session IDs redacted, replay serves such a recording:
+
+    mock_api.py serve --port 8443 --self_signed --alarms 5000 --latency 20
+    mock_api.py record --upstream https://nsx01.example.com --recording nsx01.json --port 8443 --self_signed
+    mock_api.py replay --recording nsx01.json --port 8443 --self_signed
+"""
+
+import os
+import re
+import ssl
+import sys
+import json
+import time
+import random
+import fnmatch
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import http.server
+import socketserver
+import urllib.parse
+from datetime import datetime, timezone
+
+import payloads
+
+# Keys of JSON objects and XML elements whose values are not stored in recordings. Only the
+# EM login returns a SessionId, the sessionId of VBR jobs is a job session and stays.
+REDACT = r'(?i:access_token|refresh_token|id_token|password|secret|authorization|cookie)|^(?i:token)$|^SessionId$'
+# Response headers with credentials
+REDACT_HEADERS = r'(?i)session|token|auth|cookie'
+# Paths that contain a session ID
+REDACT_PATHS = r'(?<=/logonSessions/)[^/]+'
+# Response headers kept in recordings
+RECORDED_HEADERS = ('Content-Type', 'X-RestSvcSessionId', 'Location')
+
+
+class MockData:
+    """
+    Generated API data, built once when the server starts
+    """
+
+    def __init__(self, alarms=250, capacity_items=15, backups=10, vms=200, restore_points=7, jobs=100,
+                 repositories=20, seed=0):
+        now = time.time()
+        self.restore_points_per_vm = restore_points
+        self.vms = vms
+        self.now = now
+
+        self.cluster_status = json.dumps(payloads.nsx_cluster_status()).encode('utf-8')
+        self.alarms = list(payloads.nsx_alarms(alarms, seed, int(now * 1000)))
+        self.capacity_usage = json.dumps(payloads.nsx_capacity_usage(capacity_items, seed, int(now * 1000))).encode('utf-8')
+        self.backup_history = json.dumps(payloads.nsx_backup_history(backups, int(now * 1000))).encode('utf-8')
+        self.backup_overview = json.dumps(payloads.nsx_backup_overview(backups, int(now * 1000))).encode('utf-8')
+
+        self.backup_objects = list(payloads.veeam_backup_objects(vms))
+        self.object_index = {backup_object['id']: vm for vm, backup_object in enumerate(self.backup_objects)}
+        self.restore_points = list(payloads.veeam_restore_points(vms, restore_points, now))
+        self.jobs = list(payloads.veeam_jobs_states(jobs, seed, now))
+        self.job_index = {job['id']: job for job in self.jobs}
+        self.job_times = [parse_time(job['lastRun']) for job in self.jobs]
+
+        repository_list = list(payloads.em_repositories(repositories, seed))
+        self.reports = {
+            'json': payloads.em_repository_report(repository_list, 'json'),
+            'xml': payloads.em_repository_report(repository_list, 'xml'),
+        }
+
+
+def parse_time(value):
+    """
+    Seconds since the epoch of a Veeam timestamp or filter value, always UTC here
+    """
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+def redact(value, pattern):
+    """
+    Copy of decoded JSON with the values of matching keys replaced
+    """
+    if isinstance(value, dict):
+        return {key: 'REDACTED' if re.search(pattern, key) else redact(item, pattern) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item, pattern) for item in value]
+    return value
+
+
+def redact_body(body, content_type, pattern):
+    text = body.decode('utf-8', 'replace')
+    if 'json' in content_type:
+        try:
+            return json.dumps(redact(json.loads(text), pattern))
+        except ValueError:
+            pass
+    # XML and anything else, elements named like a secret lose their text
+    return re.sub(r'<((?:\w+:)?\w+)([^>]*)>[^<]*</\1>',
+                  lambda match: '<%s%s>REDACTED</%s>' % (match.group(1), match.group(2), match.group(1))
+                  if re.search(pattern, match.group(1).split(':')[-1]) else match.group(0), text)
+
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers the API requests from MockData
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes, with Nagle every keep-alive request would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    # (method, path pattern, route name)
+    ROUTES = [
+        ('GET', r'/api/v1/cluster/status', 'nsx_cluster_status'),
+        ('GET', r'/api/v1/alarms', 'nsx_alarms'),
+        ('GET', r'/api/v1/capacity/usage', 'nsx_capacity_usage'),
+        ('GET', r'/api/v1/cluster/backups/history', 'nsx_backup_history'),
+        ('GET', r'/policy/api/v1/cluster/backups/overview', 'nsx_backup_overview'),
+        ('POST', r'/api/oauth2/token', 'vbr_token'),
+        ('GET', r'/api/v1/backupObjects', 'vbr_backup_objects'),
+        ('GET', r'/api/v1/backupObjects/(?P<id>[^/]+)/restorePoints', 'vbr_object_restore_points'),
+        ('GET', r'/api/v1/restorePoints', 'vbr_restore_points'),
+        ('GET', r'/api/v1/backups/(?P<id>[^/]+)', 'vbr_backup'),
+        ('GET', r'/api/v1/jobs/states', 'vbr_jobs_states'),
+        ('GET', r'/api/v1/sessions', 'vbr_sessions'),
+        ('GET', r'/api/v1/sessions/(?P<id>[^/]+)/taskSessions', 'vbr_task_sessions'),
+        ('POST', r'/api/sessionMngr/?', 'em_login'),
+        ('DELETE', r'/api/logonSessions/(?P<id>[^/]+)', 'em_logout'),
+        ('GET', r'/api/reports/summary/repository', 'em_repository_report'),
+        ('GET', r'/_mock/stats', 'mock_stats'),
+        ('POST', r'/_mock/reset', 'mock_reset'),
+    ]
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def do_DELETE(self):
+        self.dispatch()
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_json(self, data, status=200, headers=None):
+        self.send_body(status, json.dumps(data).encode('utf-8'), headers=headers)
+
+    def dispatch(self):
+        url = urllib.parse.urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        self.read_body()
+
+        for method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if match and method == self.command:
+                break
+        else:
+            name, match = None, None
+
+        mock = self.server.mock
+        if name is None or not name.startswith('mock_'):
+            mock.count(name or 'not_found')
+            if mock.inject_delay():
+                return
+            if mock.inject_error(url.path):
+                error = mock.error_status
+                if error == 0:
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                return self.send_json({'errorCode': 'InjectedError', 'message': 'Error injected by mock_api.py'}, error)
+
+        if name is None:
+            return self.send_json({'error_code': 404, 'error_message': 'Unknown path %s' % url.path}, 404)
+        return getattr(self, 'route_' + name)(**match.groupdict())
+
+    def int_query(self, name, default):
+        try:
+            return int(self.query.get(name, default))
+        except ValueError:
+            return default
+
+    def veeam_page(self, items):
+        return self.send_json(payloads.veeam_page(items, self.int_query('skip', 0), self.int_query('limit', 0) or None))
+
+    # NSX-T
+
+    def route_nsx_cluster_status(self):
+        self.send_body(200, self.server.mock.data.cluster_status)
+
+    def route_nsx_alarms(self):
+        alarms = self.server.mock.data.alarms
+        if 'status' in self.query:
+            statuses = set(self.query['status'].split(','))
+            alarms = [alarm for alarm in alarms if alarm['status'] in statuses]
+        if 'severity' in self.query:
+            severities = set(self.query['severity'].split(','))
+            alarms = [alarm for alarm in alarms if alarm['severity'] in severities]
+
+        start = self.int_query('cursor', 0)
+        page_size = self.int_query('page_size', 1000)
+        page = {'results': alarms[start:start + page_size], 'result_count': len(alarms), 'sort_ascending': False}
+        if start + page_size < len(alarms):
+            page['cursor'] = '%08d' % (start + page_size)
+        self.send_json(page)
+
+    def route_nsx_capacity_usage(self):
+        self.send_body(200, self.server.mock.data.capacity_usage)
+
+    def route_nsx_backup_history(self):
+        self.send_body(200, self.server.mock.data.backup_history)
+
+    def route_nsx_backup_overview(self):
+        self.send_body(200, self.server.mock.data.backup_overview)
+
+    # Veeam B&R
+
+    def route_vbr_token(self):
+        self.send_json(payloads.oauth2_token())
+
+    def route_vbr_backup_objects(self):
+        self.veeam_page(self.server.mock.data.backup_objects)
+
+    def route_vbr_object_restore_points(self, id): # pylint: disable=redefined-builtin
+        data = self.server.mock.data
+        vm = data.object_index.get(id)
+        if vm is None:
+            return self.veeam_page([])
+        points = [payloads.veeam_restore_point(vm, point, data.now) for point in range(data.restore_points_per_vm)]
+        if self.query.get('orderAsc') == 'true':
+            points.reverse()
+        return self.veeam_page(points)
+
+    def route_vbr_restore_points(self):
+        self.veeam_page(self.server.mock.data.restore_points)
+
+    def route_vbr_backup(self, id): # pylint: disable=redefined-builtin
+        self.send_json(payloads.veeam_backup(id, self.server.mock.data.now))
+
+    def route_vbr_jobs_states(self):
+        data = self.server.mock.data
+        after = parse_time(self.query['lastRunAfterFilter']) if 'lastRunAfterFilter' in self.query else None
+        result = self.query.get('lastResultFilter')
+        name = self.query.get('nameFilter', '').lower()
+
+        jobs = [job for job, last_run in zip(data.jobs, data.job_times)
+                if (after is None or last_run > after) and (result is None or job['lastResult'] == result)
+                and (not name or fnmatch.fnmatchcase(job['name'].lower(), name))]
+        self.veeam_page(jobs)
+
+    def route_vbr_sessions(self):
+        data = self.server.mock.data
+        job = data.job_index.get(self.query.get('jobIdFilter'))
+        self.veeam_page([payloads.veeam_session(job, data.now)] if job else [])
+
+    def route_vbr_task_sessions(self, id): # pylint: disable=redefined-builtin
+        data = self.server.mock.data
+        job = next((job for job in data.jobs if job['sessionId'] == id), None)
+        self.veeam_page(payloads.veeam_task_sessions(payloads.veeam_session(job, data.now)) if job else [])
+
+    # Veeam Enterprise Manager
+
+    def route_em_login(self):
+        session_id = 'mock-session-%016x' % random.getrandbits(64)
+        self.send_json({'SessionId': session_id, 'UserName': 'monitor'}, 201, {'X-RestSvcSessionId': session_id})
+
+    def route_em_logout(self, id): # pylint: disable=redefined-builtin,unused-argument
+        self.send_body(204, b'')
+
+    def route_em_repository_report(self):
+        if 'xml' in (self.headers.get('Accept') or ''):
+            return self.send_body(200, self.server.mock.data.reports['xml'], 'application/xml; charset=utf-8')
+        return self.send_body(200, self.server.mock.data.reports['json'], 'application/json; charset=utf-8')
+
+    # Control
+
+    def route_mock_stats(self):
+        self.send_json(self.server.mock.stats())
+
+    def route_mock_reset(self):
+        self.server.mock.reset()
+        self.send_json({})
+
+
+class Recording:
+    """
+    Recorded responses, stored as one JSON file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def load(self):
+        with open(self.path, 'r') as recording_file:
+            self.entries = json.load(recording_file)['entries']
+        return self
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+            tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp_path, 'w') as recording_file:
+                json.dump({'recorded': time.time(), 'entries': self.entries}, recording_file, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def find(self, method, path, query):
+        """
+        Entry for a request, the same path with the most matching query parameters when there is no exact match
+
+        Query parameters like lastRunAfterFilter change with every run, so exact matches are rare.
+        """
+        best, best_score = None, -1
+        for entry in self.entries:
+            if entry['method'] != method or entry['path'] != path:
+                continue
+            score = sum(1 for key, value in query.items() if entry['query'].get(key) == value)
+            score -= sum(1 for key in entry['query'] if key not in query)
+            if score > best_score:
+                best, best_score = entry, score
+        return best
+
+
+class RecordHandler(MockHandler):
+    """
+    Forwards requests to the upstream server and records the responses
+    """
+
+    def dispatch(self):
+        url = urllib.parse.urlsplit(self.path)
+        body = self.read_body()
+        upstream = self.server.upstream
+        headers = {name: value for name, value in self.headers.items() if name.lower() not in ('host', 'connection', 'content-length')}
+
+        started = time.monotonic()
+        conn_class = http.client.HTTPSConnection if upstream.scheme == 'https' else http.client.HTTPConnection
+        kwargs = {'context': ssl._create_unverified_context()} if upstream.scheme == 'https' else {}
+        conn = conn_class(upstream.netloc, timeout=60, **kwargs)
+        try:
+            conn.request(self.command, self.path, body=body or None, headers=headers)
+            response = conn.getresponse()
+            response_body = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            return self.send_json({'error': 'upstream request failed: %s' % exc}, 502)
+        finally:
+            conn.close()
+        elapsed = time.monotonic() - started
+
+        content_type = response.getheader('Content-Type') or 'application/octet-stream'
+        kept = {name: response.getheader(name) for name in RECORDED_HEADERS if response.getheader(name)}
+        self.server.recording.add({
+            'method': self.command,
+            'path': re.sub(REDACT_PATHS, 'REDACTED', url.path),
+            'query': {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()},
+            'status': response.status,
+            'headers': {name: 'REDACTED' if re.search(REDACT_HEADERS, name) else value
+                        for name, value in kept.items()},
+            'body': redact_body(response_body, content_type, self.server.redact),
+            'elapsed': round(elapsed, 4),
+        })
+
+        # The client gets the real response, only the recording is redacted
+        self.send_body(response.status, response_body, content_type,
+                       {name: value for name, value in kept.items() if name != 'Content-Type'})
+
+
+class ReplayHandler(MockHandler):
+    """
+    Serves recorded responses
+    """
+
+    def dispatch(self):
+        url = urllib.parse.urlsplit(self.path)
+        self.read_body()
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+
+        if url.path.startswith('/_mock/'):
+            return super().dispatch()
+
+        path = re.sub(REDACT_PATHS, 'REDACTED', url.path)
+        mock = self.server.mock
+        mock.count('%s %s' % (self.command, path))
+        entry = self.server.recording.find(self.command, path, query)
+        if entry is not None and self.server.recorded_latency:
+            time.sleep(entry['elapsed'])
+        if mock.inject_delay():
+            return
+        if mock.inject_error(url.path):
+            return self.send_json({'errorCode': 'InjectedError', 'message': 'Error injected by mock_api.py'}, mock.error_status or 500)
+        if entry is None:
+            return self.send_json({'error': 'no recorded response for %s %s' % (self.command, url.path)}, 404)
+
+        headers = dict(entry['headers'])
+        content_type = headers.pop('Content-Type', 'application/json')
+        self.send_body(entry['status'], entry['body'].encode('utf-8'), content_type, headers)
+
+
+class MockAPI:
+    """
+    Shared state of a server: data, counters, latency and error injection
+    """
+
+    def __init__(self, data=None, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, error_paths=None, seed=0):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_paths = re.compile(error_paths) if error_paths else None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.errors = 0
+
+    def count(self, route):
+        with self.lock:
+            self.counts[route] = self.counts.get(route, 0) + 1
+
+    def inject_delay(self):
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        return False
+
+    def inject_error(self, path):
+        if self.error_rate <= 0 or (self.error_paths is not None and not self.error_paths.search(path)):
+            return False
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return failed
+
+    def stats(self):
+        with self.lock:
+            return {'requests': dict(self.counts), 'total': sum(self.counts.values()), 'errors': self.errors}
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+            self.errors = 0
+
+
+class MockServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Threaded HTTP(S) server, ThreadingHTTPServer is not available on Python 3.6
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, handler, mock, certfile=None, keyfile=None, verbose=False):
+        self.mock = mock
+        self.verbose = verbose
+        super().__init__(address, handler)
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    @property
+    def url(self):
+        scheme = 'https' if isinstance(self.socket, ssl.SSLSocket) else 'http'
+        return '%s://%s:%d' % (scheme, self.server_address[0], self.server_address[1])
+
+
+def self_signed_certificate(directory=None):
+    """
+    Create a throw-away certificate with the openssl command, returns (certfile, keyfile)
+    """
+    directory = directory or tempfile.mkdtemp(prefix='mock_api-')
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2', '-subj', '/CN=localhost',
+                    '-keyout', keyfile, '-out', certfile], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+def start_server(handler, mock, bind='127.0.0.1', port=0, certfile=None, keyfile=None, verbose=False, **attributes):
+    """
+    Start a server in a background thread and return it, port 0 picks a free port
+    """
+    server = MockServer((bind, port), handler, mock, certfile, keyfile, verbose)
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def commandline(args):
+    parser = argparse.ArgumentParser(description='Local stand-in for the NSX-T and Veeam APIs')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    serve = subparsers.add_parser('serve', help='Answer with generated data')
+    record = subparsers.add_parser('record', help='Forward to a real server and record the responses')
+    replay = subparsers.add_parser('replay', help='Answer with recorded responses')
+
+    for subparser in (serve, record, replay):
+        subparser.add_argument('--bind', default='127.0.0.1', help='Address to listen on. Defaults to 127.0.0.1')
+        subparser.add_argument('--port', type=int, default=8443, help='Port to listen on. Defaults to 8443')
+        subparser.add_argument('--certfile', help='TLS certificate, without one the server speaks plain HTTP')
+        subparser.add_argument('--keyfile', help='TLS private key')
+        subparser.add_argument('--self_signed', action='store_true', help='Serve TLS with a throw-away certificate (needs openssl)')
+        subparser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    for subparser in (serve, replay):
+        subparser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every response')
+        subparser.add_argument('--jitter', type=float, default=0, help='Random milliseconds added on top of --latency')
+        subparser.add_argument('--error_rate', type=float, default=0, help='Share of requests answered with --error_status, 0 to 1')
+        subparser.add_argument('--error_status', type=int, default=500, help='Status of injected errors, 0 closes the connection')
+        subparser.add_argument('--error_paths', help='Only inject errors for paths matching this regular expression')
+        subparser.add_argument('--seed', type=int, default=0, help='Seed of the generated data, latency and errors')
+
+    serve.add_argument('--alarms', type=int, default=250, help='NSX alarms. Defaults to 250')
+    serve.add_argument('--capacity_items', type=int, default=15, help='NSX capacity usage entries. Defaults to 15')
+    serve.add_argument('--backups', type=int, default=10, help='NSX backups per type. Defaults to 10')
+    serve.add_argument('--vms', type=int, default=200, help='Veeam VMs with restore points. Defaults to 200')
+    serve.add_argument('--restore_points', type=int, default=7, help='Restore points per VM. Defaults to 7')
+    serve.add_argument('--jobs', type=int, default=100, help='Veeam jobs. Defaults to 100')
+    serve.add_argument('--repositories', type=int, default=20, help='EM repositories. Defaults to 20')
+
+    record.add_argument('--upstream', required=True, help='URL of the real server, e.g. https://nsx01.example.com')
+    record.add_argument('--redact', default=REDACT, help='Regular expression of the keys whose values are redacted')
+    for subparser in (record, replay):
+        subparser.add_argument('--recording', required=True, help='Recording file')
+    replay.add_argument('--recorded_latency', action='store_true', help='Delay every response by the time the real server took')
+
+    return parser.parse_args(args)
+
+
+def main(args):
+    certfile, keyfile = args.certfile, args.keyfile
+    if args.self_signed:
+        certfile, keyfile = self_signed_certificate()
+
+    if args.command == 'record':
+        handler, mock = RecordHandler, MockAPI()
+        attributes = {'upstream': urllib.parse.urlsplit(args.upstream), 'recording': Recording(args.recording), 'redact': args.redact}
+    else:
+        mock = MockAPI(latency=args.latency / 1000.0, jitter=args.jitter / 1000.0, error_rate=args.error_rate,
+                       error_status=args.error_status, error_paths=args.error_paths, seed=args.seed)
+        if args.command == 'serve':
+            handler = MockHandler
+            mock.data = MockData(args.alarms, args.capacity_items, args.backups, args.vms, args.restore_points, args.jobs,
+                                 args.repositories, args.seed)
+            attributes = {}
+        else:
+            handler = ReplayHandler
+            attributes = {'recording': Recording(args.recording).load(), 'recorded_latency': args.recorded_latency}
+
+    server = MockServer((args.bind, args.port), handler, mock, certfile, keyfile, args.verbose)
+    for name, value in attributes.items():
+        setattr(server, name, value)
+
+    print("%s on %s" % (args.command, server.url), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(commandline(sys.argv[1:])))
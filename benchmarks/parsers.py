@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the plugins' parsing and classification loops at scale
+
+Every case feeds payloads.py data of a given size into one hot loop of a plugin:
+
+* nsxt-alarms, nsxt-alarms-excludes: check_vmware_nsxt.Alarms(...).get_output()
+* nsxt-capacity: check_vmware_nsxt.CapacityUsage(...).get_output()
+* nsx-process-alarms: check_nsx_alarms.process_alarms, output to /dev/null
+* em-repository-json, em-repository-xml: parse_repository_space over parse_repositories
+  of an encoded report, the searched repository is the last one
+* veeam-restore-points, veeam-restore-points-vms: check_veeam_backup.index_restore_points,
+  of all VMs and of 100 VMs
+* veeam-jobs-states: check_veeam_backupjobs.classify_jobs
+
+The input is generated before the measurement. For every case and size the suite
+reports the best CPU time of --repeats runs, the peak and retained traced memory of a
+run under tracemalloc, the memory blocks still allocated afterwards (the result) and the
+generation 0 garbage collections the run triggered, about one per 700 container objects
+allocated and not freed.
+
+Results are compared with a stored baseline, CPU times relative to a calibration loop
+so a baseline from another machine is still meaningful. A CPU time only counts as
+regression when it is over the tolerance and more than MIN_SLOWDOWN_MS slower, smaller
+differences are scheduler and cache noise on the small sizes. Exits 1 on a regression:
+
+    python3 benchmarks/parsers.py --sizes 10000,100000,500000
+    python3 benchmarks/parsers.py --save benchmarks/parsers_baseline.json
+"""
+
+import io
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import contextlib
+import statistics
+import tracemalloc
+import importlib.util
+from datetime import datetime, timedelta, timezone
+
+import payloads
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parsers_baseline.json')
+
+# Absolute CPU slowdown below which no regression is reported, whatever the tolerance
+MIN_SLOWDOWN_MS = 5
+
+
+def load_plugin(name, filename):
+    # Some plugin file names are no valid module names
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BASE_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+nsxt = load_plugin('check_vmware_nsxt', 'check_vmware_nsxt.py')
+nsx_alarms = load_plugin('check_nsx_alarms', 'check_nsx_alarms.py')
+em = load_plugin('check_veeam_em_repo_space', 'check_veeam-EM-Repo-space.py')
+veeam_backup = load_plugin('check_veeam_backup', 'check_veeam_backup.py')
+veeam_jobs = load_plugin('check_veeam_backupjobs', 'check_veeam_backupjobs.py')
+
+
+def setup_alarms(size):
+    return (list(payloads.nsx_alarms(size)), None)
+
+
+def setup_alarms_excludes(size):
+    return (list(payloads.nsx_alarms(size)), [['LOW esx-00', 'MEDIUM .*Edge Health']])
+
+
+def run_alarms(alarms, excludes):
+    return nsxt.Alarms(alarms, excludes).get_output()
+
+
+def setup_capacity(size):
+    return (payloads.nsx_capacity_usage(size),)
+
+
+def run_capacity(data):
+    return nsxt.CapacityUsage(data, 15, None).get_output()
+
+
+def setup_process_alarms(size):
+    return (list(payloads.nsx_alarms(size)),)
+
+
+def run_process_alarms(alarms):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            nsx_alarms.process_alarms(alarms)
+        except SystemExit as exc:
+            return exc.code
+    return None
+
+
+def setup_repository(report_format):
+    def setup(size):
+        report = payloads.em_repository_report(payloads.em_repositories(size), report_format)
+        return (report, report_format, 'Repository %04d' % (size - 1))
+    return setup
+
+
+def run_repository(report, report_format, name):
+    return em.parse_repository_space(em.parse_repositories(io.BytesIO(report), report_format), name)
+
+
+def setup_restore_points(size):
+    per_vm = 7
+    return (list(payloads.veeam_restore_points(max(1, size // per_vm), per_vm)), None)
+
+
+def setup_restore_points_vms(size):
+    restore_points, _ = setup_restore_points(size)
+    vms = max(1, size // 7)
+    return (restore_points, {'vm%05d' % vm for vm in range(0, vms, max(1, vms // 100))})
+
+
+def run_restore_points(restore_points, vm_names):
+    return veeam_backup.index_restore_points(restore_points, vm_names)
+
+
+def setup_jobs(size):
+    return (list(payloads.veeam_jobs_states(size)), datetime.now(timezone.utc) - timedelta(hours=24), None)
+
+
+def run_jobs(jobs, cutoff, job_filter):
+    return veeam_jobs.classify_jobs(jobs, cutoff, job_filter)
+
+
+# name: (setup, run)
+CASES = {
+    'nsxt-alarms': (setup_alarms, run_alarms),
+    'nsxt-alarms-excludes': (setup_alarms_excludes, run_alarms),
+    'nsxt-capacity': (setup_capacity, run_capacity),
+    'nsx-process-alarms': (setup_process_alarms, run_process_alarms),
+    'em-repository-json': (setup_repository('json'), run_repository),
+    'em-repository-xml': (setup_repository('xml'), run_repository),
+    'veeam-restore-points': (setup_restore_points, run_restore_points),
+    'veeam-restore-points-vms': (setup_restore_points_vms, run_restore_points),
+    'veeam-jobs-states': (setup_jobs, run_jobs),
+}
+
+
+def calibrate():
+    """
+    CPU milliseconds of a fixed loop with dict access and string formatting, like the parsers
+    """
+    times = []
+    for _ in range(5):
+        started = time.process_time()
+        records = [{'name': 'vm%05d' % index, 'severity': 'HIGH'} for index in range(100000)]
+        lines = ["[%s] %s" % (record['severity'], record['name']) for record in records]
+        times.append((time.process_time() - started) * 1000)
+        del records, lines
+    return statistics.median(times)
+
+
+def measure(run, arguments, repeats):
+    """
+    Measure one case at one size, see the module docstring
+    """
+    times = []
+    collections = []
+    for _ in range(repeats):
+        gc.collect()
+        before = gc.get_stats()[0]['collections']
+        started = time.process_time()
+        result = run(*arguments)
+        times.append((time.process_time() - started) * 1000)
+        collections.append(gc.get_stats()[0]['collections'] - before)
+        del result
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = run(*arguments)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    retained_blocks = sys.getallocatedblocks() - blocks
+    del result
+
+    return {
+        # Noise only ever adds time, the fastest run is the most stable figure
+        'cpu_ms': round(min(times), 2),
+        'peak_kb': round((peak - base) / 1024, 1),
+        'retained_kb': round((current - base) / 1024, 1),
+        'retained_blocks': retained_blocks,
+        'gc_gen0': int(statistics.median(collections)),
+    }
+
+
+def compare(results, calibration, baseline, tolerance):
+    """
+    Regressions against the baseline, as messages
+    """
+    regressions = []
+    scale = calibration / baseline['calibration_ms']
+    for case, sizes in results.items():
+        for size, result in sizes.items():
+            previous = baseline['results'].get(case, {}).get(size)
+            if previous is None:
+                continue
+            expected = previous['cpu_ms'] * scale
+            if result['cpu_ms'] > expected * (1 + tolerance) and result['cpu_ms'] - expected > MIN_SLOWDOWN_MS:
+                regressions.append("%s %s: cpu %.1f ms, baseline %.1f ms (scaled)" % (case, size, result['cpu_ms'], expected))
+            if result['peak_kb'] > previous['peak_kb'] * (1 + tolerance) and result['peak_kb'] - previous['peak_kb'] > 64:
+                regressions.append("%s %s: peak %.0f KiB, baseline %.0f KiB" % (case, size, result['peak_kb'], previous['peak_kb']))
+    return regressions
+
+
+def commandline(args):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the plugin parsers at scale')
+    parser.add_argument('--sizes', default='10000,100000,500000', help='Comma separated record counts. Defaults to 10000,100000,500000')
+    parser.add_argument('--cases', action='append', choices=sorted(CASES), help='Only run these cases')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per case and size, the best counts. Defaults to 5')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline to compare with, if it exists. Defaults to %(default)s')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown or memory growth. Defaults to 0.25')
+    parser.add_argument('--save', metavar='FILE', help='Store the results as new baseline')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    return parser.parse_args(args)
+
+
+def main(args):
+    sizes = [int(size) for size in args.sizes.split(',')]
+    calibration = calibrate()
+
+    results = {}
+    for case in args.cases or CASES:
+        setup, run = CASES[case]
+        results[case] = {}
+        for size in sizes:
+            arguments = setup(size)
+            results[case][str(size)] = measure(run, arguments, args.repeats)
+            del arguments
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'calibration_ms': round(calibration, 2),
+        'results': results,
+    }
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = compare(results, calibration, json.load(baseline_file), args.tolerance)
+
+    if args.json:
+        print(json.dumps(dict(report, regressions=regressions), indent=2))
+    else:
+        print("python %s, calibration %.1f ms\n" % (report['python'], calibration))
+        print("%-26s %8s %10s %11s %11s %9s %7s" % ('case', 'size', 'cpu', 'peak', 'retained', 'blocks', 'gc0'))
+        for case, case_results in results.items():
+            for size, result in case_results.items():
+                print("%-26s %8s %8.1fms %8.0fKiB %8.0fKiB %9d %7d" % (
+                    case, size, result['cpu_ms'], result['peak_kb'], result['retained_kb'], result['retained_blocks'], result['gc_gen0']))
+        for regression in regressions:
+            print("REGRESSION: %s" % regression)
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=1, sort_keys=True)
+            baseline_file.write('\n')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(commandline(sys.argv[1:])))
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Synthetic NSX-T, Veeam B&R and Veeam Enterprise Manager API payloads
+
+The records have the fields and formats of the real APIs (NSX-T 3.x/4.x API, VBR REST
+API 1.x, EM REST API v1), including the fields the plugins don't read, so payload sizes
+and parsing costs are realistic. Generated data is deterministic for a seed, and all
+times are relative to now, so the same seed always gives the same check states.
+
+The collection generators yield one record at a time, callers decide whether to keep
+them in a list.
+"""
+
+import json
+import time
+import random
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+ALARM_SEVERITIES = ['CRITICAL', 'HIGH', 'MEDIUM', 'LOW']
+ALARM_FEATURES = [
+    ('certificates', 'Certificates', 'certificate_expiration_approaching', 'Certificate Expiration Approaching'),
+    ('edge_health', 'Edge Health', 'edge_cpu_usage_very_high', 'Edge CPU Usage Very High'),
+    ('infrastructure_communication', 'Infrastructure Communication', 'edge_tunnels_down', 'Edge Tunnels Down'),
+    ('manager_health', 'Manager Health', 'manager_disk_usage_high', 'Manager Disk Usage High'),
+    ('transport_node_health', 'Transport Node Health', 'transport_node_uplink_down', 'Transport Node Uplink Down'),
+    ('dns', 'DNS', 'forwarder_upstream_server_timeout', 'Forwarder Upstream Server Timeout'),
+]
+CAPACITY_TYPES = [
+    'NUM_LOGICAL_SWITCHES', 'NUM_LOGICAL_PORTS', 'NUM_FIREWALL_RULES', 'NUM_FIREWALL_SECTIONS', 'NUM_NSGROUPS',
+    'NUM_IP_SETS', 'NUM_TIER0_ROUTERS', 'NUM_TIER1_ROUTERS', 'NUM_HYPERVISOR_HOSTS', 'NUM_EDGE_NODES',
+    'NUM_DHCP_POOLS', 'NUM_LB_VIRTUAL_SERVERS', 'NUM_LB_POOLS', 'NUM_SERVICES', 'NUM_VMS',
+]
+JOB_RESULTS = ['Success'] * 8 + ['Warning', 'Failed']
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def veeam_time(timestamp):
+    """
+    Veeam REST timestamp, e.g. 2024-05-01T22:00:12.123+00:00
+    """
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + '+00:00'
+
+
+def nsx_cluster_status(nodes=3, stable=True):
+    status = 'STABLE' if stable else 'DEGRADED'
+    members = [{
+        'member_fqdn': 'nsx-mgr-%02d.example.com' % node,
+        'member_ip': '10.0.0.%d' % (10 + node),
+        'member_uuid': '4207%04x-1c0b-4b5a-9ad2-%012x' % (node, node),
+        'member_status': 'UP',
+    } for node in range(nodes)]
+    return {
+        'cluster_id': 'a8f2d1c4-7e1b-4d2a-9c3e-2f6b8d0e4a11',
+        'control_cluster_status': {'status': status},
+        'mgmt_cluster_status': {
+            'status': status,
+            'online_nodes': [{'uuid': member['member_uuid'], 'mgmt_cluster_listen_ip_address': member['member_ip']}
+                             for member in members],
+            'offline_nodes': [],
+        },
+        'detailed_cluster_status': {
+            'overall_status': status,
+            'cluster_id': 'a8f2d1c4-7e1b-4d2a-9c3e-2f6b8d0e4a11',
+            'groups': [{
+                'group_id': '%08x-0000-4000-8000-%012x' % (index, index),
+                'group_type': group_type,
+                'group_status': status,
+                'members': members,
+                'leaders': [{'service_name': group_type.lower(), 'leader_uuid': members[0]['member_uuid'], 'lease_version': 7}],
+            } for index, group_type in enumerate(['MANAGER', 'CONTROLLER', 'POLICY', 'HTTPS', 'DATASTORE', 'CLUSTER_BOOT_MANAGER'])],
+        },
+    }
+
+
+def nsx_alarms(count, seed=0, now=None, open_ratio=0.8):
+    """
+    Alarms like GET /api/v1/alarms returns them
+    """
+    rand = random.Random(seed)
+    now = now_ms() if now is None else now
+    for index in range(count):
+        feature, feature_display, event, event_display = ALARM_FEATURES[index % len(ALARM_FEATURES)]
+        created = now - rand.randint(0, 7 * 86400) * 1000
+        node = rand.randint(0, 63)
+        yield {
+            'id': '%08x-%04x-4%03x-8%03x-%012x' % (rand.getrandbits(32), index & 0xffff, rand.getrandbits(12), rand.getrandbits(12), index),
+            'feature_name': feature,
+            'event_type': event,
+            'feature_display_name': feature_display,
+            'event_type_display_name': event_display,
+            'node_id': '%08x-7c1f-4a2e-b3d4-%012x' % (node, node),
+            'node_display_name': 'esx-%03d.example.com' % node,
+            'node_resource_type': 'TransportNode',
+            'entity_id': '%08x-2b3c-4d5e-8f90-%012x' % (node, index),
+            'status': 'OPEN' if rand.random() < open_ratio else rand.choice(['ACKNOWLEDGED', 'SUPPRESSED', 'RESOLVED']),
+            'severity': ALARM_SEVERITIES[rand.randint(0, 3)],
+            'summary': '%s on node esx-%03d.' % (event_display, node),
+            'description': 'The %s alarm was raised by %s for entity %d. See the recommended action.' % (
+                event_display, feature_display, index),
+            'recommended_action': 'Review the %s configuration of the node and resolve the cause.' % feature_display,
+            'event_tags': [feature, 'node:%d' % node],
+            'reopens_alarm_id': None,
+            '_create_time': created,
+            '_last_modified_time': created + rand.randint(0, 3600) * 1000,
+            '_create_user': 'system',
+            '_last_modified_user': 'system',
+            '_protection': 'NOT_PROTECTED',
+            '_revision': rand.randint(0, 5),
+            '_system_owned': False,
+        }
+
+
+def nsx_capacity_usage(count=len(CAPACITY_TYPES), seed=0, now=None, max_percentage=95):
+    """
+    GET /api/v1/capacity/usage, usage types beyond the real ones are numbered
+    """
+    rand = random.Random(seed)
+    now = now_ms() if now is None else now
+    usages = []
+    for index in range(count):
+        usage_type = CAPACITY_TYPES[index] if index < len(CAPACITY_TYPES) else 'NUM_CUSTOM_OBJECTS_%d' % index
+        maximum = rand.choice([512, 1000, 4000, 10000, 100000])
+        current = rand.randint(0, maximum * max_percentage // 100)
+        percentage = round(current * 100.0 / maximum, 2)
+        usages.append({
+            'usage_type': usage_type,
+            'display_name': usage_type.replace('NUM_', '').replace('_', ' ').title(),
+            'max_supported_count': maximum,
+            'current_usage_count': current,
+            'current_usage_percentage': percentage,
+            'min_threshold_percentage': 70.0,
+            'max_threshold_percentage': 100.0,
+            'severity': 'INFO' if percentage < 70 else 'WARNING' if percentage < 100 else 'CRITICAL',
+        })
+    return {
+        'capacity_usage': usages,
+        'meta_info': {
+            'last_updated_timestamp': now - 60000,
+            'min_threshold_percentage': 70.0,
+            'max_threshold_percentage': 100.0,
+        },
+    }
+
+
+def nsx_backup_statuses(count, now=None, interval_hours=24, failed_every=0):
+    now = now_ms() if now is None else now
+    statuses = []
+    for index in range(count):
+        start = now - (index * interval_hours + 1) * 3600000
+        statuses.append({
+            'backup_id': '%08x-6f1e-4c2b-9a3d-%012x' % (start // 1000, index),
+            'start_time': start,
+            'end_time': start + 420000,
+            'success': not (failed_every and index % failed_every == failed_every - 1),
+        })
+    return statuses
+
+
+def nsx_backup_history(count=10, now=None):
+    """
+    GET /api/v1/cluster/backups/history
+    """
+    return {
+        'cluster_backup_statuses': nsx_backup_statuses(count, now),
+        'node_backup_statuses': nsx_backup_statuses(count, now),
+        'inventory_backup_statuses': nsx_backup_statuses(count, now, interval_hours=1),
+    }
+
+
+def nsx_backup_overview(count=10, now=None):
+    """
+    GET /policy/api/v1/cluster/backups/overview
+    """
+    return {
+        'backup_config': {
+            'backup_enabled': True,
+            'backup_schedule': {'resource_type': 'IntervalBackupSchedule', 'seconds_between_backups': 86400},
+            'remote_file_server': {'server': 'sftp.example.com', 'port': 22, 'directory_path': '/backups/nsx'},
+            'inventory_summary_interval': 240,
+        },
+        'backup_operation_history': nsx_backup_history(count, now),
+        'current_backup_operation_status': {'operation_type': 'NONE'},
+    }
+
+
+def veeam_backup_objects(vms):
+    """
+    GET /api/v1/backupObjects
+    """
+    for vm in range(vms):
+        yield {
+            'id': 'a1b2%04x-0000-4000-8000-%012x' % (vm & 0xffff, vm),
+            'name': 'vm%05d' % vm,
+            'type': 'VM',
+            'platformName': 'VMware',
+            'platformId': '00000000-0000-0000-0000-000000000000',
+            'viType': 'VirtualMachine',
+            'objectId': 'vm-%d' % (1000 + vm),
+            'path': 'vcenter.example.com\\Datacenter\\Cluster01\\vm%05d' % vm,
+            'restorePointsCount': 7,
+        }
+
+
+def veeam_backup_id(vm, backups):
+    return 'b0%06x-1111-4000-8000-%012x' % (vm % backups, vm % backups)
+
+
+def veeam_restore_point(vm, point, now, backups=50, infected_every=0):
+    """
+    Restore point number point (0 is the newest) of a VM, the same for every endpoint
+    """
+    # Spread the backups of a night over a few hours without a random generator
+    created = now - point * 86400 - 1800 - (vm * 7919 + point * 104729) % 16200
+    return {
+        'id': 'c0%06x-2222-4000-8000-%012x' % (point, vm),
+        'name': 'vm%05d' % vm,
+        'platformName': 'VMware',
+        'platformId': '00000000-0000-0000-0000-000000000000',
+        'creationTime': veeam_time(created),
+        'backupId': veeam_backup_id(vm, backups),
+        'sessionId': 'd0%06x-3333-4000-8000-%012x' % (point, vm % backups),
+        'malwareStatus': 'Infected' if infected_every and vm % infected_every == infected_every - 1 else 'Clean',
+        'type': 'Full' if point % 7 == 0 else 'Increment',
+        'allowedOperations': ['StartViVMInstantRecovery', 'StartEntireVMRestore', 'StartFlrRestore'],
+    }
+
+
+def veeam_restore_points(vms, per_vm, now=None, backups=50, infected_every=0):
+    """
+    GET /api/v1/restorePoints, newest restore point of every VM first
+    """
+    now = time.time() if now is None else now
+    for point in range(per_vm):
+        for vm in range(vms):
+            yield veeam_restore_point(vm, point, now, backups, infected_every)
+
+
+def veeam_backup(backup_id, now=None):
+    """
+    GET /api/v1/backups/{id}
+    """
+    now = time.time() if now is None else now
+    return {
+        'id': backup_id,
+        'name': 'Backup Job %s' % backup_id[2:8],
+        'jobId': 'e0%s-4444-4000-8000-000000000000' % backup_id[2:8],
+        'policyUniqueId': None,
+        'jobType': 'Backup',
+        'creationTime': veeam_time(now - 90 * 86400),
+        'platformName': 'VMware',
+        'platformId': '00000000-0000-0000-0000-000000000000',
+        'repositoryId': '88788f9e-d8f5-4eb4-bc4f-9b3f5403bcec',
+    }
+
+
+def veeam_jobs_states(count, seed=0, now=None):
+    """
+    GET /api/v1/jobs/states
+    """
+    rand = random.Random(seed)
+    now = time.time() if now is None else now
+    for index in range(count):
+        last_run = now - rand.randint(600, 72 * 3600)
+        yield {
+            'id': 'e0%06x-4444-4000-8000-%012x' % (index, index),
+            'name': 'Backup Job %05d' % index,
+            'type': 'Backup',
+            'description': 'Created by Veeam Backup & Replication',
+            'status': 'Inactive',
+            'lastRun': veeam_time(last_run),
+            'lastResult': rand.choice(JOB_RESULTS),
+            'nextRun': veeam_time(last_run + 86400),
+            'workload': 'Vm',
+            'repositoryId': '88788f9e-d8f5-4eb4-bc4f-9b3f5403bcec',
+            'repositoryName': 'Default Backup Repository',
+            'objectsCount': rand.randint(1, 40),
+            'sessionId': 'd0%06x-3333-4000-8000-%012x' % (index, index),
+            'highPriority': False,
+        }
+
+
+def veeam_session(job, now=None):
+    """
+    Latest session of a job, GET /api/v1/sessions?jobIdFilter=...
+    """
+    now = time.time() if now is None else now
+    return {
+        'id': job['sessionId'],
+        'name': job['name'],
+        'jobId': job['id'],
+        'sessionType': 'BackupJob',
+        'creationTime': job['lastRun'],
+        'endTime': veeam_time(now - 300),
+        'state': 'Stopped',
+        'progressPercent': 100,
+        'result': {
+            'result': job['lastResult'],
+            'message': '' if job['lastResult'] == 'Success' else 'Processing finished with %s' % job['lastResult'].lower(),
+            'isCanceled': False,
+        },
+        'resourceId': job['id'],
+        'resourceReference': '/api/v1/jobs/%s' % job['id'],
+        'parentSessionId': None,
+        'usn': 1024,
+    }
+
+
+def veeam_task_sessions(session, count=4):
+    """
+    GET /api/v1/sessions/{id}/taskSessions, the last task carries the session result
+    """
+    tasks = []
+    for index in range(count):
+        result = session['result']['result'] if index == count - 1 else 'Success'
+        tasks.append({
+            'id': '%s-t%02d' % (session['id'][:-4], index),
+            'type': 'Backup',
+            'sessionId': session['id'],
+            'sessionType': 'BackupJob',
+            'creationTime': session['creationTime'],
+            'endTime': session['endTime'],
+            'state': 'Stopped',
+            'result': {
+                'result': result,
+                'message': '' if result == 'Success' else 'Error: Failed to create VM snapshot',
+                'isCanceled': False,
+            },
+            'name': 'vm%05d' % index,
+            'usn': 1024 + index,
+        })
+    return tasks
+
+
+def veeam_page(items, skip=0, limit=None):
+    """
+    VBR REST collection page with pagination, items must be a list
+    """
+    data = items[skip:] if limit is None else items[skip:skip + limit]
+    return {'data': data, 'pagination': {'total': len(items), 'count': len(data), 'skip': skip, 'limit': limit or len(items)}}
+
+
+def oauth2_token(expires_in=900):
+    return {
+        'access_token': 'mock-access-%016x' % random.getrandbits(64),
+        'token_type': 'bearer',
+        'refresh_token': 'mock-refresh-%016x' % random.getrandbits(64),
+        'expires_in': expires_in,
+        '.issued': veeam_time(time.time()),
+        '.expires': veeam_time(time.time() + expires_in),
+    }
+
+
+def em_repositories(count, seed=0):
+    """
+    Repository periods of GET /api/reports/summary/repository
+    """
+    rand = random.Random(seed)
+    for index in range(count):
+        capacity = rand.choice([10, 20, 50, 100]) * 2 ** 40
+        free = int(capacity * rand.uniform(0.02, 0.6))
+        yield {
+            'Name': 'Repository %04d' % index,
+            'Capacity': capacity,
+            'FreeSpace': free,
+            'BackupSize': int((capacity - free) * 0.95),
+            'RestorePoints': rand.randint(7, 400),
+            'RatioOfRestorePoints': round(rand.uniform(1, 3), 2),
+        }
+
+
+def em_repository_report(repositories, report_format='json'):
+    """
+    Encoded repository report, JSON or XML like the Enterprise Manager sends it
+    """
+    if report_format == 'json':
+        return json.dumps({'Periods': list(repositories)}).encode('utf-8')
+
+    parts = ['<?xml version="1.0" encoding="utf-8"?>\n<RepositoryReportFrame xmlns="http://www.veeam.com/ent/v1.0" '
+             'xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">']
+    for repository in repositories:
+        parts.append('<Period>%s</Period>' % ''.join(
+            '<%s>%s</%s>' % (key, escape(str(value)), key) for key, value in repository.items()))
+    parts.append('</RepositoryReportFrame>')
+    return ''.join(parts).encode('utf-8')
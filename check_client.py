@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Runs a plugin in check_server.py and relays its output and exit code
+
+Use it in the Nagios command definitions instead of the plugin itself:
+
+    check_client.py check_vmware_nsxt.py -A https://nsx01 -u monitor -p secret -m alarms
+
+The client only imports what it needs to talk to the server. It hands its stdin, stdout
+and stderr to the server, so the plugin writes to them directly, and exits with the
+plugin's exit code. When no server is running, the plugin is run directly instead.
+
+Usage: check_client.py [--socket <path>] <plugin> [plugin arguments]
+"""
+
+import os
+import sys
+import json
+import array
+import socket
+import struct
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+UNKNOWN = 3
+
+# Must match check_server.py
+HEADER = struct.Struct('!I')
+EXIT_CODE = struct.Struct('!i')
+
+
+def default_socket():
+    # Same as plugin_cache.default_cache_dir('check_server'), without importing tempfile
+    tmpdir = os.environ.get('TMPDIR') or os.environ.get('TEMP') or os.environ.get('TMP') or '/tmp'
+    return os.path.join(tmpdir, 'check_server', 'check_server.sock')
+
+
+def run_direct(plugin, argv):
+    path = os.path.join(PLUGIN_DIR, plugin)
+    os.execv(sys.executable, [sys.executable, path] + argv)
+
+
+def run_remote(path, plugin, argv):
+    """
+    Run the plugin in the server, returns its exit code or None when no server is listening
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    with sock:
+        sys.stdout.flush()
+        body = json.dumps({'plugin': plugin, 'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)}).encode('utf-8')
+        fds = array.array('i', [0, 1, 2])
+        sock.sendmsg([HEADER.pack(len(body))], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds.tobytes())])
+        sock.sendall(body)
+
+        response = b''
+        while len(response) < EXIT_CODE.size:
+            chunk = sock.recv(EXIT_CODE.size - len(response))
+            if not chunk:
+                print("UNKNOWN: check_server.py closed the connection before %s finished" % plugin)
+                return UNKNOWN
+            response += chunk
+        return EXIT_CODE.unpack(response)[0]
+
+
+def main(argv):
+    path = os.environ.get('CHECK_SERVER_SOCKET') or default_socket()
+    if len(argv) >= 2 and argv[0] == '--socket':
+        path = argv[1]
+        argv = argv[2:]
+
+    if not argv or argv[0].startswith('-'):
+        print("Usage: check_client.py [--socket <path>] <plugin> [plugin arguments]")
+        return UNKNOWN
+
+    plugin = os.path.basename(argv[0])
+    if not plugin.endswith('.py'):
+        plugin += '.py'
+
+    code = run_remote(path, plugin, argv[1:])
+    if code is None:
+        run_direct(plugin, argv[1:])
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+One entry point for all plugins, the check is chosen by a subcommand
+
+    check_multi.py nsxt -A https://nsx01 -u monitor -p secret -m alarms
+    check_multi.py veeam-jobs --url https://vbr01:9419 --credentials_file /etc/nagios/veeam.cred --max_backup_age 24
+
+It can also be installed as multi-call binary: a symlink named like a subcommand or a
+plugin (e.g. check_vmware_nsxt -> check_multi.py) runs that check.
+
+Only the selected plugin is loaded, from its cached bytecode, and the plugins import
+their HTTP stacks only when they send requests. --help, --version and usage errors
+therefore don't pay for importing requests and urllib3. benchmarks/cold_start.py
+checks the startup time of every subcommand against a budget.
+
+Usage: check_multi.py <subcommand> [plugin arguments]
+"""
+
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.realpath(__file__))
+
+UNKNOWN = 3
+
+# subcommand: (plugin, description)
+SUBCOMMANDS = {
+    'nsxt': ('check_vmware_nsxt.py', 'NSX-T cluster status, alarms and capacity'),
+    'nsx-alarms': ('check_nsx_alarms.py', 'NSX open alarms'),
+    'nsxt-backup': ('check_nsxt_backup.py', 'NSX-T backup history'),
+    'nsx-backup': ('nsx_backup_check.py', 'NSX backup overview'),
+    'veeam-backup': ('check_veeam_backup.py', 'Veeam restore points of VMs'),
+    'veeam-jobs': ('check_veeam_backupjobs.py', 'Veeam backup job results'),
+    'veeam-repo': ('check_veeam-EM-Repo-space.py', 'Veeam repository space via Enterprise Manager'),
+    'vcenter-backup': ('check_vcenter_backup.py', 'vCenter appliance backup jobs'),
+    'trend': ('check_trend_connectivity.py', 'Trend Vision One endpoint connectivity'),
+}
+
+
+def find_subcommand(name):
+    """
+    Plugin file of a subcommand, also accepts the plugin names with or without .py
+    """
+    name = os.path.basename(name)
+    if name in SUBCOMMANDS:
+        return SUBCOMMANDS[name][0]
+    for plugin, _ in SUBCOMMANDS.values():
+        if name in (plugin, plugin[:-3]):
+            return plugin
+    return None
+
+
+def usage():
+    print("Usage: check_multi.py <subcommand> [plugin arguments]\n\nSubcommands:")
+    for name, (plugin, description) in SUBCOMMANDS.items():
+        print("  %-16s %s (%s)" % (name, description, plugin))
+
+
+def run_plugin(plugin, argv):
+    """
+    Run a plugin like the interpreter runs a script, but from its cached bytecode
+    """
+    import importlib.util # pylint: disable=import-outside-toplevel
+
+    path = os.path.join(PLUGIN_DIR, plugin)
+    spec = importlib.util.spec_from_file_location('__main__', path)
+    module = importlib.util.module_from_spec(spec)
+    # The plugins test __name__ or __package__ to see whether they run as script
+    module.__package__ = None
+    sys.modules['__main__'] = module
+    sys.argv = [path] + argv
+    spec.loader.exec_module(module)
+
+
+def main(argv):
+    plugin = find_subcommand(argv[0])
+    if plugin is not None:
+        # Called through a symlink named like the check
+        return run_plugin(plugin, argv[1:])
+
+    if len(argv) < 2 or argv[1] in ('-h', '--help'):
+        usage()
+        return UNKNOWN
+
+    plugin = find_subcommand(argv[1])
+    if plugin is None:
+        print("UNKNOWN: unknown subcommand %s" % argv[1])
+        usage()
+        return UNKNOWN
+
+    return run_plugin(plugin, argv[2:])
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -5,28 +5,67 @@ import ssl
 import json
 import sys
 import base64
+import urllib.parse
 
-def fetch_alarms(api_url, username, password, verify_ssl=False):
+from plugin_timings import Timings, phase, count, perfdata_suffix, connection_class
+
+# Only these severities change the check state, everything else is not fetched at all
+SEVERITIES = ['CRITICAL', 'HIGH', 'MEDIUM']
+PAGE_SIZE = 1000
+
+def get_page(conn, path, headers, timings=None):
+    with phase('fetch', timings):
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+    count(len(body), timings)
+    if response.status != 200:
+        print(f"UNKNOWN: API request failed with status {response.status}")
+        sys.exit(3)
+
+    with phase('decode', timings):
+        return json.loads(body.decode('utf-8'))
+
+def fetch_alarms(api_url, username, password, verify_ssl=False, severities=SEVERITIES, timings=None, totals=None):
+    """
+    Generator over the open alarms, following the API cursor page by page
+
+    Status and severity are filtered by the API and the pages are requested over
+    one connection, so only a single page is held in memory at a time. With totals,
+    totals['all'] is set to the number of alarms of any status and severity after the
+    last page, from the result_count of a one item request.
+    """
     if verify_ssl:
         context = ssl.create_default_context()
     else:
         context = ssl._create_unverified_context()
 
-    conn = http.client.HTTPSConnection(api_url, context=context)
+    conn_class = http.client.HTTPSConnection if timings is None else connection_class()
+    conn = conn_class(api_url, context=context)
     headers = {
         'Authorization': f'Basic {get_auth_header(username, password)}',
         'Content-Type': 'application/json'
     }
+    params = {
+        'status': 'OPEN',
+        'severity': ','.join(severities),
+        'page_size': PAGE_SIZE,
+    }
 
     try:
-        conn.request("GET", "/api/v1/alarms", headers=headers)
-        response = conn.getresponse()
-        if response.status == 200:
-            data = response.read().decode('utf-8')
-            return json.loads(data)
-        else:
-            print(f"UNKNOWN: API request failed with status {response.status}")
-            sys.exit(3)
+        while True:
+            # No phase is open while the page is yielded, the consumer's phase continues
+            page = get_page(conn, "/api/v1/alarms?" + urllib.parse.urlencode(params), headers, timings)
+            results = page.get('results', [])
+            yield from results
+
+            cursor = page.get('cursor')
+            if not cursor or not results:
+                break
+            params['cursor'] = cursor
+
+        if totals is not None:
+            totals['all'] = get_page(conn, "/api/v1/alarms?page_size=1", headers, timings).get('result_count', 0)
     finally:
         conn.close()
 
@@ -53,26 +92,34 @@ def read_credentials_from_file(creds_file):
         print(f"UNKNOWN: Error reading credentials file: {e}")
         sys.exit(3)
 
-def process_alarms(alarms):
+def process_alarms(alarms, timings=None, totals=None):
     critical_alarms = []
     warning_alarms = []
-    ok_alarms = []
-
-    for alarm in alarms.get('results', []):
-        if alarm['status'] == 'OPEN':
-            if alarm['severity'] == 'CRITICAL':
-                critical_alarms.append(alarm)
-            elif alarm['severity'] in ['HIGH', 'MEDIUM']:
-                warning_alarms.append(alarm)
+    ok_alarms = 0
+    fetched = 0
+
+    # alarms is consumed as it arrives, page by page
+    with phase('output', timings):
+        for alarm in alarms:
+            fetched += 1
+            if alarm['status'] == 'OPEN':
+                if alarm['severity'] == 'CRITICAL':
+                    critical_alarms.append(alarm)
+                elif alarm['severity'] in ['HIGH', 'MEDIUM']:
+                    warning_alarms.append(alarm)
+                else:
+                    ok_alarms += 1
             else:
-                ok_alarms.append(alarm)
-        else:
-            ok_alarms.append(alarm)
+                ok_alarms += 1
 
-    # Debug prints
-    print(f"Critical Alarms: {len(critical_alarms)}")
+    # The alarms filtered out by the API count as OK alarms
+    if totals and 'all' in totals:
+        ok_alarms += max(0, totals['all'] - fetched)
+
+    # Debug prints, the first line carries the perfdata
+    print(f"Critical Alarms: {len(critical_alarms)}{perfdata_suffix(timings)}")
     print(f"Warning Alarms: {len(warning_alarms)}")
-    print(f"OK Alarms: {len(ok_alarms)}")
+    print(f"OK Alarms: {ok_alarms}")
 
     if critical_alarms:
         output_critical(critical_alarms, warning_alarms)
@@ -104,14 +151,19 @@ def output_ok():
     sys.exit(0)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: check_nsx_alarms.py <CREDENTIALS_FILE> <API_URL>")
+    # --timings may be given anywhere, the other arguments are positional
+    arguments = [argument for argument in sys.argv if argument != '--timings']
+    timings = Timings() if len(arguments) < len(sys.argv) else None
+
+    if len(arguments) != 3:
+        print("Usage: check_nsx_alarms.py <CREDENTIALS_FILE> <API_URL> [--timings]")
         sys.exit(3)
 
-    creds_file = sys.argv[1]
-    NSX_API_URL = sys.argv[2]
+    creds_file = arguments[1]
+    NSX_API_URL = arguments[2]
 
     username, password = read_credentials_from_file(creds_file)
 
-    alarms = fetch_alarms(NSX_API_URL, username, password)
-    process_alarms(alarms)
+    totals = {}
+    alarms = fetch_alarms(NSX_API_URL, username, password, timings=timings, totals=totals)
+    process_alarms(alarms, timings, totals)
@@ -4,16 +4,18 @@ Nagios check to monitor NSX-T backup status
 Florian Grehl - www.virten.net
 
 usage: check_nsxt_backup.py [-h] -n NSX_HOST [-t TCP_PORT] -u USER -p PASSWORD
-                            [-i] [-a MAX_AGE]
+                            [-i] [-a MAX_AGE] [--cache-dir CACHE_DIR]
+                            [--coalesce-wait SECONDS] [--timings]
 """
 
-import requests
-import urllib3
 import argparse
 import json
 from datetime import datetime
 from time import time
 import sys
+import os
+from plugin_cache import ResponseCache, default_cache_dir, private_dir
+from plugin_timings import Timings, phase, count, perfdata_suffix, instrument_session
 
 def getargs():
     arg_parser = argparse.ArgumentParser()
@@ -23,13 +25,39 @@ def getargs():
     arg_parser.add_argument('-p', '--password', type=str, required=True, help='Password')
     arg_parser.add_argument('-i', '--insecure', default=False, action='store_true', help='Ignore SSL errors')
     arg_parser.add_argument('-a', '--max_age', type=int, default=24, help='Backup maximum age (hours)')
+    arg_parser.add_argument('--cache-dir', type=str, default=default_cache_dir('check_nsxt_backup'), help='Directory for coalesced API responses')
+    arg_parser.add_argument('--coalesce-wait', type=float, default=0, metavar='SECONDS',
+                            help='Reuse the response of a concurrent check of the same NSX-T Manager, waiting at most SECONDS for it (0 = off)')
+    arg_parser.add_argument('--timings', default=False, action='store_true',
+                            help='Append the duration of every phase, the request count and the response bytes as perfdata')
     parser = arg_parser
     args = parser.parse_args()
     return args
 
+def get_backup_history(session, url, timings=None):
+    with phase('fetch', timings):
+        response = session.get(url)
+    count(len(response.content), timings)
+
+    if response.status_code != 200:
+        print('Could not connect to NSX-T' + perfdata_suffix(timings))
+        sys.exit(2)
+
+    with phase('decode', timings):
+        return response.json()  # Parse JSON response
+
 def main():
     args = getargs()
+
+    # Imported after the arguments are parsed, usage errors don't load the HTTP stack
+    import requests
+    import urllib3
+
     session = requests.session()
+    timings = None
+    if args.timings:
+        timings = Timings()
+        instrument_session(session)
 
     # Disable server certificate verification.
     if args.insecure:
@@ -37,57 +65,66 @@ def main():
         session.verify = False
 
     session.auth = (args.user, args.password)
-    response = session.get(f'https://{args.nsx_host}/api/v1/cluster/backups/history')
-
-    if response.status_code != 200:
-        print('Could not connect to NSX-T')
-        sys.exit(2)
+    url = f'https://{args.nsx_host}/api/v1/cluster/backups/history'
+
+    # Coalesced results are only trusted from a directory nobody else can write to
+    if args.coalesce_wait > 0 and private_dir(args.cache_dir):
+        # Concurrent checks of the same manager share one request
+        cache = ResponseCache(os.path.join(args.cache_dir, 'responses'), coalesce_wait=args.coalesce_wait)
+        with phase('cache', timings):
+            data, _ = cache.fetch(cache.key(url, '', args.user), lambda: get_backup_history(session, url, timings))
+    else:
+        data = get_backup_history(session, url, timings)
 
-    data = response.json()  # Parse JSON response
     now = int(time())  # Get the current time in seconds
     error = False
+    # Collected, so the first line can carry the perfdata
+    messages = []
 
     # Iterate over the backup data
-    for key, value in data.items():
-        if isinstance(value, list):  # Check if value is a list
-            first_item = value[0]  # Get the first item in the list
-            end_time = first_item.get('end_time', 0)  # Safely get 'end_time'
-            success = first_item.get('success', False)  # Safely get 'success'
-
-            # Calculate the age of the backup in hours
-            age_in_hours = (now - (end_time / 1000)) / 3600  # Convert from milliseconds to hours
-            if age_in_hours > args.max_age:
-                print(f'NSX-T {key.replace("_backup_statuses", "")} backup is too old ({int(age_in_hours)} hours)')
+    with phase('output', timings):
+        for key, value in data.items():
+            if isinstance(value, list):  # Check if value is a list
+                first_item = value[0]  # Get the first item in the list
+                end_time = first_item.get('end_time', 0)  # Safely get 'end_time'
+                success = first_item.get('success', False)  # Safely get 'success'
+
+                # Calculate the age of the backup in hours
+                age_in_hours = (now - (end_time / 1000)) / 3600  # Convert from milliseconds to hours
+                if age_in_hours > args.max_age:
+                    messages.append(f'NSX-T {key.replace("_backup_statuses", "")} backup is too old ({int(age_in_hours)} hours)')
+                    error = True
+
+                if not success:
+                    messages.append(f'NSX-T {key.replace("_backup_statuses", "")} backup failed')
+                    error = True
+
+            elif isinstance(value, dict):  # Check if value is a dictionary (e.g., `overall_backup_status`)
+                # Handle cases where the value is a dictionary
+                end_time = value.get('end_time', 0)  # Get 'end_time'
+
+                # Calculate the age of the backup in hours
+                age_in_hours = (now - (end_time / 1000)) / 3600  # Convert from milliseconds to hours
+                if age_in_hours > args.max_age:
+                    messages.append(f'NSX-T {key.replace("_backup_statuses", "")} backup is too old ({int(age_in_hours)} hours)')
+                    error = True
+
+            elif isinstance(value, str):  # Handle string data types (e.g., `overall_backup_status`)
+                # Ignore or log string data (e.g., `overall_backup_status`)
+                # No error message needed for this case; just skip or log if necessary
+                # You can add custom logging or handling here, but we're just skipping it.
+                pass
+
+            else:  # Handle the case where 'value' is neither a list, dictionary, nor string
+                messages.append(f"Unexpected data format for {key}: {type(value).__name__}. Expected a list or dictionary.")
                 error = True
 
-            if not success:
-                print(f'NSX-T {key.replace("_backup_statuses", "")} backup failed')
-                error = True
-
-        elif isinstance(value, dict):  # Check if value is a dictionary (e.g., `overall_backup_status`)
-            # Handle cases where the value is a dictionary
-            end_time = value.get('end_time', 0)  # Get 'end_time'
-
-            # Calculate the age of the backup in hours
-            age_in_hours = (now - (end_time / 1000)) / 3600  # Convert from milliseconds to hours
-            if age_in_hours > args.max_age:
-                print(f'NSX-T {key.replace("_backup_statuses", "")} backup is too old ({int(age_in_hours)} hours)')
-                error = True
-
-        elif isinstance(value, str):  # Handle string data types (e.g., `overall_backup_status`)
-            # Ignore or log string data (e.g., `overall_backup_status`)
-            # No error message needed for this case; just skip or log if necessary
-            # You can add custom logging or handling here, but we're just skipping it.
-            pass
-
-        else:  # Handle the case where 'value' is neither a list, dictionary, nor string
-            print(f"Unexpected data format for {key}: {type(value).__name__}. Expected a list or dictionary.")
-            error = True
-
     if error:
+        messages[0] += perfdata_suffix(timings)
+        print('\n'.join(messages))
         sys.exit(2)
     else:
-        print('OK')
+        print('OK' + perfdata_suffix(timings))
 
 if __name__ == "__main__":
     main()
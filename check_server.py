@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Prewarmed server for the active checks, used through check_client.py
+
+Starting a plugin costs the interpreter startup and the imports of requests, urllib3,
+ssl and friends on every check, which is most of the wall time of a check. This server
+imports all of that once and compiles the plugins, then listens on a Unix socket.
+
+check_client.py sends its arguments, environment and working directory together with
+its stdin, stdout and stderr file descriptors (SCM_RIGHTS). For every check the server
+forks a child that already has everything imported; the child runs the plugin with the
+client's file descriptors and argv, and sends back the exit code. Output and exit code
+are therefore exactly those of running the plugin directly, and a plugin that exits,
+hangs or crashes only affects its own child.
+
+The API tokens, sessions and response caches of the plugins are kept on disk by the
+plugins themselves (plugin_cache), so the children share them like separate processes do.
+
+Connections are not kept warm: every check opens its own TCP and TLS connections in its
+child, like a directly started plugin. The plugins rely on sys.argv, sys.exit, os.environ
+and their file descriptors, which is why they run in separate children instead of threads
+that could share pooled sessions. What the server saves is the interpreter startup and the
+imports. Checks that should reuse connections across polls belong in passive_collector.py.
+
+Usage: check_server.py [--socket <path>] [--timeout <seconds>] [--max_children <n>]
+"""
+
+import gc
+import os
+import sys
+import json
+import array
+import signal
+import socket
+import struct
+import logging
+import argparse
+import importlib
+import traceback
+import socketserver
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PLUGIN_DIR)
+
+from plugin_cache import default_cache_dir, private_dir # pylint: disable=wrong-import-position
+
+UNKNOWN = 3
+
+# Plugins the server runs, check_client.py asks for them by file name
+PLUGINS = (
+    'check_vmware_nsxt.py',
+    'check_nsx_alarms.py',
+    'check_nsxt_backup.py',
+    'nsx_backup_check.py',
+    'check_veeam_backup.py',
+    'check_veeam_backupjobs.py',
+    'check_veeam_backupjobs_v1.1.py',
+    'check_veeam_backupjobs_v1.2.py',
+    'check_veeam-EM-Repo-space.py',
+    'check_vcenter_backup.py',
+    'check_trend_connectivity.py',
+)
+
+# Imported once in the server, the children inherit them
+PRELOAD = (
+    'argparse', 'logging', 'json', 'ssl', 'http.client', 'urllib.parse', 'concurrent.futures',
+    'sqlite3', 'xml.etree.ElementTree', 'requests', 'requests.adapters', 'urllib3',
+    'plugin_cache', 'plugin_history', 'plugin_timings', 'veeam_rest', 'check_veeam_backupjobs',
+)
+
+# Request: 4 byte length of the JSON body, sent together with the client's stdin, stdout and stderr
+HEADER = struct.Struct('!I')
+# Response: the exit code of the plugin
+EXIT_CODE = struct.Struct('!i')
+MAX_REQUEST = 1024 * 1024
+
+
+def default_socket():
+    return os.path.join(default_cache_dir('check_server'), 'check_server.sock')
+
+
+def preload(logger):
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except Exception as exc: # pylint: disable=broad-except
+            # The plugin that needs it reports the error when it runs
+            logger.debug("could not preload %s: %s", name, exc)
+
+
+def compile_plugins(logger):
+    plugins = {}
+    for name in PLUGINS:
+        path = os.path.join(PLUGIN_DIR, name)
+        try:
+            with open(path, 'rb') as plugin_file:
+                plugins[name] = (path, compile(plugin_file.read(), path, 'exec'))
+        except (OSError, SyntaxError) as exc:
+            logger.warning("could not load plugin %s: %s", name, exc)
+    return plugins
+
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("client closed the connection")
+        data += chunk
+    return data
+
+
+def recv_request(sock):
+    """
+    Receive (request, file descriptors) from check_client.py
+    """
+    fds = array.array('i')
+    header, ancdata, _, _ = sock.recvmsg(HEADER.size, socket.CMSG_SPACE(3 * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+
+    if len(header) < HEADER.size:
+        header += recv_exactly(sock, HEADER.size - len(header))
+    size = HEADER.unpack(header)[0]
+    if size > MAX_REQUEST:
+        raise ValueError("request of %d bytes is too large" % size)
+    return json.loads(recv_exactly(sock, size).decode('utf-8')), list(fds)
+
+
+def exit_code(exc):
+    """
+    Exit code of a SystemExit, like the interpreter computes it
+    """
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+class CheckHandler(socketserver.BaseRequestHandler):
+    """
+    Runs one plugin in the forked child, with the client's file descriptors
+    """
+
+    def handle(self):
+        try:
+            request, fds = recv_request(self.request)
+        except (OSError, ValueError, EOFError) as exc:
+            self.server.logger.warning("invalid request: %s", exc)
+            return
+
+        try:
+            code = self.run(request, fds)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        try:
+            self.request.sendall(EXIT_CODE.pack(code))
+        except OSError:
+            # The client is gone, e.g. killed by the Nagios check timeout
+            pass
+
+    def run(self, request, fds):
+        plugin = self.server.plugins.get(request.get('plugin'))
+        if len(fds) != 3:
+            return UNKNOWN
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        if self.server.timeout_seconds:
+            # Default action of SIGALRM ends a plugin that hangs
+            signal.alarm(self.server.timeout_seconds)
+
+        # From here on stdout and stderr belong to the client, the server's log handlers must not write there
+        logging.root.handlers = []
+        logging.root.setLevel(logging.WARNING)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+
+        if plugin is None:
+            print("UNKNOWN: check_server.py does not run %s" % request.get('plugin'))
+            return UNKNOWN
+
+        path, code = plugin
+        try:
+            os.chdir(request.get('cwd') or '/')
+        except OSError:
+            os.chdir('/')
+        os.environ.clear()
+        os.environ.update(request.get('env') or {})
+        sys.argv = [path] + list(request.get('argv') or [])
+
+        try:
+            exec(code, {'__name__': '__main__', '__file__': path, '__package__': None, '__builtins__': __builtins__}) # pylint: disable=exec-used
+            result = 0
+        except SystemExit as exc:
+            result = exit_code(exc)
+        except BaseException: # pylint: disable=broad-except
+            traceback.print_exc()
+            result = 1
+
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except OSError:
+            pass
+        return result
+
+
+class CheckServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """
+    Forks a prewarmed child per check
+    """
+
+    def __init__(self, path, plugins, timeout_seconds, max_children, logger):
+        self.plugins = plugins
+        self.timeout_seconds = timeout_seconds
+        self.max_children = max_children
+        self.logger = logger
+        super().__init__(path, CheckHandler)
+
+
+def remove_stale_socket(path):
+    """
+    Remove the socket of a server that is not running anymore, False when one is still running
+    """
+    if not os.path.exists(path):
+        return True
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return False
+    except OSError:
+        os.unlink(path)
+        return True
+    finally:
+        probe.close()
+
+
+def commandline(args):
+    parser = argparse.ArgumentParser(description='Serve the active checks from a prewarmed process, see check_client.py')
+    parser.add_argument('--socket', '-s', default=default_socket(), help='Unix socket to listen on. Defaults to %(default)s')
+    parser.add_argument('--timeout', '-t', type=int, default=60, help='Seconds after which a check is killed, 0 for no limit. Defaults to 60')
+    parser.add_argument('--max_children', type=int, default=40, help='Checks running at the same time. Defaults to 40')
+    parser.add_argument('--debug', action='store_true', help='Log every check')
+    return parser.parse_args(args)
+
+
+def main(args):
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logger = logging.getLogger()
+
+    socket_dir = os.path.dirname(os.path.abspath(args.socket))
+    if not private_dir(socket_dir):
+        logger.error("%s is accessible by other users, not creating the socket there", socket_dir)
+        return 1
+    if not remove_stale_socket(args.socket):
+        logger.error("a server is already listening on %s", args.socket)
+        return 1
+
+    preload(logger)
+    plugins = compile_plugins(logger)
+    if hasattr(gc, 'freeze'):
+        # Keeps the preloaded objects out of the collections in the children, so their pages stay shared
+        gc.freeze()
+
+    server = CheckServer(args.socket, plugins, args.timeout, args.max_children, logger)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info("serving %d plugins on %s", len(plugins), args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(commandline(sys.argv[1:])))
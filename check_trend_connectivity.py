@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+#Python version of check_trend_connectivity.sh with a batch inventory mode
+# ./check_trend_connectivity.py <API KEY FILE> <ENDPOINT NAME> [--timings]
+#### Batch usage, the endpoint list is downloaded once per interval into a local snapshot ####
+# ./check_trend_connectivity.py <API KEY FILE> <ENDPOINT NAME> --snapshot_age 300 [--max_last_connected <hours>]
+# ./check_trend_connectivity.py <API KEY FILE> --all_endpoints --snapshot_age 300 [--passive_host <host>]
+import urllib.parse
+import sys
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime, timedelta, timezone
+from plugin_cache import private_dir, file_lock, default_cache_dir
+from plugin_timings import Timings, phase, count, perfdata_suffix, connection_class
+
+# Nagios return codes
+OK = 0
+WARNING = 1
+CRITICAL = 2
+UNKNOWN = 3
+
+API_URL = 'https://api.au.xdr.trendmicro.com/v3.0/endpointSecurity/endpoints'
+SELECT = 'endpointName,edrSensorConnectivity,eppAgentLastConnectedDateTime'
+# Largest page size the endpoints list accepts
+PAGE_SIZE = 1000
+
+class TrendError(Exception):
+    """
+    Raised when the Vision One API can not be reached or returns an error
+    """
+
+class TrendClient:
+    """
+    Vision One API client, all requests of a run share one keep-alive connection
+    """
+
+    def __init__(self, api_url, api_key, timeout=30, timings=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.timings = timings
+        self.conn = None
+        self.host = None
+
+    def get(self, url, headers=None):
+        # Imported here, so usage errors and snapshot lookups don't load the HTTP and TLS modules
+        import http.client
+
+        parsed = urllib.parse.urlsplit(url)
+        if self.conn is None or self.host != parsed.netloc:
+            self.close()
+            self.host = parsed.netloc
+            conn_class = http.client.HTTPSConnection if self.timings is None else connection_class()
+            self.conn = conn_class(parsed.netloc, timeout=self.timeout)
+
+        path = parsed.path + ('?' + parsed.query if parsed.query else '')
+        headers = dict(headers or {}, Authorization=f'Bearer {self.api_key}', Accept='application/json')
+        try:
+            with phase('fetch', self.timings):
+                self.conn.request('GET', path, headers=headers)
+                response = self.conn.getresponse()
+                body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            raise TrendError(f'Request failed: {e}') from e
+        count(len(body), self.timings)
+
+        if response.status != 200:
+            raise TrendError(f'Request failed: {response.status} {response.reason}')
+        try:
+            with phase('decode', self.timings):
+                return json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise TrendError(f'Invalid response: {e}') from e
+
+    def endpoint(self, endpoint_name):
+        """
+        Look up one endpoint with a TMV1-Filter, like check_trend_connectivity.sh
+        """
+        query = urllib.parse.urlencode({'select': SELECT})
+        data = self.get(f'{self.api_url}?{query}', {'TMV1-Filter': f'endpointName eq "{endpoint_name}"'})
+        items = data.get('items') or []
+        return endpoint_record(items[0]) if items else None
+
+    def endpoints(self):
+        """
+        Generator over all endpoints, following nextLink page by page
+        """
+        url = f"{self.api_url}?{urllib.parse.urlencode({'select': SELECT, 'top': PAGE_SIZE})}"
+        while url:
+            data = self.get(url)
+            for item in data.get('items') or []:
+                yield endpoint_record(item)
+            url = data.get('nextLink')
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+def endpoint_record(item):
+    return (item.get('endpointName'),
+            (item.get('edrSensor') or {}).get('connectivity'),
+            (item.get('eppAgent') or {}).get('lastConnectedDateTime'))
+
+def snapshot_file(cache_dir, api_url, api_key):
+    if cache_dir is None or not private_dir(cache_dir):
+        return None
+    # Snapshots of different API keys (tenants) are kept apart
+    key = hashlib.sha256(f"{api_url}\0{api_key}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f'trend-endpoints-{key}.sqlite')
+
+def open_snapshot(path):
+    # Read only, a missing snapshot is an error instead of a new empty database
+    return sqlite3.connect(f'file:{urllib.parse.quote(path)}?mode=ro', uri=True)
+
+def snapshot_created(path):
+    try:
+        db = open_snapshot(path)
+    except sqlite3.Error:
+        return None
+    try:
+        return float(db.execute("SELECT value FROM meta WHERE key = 'created'").fetchone()[0])
+    except (sqlite3.Error, TypeError):
+        return None
+    finally:
+        db.close()
+
+def build_snapshot(client, path):
+    """
+    Download all endpoints into a new snapshot file and move it into place
+    """
+    created = time.time()
+    records = {}
+    for name, connectivity, last_connected in client.endpoints():
+        # Names are not unique, the most recently connected endpoint wins
+        if name is not None and (name not in records or (last_connected or '') > (records[name][2] or '')):
+            records[name] = (name, connectivity, last_connected)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        db = sqlite3.connect(tmp_path)
+        with db:
+            db.execute('CREATE TABLE endpoints (name TEXT PRIMARY KEY, connectivity TEXT, last_connected TEXT) WITHOUT ROWID')
+            db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            db.executemany('INSERT INTO endpoints VALUES (?, ?, ?)', records.values())
+            db.execute("INSERT INTO meta VALUES ('created', ?)", (repr(created),))
+        db.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return created
+
+def refresh_snapshot(client, path, max_age):
+    """
+    Make sure a snapshot no older than max_age exists, rebuilding it when needed
+
+    A stale snapshot is rebuilt by one process only, the others keep using the stale
+    snapshot while that happens instead of waiting for it.
+    """
+    created = snapshot_created(path)
+    if created is not None and time.time() - created < max_age:
+        return
+
+    started = time.time()
+    wait = 60 if created is None else 0
+    with file_lock(path + '.lock', wait) as locked:
+        if not locked:
+            return
+        current = snapshot_created(path)
+        if current is not None and current >= started:
+            # Rebuilt by another process while we waited for the lock
+            return
+        build_snapshot(client, path)
+
+def snapshot_lookup(path, endpoint_name):
+    db = open_snapshot(path)
+    try:
+        return db.execute('SELECT name, connectivity, last_connected FROM endpoints WHERE name = ?', (endpoint_name,)).fetchone()
+    finally:
+        db.close()
+
+def snapshot_all(path):
+    db = open_snapshot(path)
+    try:
+        return db.execute('SELECT name, connectivity, last_connected FROM endpoints ORDER BY name').fetchall()
+    finally:
+        db.close()
+
+def last_connected_cutoff(max_last_connected):
+    if max_last_connected is None:
+        return None
+    # lastConnectedDateTime is ISO 8601 in UTC, comparing the fixed-width prefix avoids parsing every endpoint
+    return (datetime.now(timezone.utc) - timedelta(hours=max_last_connected)).strftime('%Y-%m-%dT%H:%M:%S')
+
+def evaluate_endpoint(endpoint_name, record, cutoff=None):
+    """
+    Return (state, message) for one endpoint record
+    """
+    if record is None:
+        return UNKNOWN, f"Error: Unable to retrieve connectivity status of {endpoint_name}"
+    _, connectivity, last_connected = record
+    if connectivity != 'connected':
+        return CRITICAL, f"Trend Vision One Endpoint {endpoint_name} is disconnected."
+    if cutoff is not None and (last_connected or '')[:19] < cutoff:
+        return WARNING, f"Trend Vision One Endpoint {endpoint_name} is connected, but the agent last connected at {last_connected}."
+    return OK, f"Trend Vision One Endpoint {endpoint_name} is connected."
+
+def submit_passive(command_file, host, service_template, results):
+    """
+    Write one PROCESS_SERVICE_CHECK_RESULT per endpoint to the Nagios external command file
+    """
+    now = int(time.time())
+    with open(command_file, 'a') as f:
+        f.write(''.join(f"[{now}] PROCESS_SERVICE_CHECK_RESULT;{host};{service_template.format(endpoint=name)};{state};{message}\n"
+                        for name, state, message in results))
+
+def report_all(args, records, cutoff, timings=None):
+    with phase('output', timings):
+        results = [(record[0],) + evaluate_endpoint(record[0], record, cutoff) for record in records]
+        if args.passive_host:
+            submit_passive(args.command_file, args.passive_host, args.service_template, results)
+
+        counts = {}
+        for _, state, _ in results:
+            counts[state] = counts.get(state, 0) + 1
+        state = max(counts) if counts else UNKNOWN
+        label = {OK: 'OK', WARNING: 'WARNING', CRITICAL: 'CRITICAL', UNKNOWN: 'UNKNOWN'}[state]
+    print(f"{label}: {counts.get(CRITICAL, 0)} disconnected, {counts.get(WARNING, 0)} stale, "
+          f"{counts.get(OK, 0)} connected of {len(results)} endpoints{perfdata_suffix(timings)}")
+    for _, endpoint_state, message in results:
+        if endpoint_state != OK:
+            print(message)
+    sys.exit(state)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the connectivity of Trend Vision One endpoints')
+    parser.add_argument('api_key_file', help='File with the Vision One API key')
+    parser.add_argument('endpoint_name', nargs='?', help='Name of the endpoint')
+    parser.add_argument('--api_url', default=API_URL, help=f'Endpoints API URL. Defaults to {API_URL}')
+    parser.add_argument('--snapshot_age', type=int, default=None,
+                        help='Answer from a local snapshot of all endpoints, downloaded again when older than this many seconds')
+    parser.add_argument('--all_endpoints', action='store_true', help='Check every endpoint of the snapshot')
+    parser.add_argument('--max_last_connected', type=float, default=None,
+                        help='Warning when the agent of a connected endpoint last connected more than this many hours ago')
+    parser.add_argument('--passive_host', help='With --all_endpoints, submit a passive result per endpoint for this host')
+    parser.add_argument('--command_file', default='/usr/local/nagios/var/rw/nagios.cmd', help='Nagios external command file')
+    parser.add_argument('--service_template', default='{endpoint}', help='Service name of the passive results. Defaults to {endpoint}')
+    parser.add_argument('--cache_dir', default=default_cache_dir('check_trend'), help='Directory for the endpoint snapshot')
+    parser.add_argument('--timings', action='store_true',
+                        help='Append the duration of every phase, the request count and the response bytes as perfdata')
+    try:
+        args = parser.parse_args()
+    except SystemExit as e:
+        sys.exit(UNKNOWN if e.code else OK)
+
+    if args.endpoint_name is None and not args.all_endpoints:
+        print(f"Usage: {sys.argv[0]} <API_KEY_FILE> <ENDPOINT_NAME>")
+        sys.exit(UNKNOWN)
+
+    try:
+        with open(args.api_key_file, 'r') as f:
+            api_key = f.read().strip()
+    except OSError as e:
+        print(f"Error: Unable to read API key file: {e}")
+        sys.exit(UNKNOWN)
+
+    timings = Timings() if args.timings else None
+    client = TrendClient(args.api_url, api_key, timings=timings)
+    cutoff = last_connected_cutoff(args.max_last_connected)
+    try:
+        if args.snapshot_age is None and not args.all_endpoints:
+            with phase('output', timings):
+                state, message = evaluate_endpoint(args.endpoint_name, client.endpoint(args.endpoint_name), cutoff)
+            print(message + perfdata_suffix(timings))
+            sys.exit(state)
+
+        path = snapshot_file(args.cache_dir, args.api_url, api_key)
+        if path is None:
+            print(f"Error: Cache directory {args.cache_dir} is not usable for the endpoint snapshot")
+            sys.exit(UNKNOWN)
+        # The snapshot download is timed as fetch and decode within the cache phase
+        with phase('cache', timings):
+            refresh_snapshot(client, path, args.snapshot_age if args.snapshot_age is not None else 300)
+    except TrendError as e:
+        print(f"Error: Unable to retrieve connectivity status: {e}")
+        sys.exit(UNKNOWN)
+    finally:
+        client.close()
+
+    try:
+        if args.all_endpoints:
+            with phase('cache', timings):
+                records = snapshot_all(path)
+            report_all(args, records, cutoff, timings)
+        with phase('cache', timings):
+            record = snapshot_lookup(path, args.endpoint_name)
+        with phase('output', timings):
+            state, message = evaluate_endpoint(args.endpoint_name, record, cutoff)
+    except sqlite3.Error as e:
+        print(f"Error: Unable to read the endpoint snapshot: {e}")
+        sys.exit(UNKNOWN)
+    print(message + perfdata_suffix(timings))
+    sys.exit(state)
+
+if __name__ == '__main__':
+    main()
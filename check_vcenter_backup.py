@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+#Python version of check_vcenter_backup.sh, same options and output
+#The backup job details are parsed in one pass and the vCenter API session is reused between runs
+# ./check_vcenter_backup.py -s <vcenter server> -p 5480 -u <username> -P <password> [--history <jobs>] [--history_hours <hours>] [--timings]
+import sys
+import os
+import json
+import time
+import base64
+import hashlib
+import argparse
+from datetime import datetime, timedelta, timezone
+from plugin_cache import private_dir, write_atomic, default_cache_dir
+from plugin_timings import Timings, CountingReader, phase, count, perfdata_suffix, connection_class
+
+# Nagios return codes
+OK = 0
+WARNING = 1
+CRITICAL = 2
+UNKNOWN = 3
+
+SESSION_PATH = '/rest/com/vmware/cis/session'
+DETAILS_PATH = '/rest/appliance/recovery/backup/job/details'
+
+class SessionExpired(Exception):
+    """
+    Raised when vCenter rejects a (cached) API session
+    """
+
+def connect(server, port, timings=None):
+    # Imported here, so usage errors don't load the HTTP and TLS modules
+    import http.client
+    import ssl
+
+    context = ssl._create_unverified_context()  # Disable SSL verification like curl -k
+    # One keep-alive connection is used for the whole exchange
+    conn_class = http.client.HTTPSConnection if timings is None else connection_class()
+    return conn_class(server, port, context=context, timeout=30)
+
+def get_session(conn, username, password, timings=None):
+    import http.client
+    auth = base64.b64encode(f"{username}:{password}".encode('utf-8')).decode('utf-8')
+    try:
+        with phase('auth', timings):
+            conn.request("POST", SESSION_PATH, headers={'Authorization': f'Basic {auth}'})
+            response = conn.getresponse()
+            body = response.read().decode('utf-8', 'replace')
+        count(len(body), timings)
+        if response.status != 200:
+            print(f"CRITICAL: Failed to fetch backup details. Login failed: {response.status} {response.reason}")
+            sys.exit(CRITICAL)
+        return json.loads(body)['value']
+    except (OSError, http.client.HTTPException, ValueError, KeyError) as e:
+        print(f"CRITICAL: Failed to fetch backup details. Login failed: {e}")
+        sys.exit(CRITICAL)
+
+def logout(conn, session_id, timings=None):
+    # Sessions that are not cached are deleted, so they don't pile up on the vCenter
+    try:
+        with phase('auth', timings):
+            conn.request("DELETE", SESSION_PATH, headers={'vmware-api-session-id': session_id})
+            count(len(conn.getresponse().read()), timings)
+    except Exception:
+        pass
+
+def session_cache_file(cache_dir, server, port, username):
+    if cache_dir is None or not private_dir(cache_dir):
+        return None
+    key = hashlib.sha256(f"{server}:{port}\0{username}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"vcsession-{key}.json")
+
+def load_session(cache_file):
+    try:
+        with open(cache_file, 'r') as file:
+            cached = json.load(file)
+        if cached['expires_at'] > time.time():
+            return cached['session_id']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def save_session(cache_file, session_id, ttl):
+    # vCenter sessions expire after being idle, so every use extends the cached lifetime
+    try:
+        write_atomic(cache_file, json.dumps({'session_id': session_id, 'expires_at': time.time() + ttl}))
+        return True
+    except OSError:
+        return False
+
+def get_backup_details(conn, session_id, timings=None):
+    import http.client
+    try:
+        with phase('fetch', timings):
+            conn.request("GET", DETAILS_PATH, headers={'Accept': 'application/json', 'vmware-api-session-id': session_id})
+            response = conn.getresponse()
+        # The body is counted while it is decoded
+        count(0, timings)
+        if response.status == 401:
+            response.read()
+            raise SessionExpired()
+        if response.status != 200:
+            response.read()
+            print(f"CRITICAL: Failed to fetch backup details. {response.status} {response.reason}")
+            sys.exit(CRITICAL)
+        # Decoded straight from the response, the body is not kept as a string as well,
+        # so the decode phase includes its download
+        with phase('decode', timings):
+            return json.load(response if timings is None else CountingReader(response, timings))
+    except SessionExpired:
+        raise
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        print(f"CRITICAL: Failed to fetch backup details. {e}")
+        sys.exit(CRITICAL)
+
+def fetch_backup_details(server, port, username, password, cache_dir=None, session_ttl=600, timings=None):
+    cache_file = session_cache_file(cache_dir, server, port, username)
+    conn = connect(server, port, timings)
+    session_id = None
+    keep = False
+
+    try:
+        if cache_file:
+            session_id = load_session(cache_file)
+        cached = session_id is not None
+        if not cached:
+            session_id = get_session(conn, username, password, timings)
+
+        try:
+            details = get_backup_details(conn, session_id, timings)
+        except SessionExpired:
+            if not cached:
+                print("CRITICAL: Failed to fetch backup details. Session was rejected")
+                sys.exit(CRITICAL)
+            # The cached session has expired on the vCenter
+            session_id = get_session(conn, username, password, timings)
+            details = get_backup_details(conn, session_id, timings)
+
+        keep = cache_file is not None and save_session(cache_file, session_id, session_ttl)
+        return details
+    except SessionExpired:
+        print("CRITICAL: Failed to fetch backup details. Session was rejected")
+        sys.exit(CRITICAL)
+    finally:
+        if session_id and not keep:
+            logout(conn, session_id, timings)
+        conn.close()
+
+def count_backups(jobs, history=None, history_hours=None):
+    """
+    Count (successful, failed) backups in one pass, limited to the first history jobs
+    and to jobs started within history_hours
+    """
+    cutoff = None
+    if history_hours is not None:
+        # start_time is ISO 8601 in UTC, comparing the fixed-width prefix avoids parsing every job
+        cutoff = (datetime.now(timezone.utc) - timedelta(hours=history_hours)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    successful_backups = 0
+    failed_backups = 0
+    for index, job in enumerate(jobs):
+        if history is not None and index >= history:
+            break
+        details = job.get('value') or {}
+        if cutoff is not None and (details.get('start_time') or '')[:19] < cutoff:
+            continue
+        if details.get('status') == 'SUCCEEDED':
+            successful_backups += 1
+        else:
+            failed_backups += 1
+
+    return successful_backups, failed_backups
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the backup jobs of a vCenter Server Appliance')
+    parser.add_argument('-s', '--server', default='vcenter.example.com', help='vCenter server')
+    parser.add_argument('-p', '--port', type=int, default=5480, help='Appliance management port. Defaults to 5480')
+    parser.add_argument('-u', '--username', default='your_username', help='Username')
+    parser.add_argument('-P', '--password', default='your_password', help='Password')
+    parser.add_argument('--history', type=int, default=None, help='Only evaluate the newest HISTORY backup jobs')
+    parser.add_argument('--history_hours', type=float, default=None, help='Only evaluate backup jobs started within this many hours')
+    parser.add_argument('--cache_dir', default=default_cache_dir('check_vcenter_backup'), help='Directory for the cached API session')
+    parser.add_argument('--session_ttl', type=int, default=600,
+                        help='Seconds a session is reused after its last use, keep below the vCenter session timeout. Defaults to 600')
+    parser.add_argument('--no_session_cache', action='store_true', help='Log in and out on every run')
+    parser.add_argument('--timings', action='store_true',
+                        help='Append the duration of every phase, the request count and the response bytes as perfdata')
+    # Usage errors exit 2, like the getopts usage of check_vcenter_backup.sh
+    args = parser.parse_args()
+    timings = Timings() if args.timings else None
+
+    details = fetch_backup_details(args.server, args.port, args.username, args.password,
+                                   None if args.no_session_cache else args.cache_dir, args.session_ttl, timings)
+
+    jobs = details.get('value') if isinstance(details, dict) else None
+    if not isinstance(jobs, list):
+        print("CRITICAL: Failed to fetch backup details.")
+        sys.exit(CRITICAL)
+
+    with phase('output', timings):
+        last_backup = (jobs[0].get('value') or {}) if jobs else {}
+        successful_backups, failed_backups = count_backups(jobs, args.history, args.history_hours)
+
+    # Missing values print as null, like jq -r does, the first line carries the perfdata
+    print(f"Last backup timestamp: {last_backup.get('start_time') or 'null'}{perfdata_suffix(timings)}")
+    print(f"Backup location: {last_backup.get('location') or 'null'}")
+
+    if failed_backups == 0:
+        print(f"OK: All {successful_backups} backups were successful.")
+        sys.exit(OK)
+    else:
+        print(f"WARNING: {successful_backups} successful backups, {failed_backups} failed backups.")
+        sys.exit(WARNING)
+
+if __name__ == '__main__':
+    main()
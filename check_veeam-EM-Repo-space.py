@@ -3,12 +3,21 @@
 #<Password>
 #python3 check_veeam-EM-Repo-space.py https://<veeam-enterprise-manager-server>:9398 <veeam Credentials file location> '<Repo name' 80 90
 #80 = Warning; 90 = Critical - Obviously change this as needed
-import http.client
-import ssl
+#All repositories in one run, the name is a regular expression then, thresholds can be set per repository:
+#python3 check_veeam-EM-Repo-space.py https://<server>:9398 <credentials file> '.*' 80 90 --all_repositories --repo_threshold '<Repo name>=85:95'
+#Add --forecast to record the used space on every run and alert on the forecast days until a repository is full
 import sys
+import re
+import os
 import json
+import time
+import hashlib
+import argparse
 from xml.etree import ElementTree as ET
 import base64
+from plugin_cache import private_dir, write_atomic, default_cache_dir
+from plugin_history import RingHistory, linear_fit
+from plugin_timings import Timings, CountingReader, phase, count, perfdata_suffix, connection_class
 
 # Nagios return codes
 OK = 0
@@ -30,12 +39,24 @@ def read_credentials(file_path):
         print(f"UNKNOWN: Failed to read password file '{file_path}': {e}")
         sys.exit(UNKNOWN)
 
-def get_session(url, username, password):
+class SessionExpired(Exception):
+    """
+    Raised when the Enterprise Manager rejects a (cached) session
+    """
+
+def connect(url, timings=None):
+    # Imported here, so usage errors don't load the HTTP and TLS modules
+    import http.client
+    import ssl
+
     host, port = url.split('//')[1].split(':')
     port = int(port)
     context = ssl._create_unverified_context()  # Disable SSL verification
-    conn = http.client.HTTPSConnection(host, port, context=context)
+    # One keep-alive connection is used for the whole exchange
+    conn_class = http.client.HTTPSConnection if timings is None else connection_class()
+    return conn_class(host, port, context=context, timeout=30)
 
+def get_session(conn, username, password, timings=None):
     auth_string = f"{username}:{password}"
     auth_bytes = auth_string.encode('utf-8')
     auth_base64 = base64.b64encode(auth_bytes).decode('utf-8')
@@ -45,9 +66,11 @@ def get_session(url, username, password):
     }
 
     try:
-        conn.request("POST", "/api/sessionMngr/?v=latest", headers=headers)
-        response = conn.getresponse()
-        response_body = response.read().decode('utf-8')
+        with phase('auth', timings):
+            conn.request("POST", "/api/sessionMngr/?v=latest", headers=headers)
+            response = conn.getresponse()
+            response_body = response.read().decode('utf-8')
+        count(len(response_body), timings)
 #        print(f"DEBUG: Authentication response status: {response.status}")
 #        print(f"DEBUG: Authentication response headers: {response.getheaders()}")
 #        print(f"DEBUG: Authentication response body: {response_body}")
@@ -70,114 +93,426 @@ def get_session(url, username, password):
     except Exception as e:
         print(f"CRITICAL: Failed to authenticate with Veeam API: {e}")
         sys.exit(CRITICAL)
-    finally:
-        conn.close()
 
-def get_repository_space(url, session_id):
-    host, port = url.split('//')[1].split(':')
-    port = int(port)
-    context = ssl._create_unverified_context()  # Disable SSL verification
-    conn = http.client.HTTPSConnection(host, port, context=context)
+def logout(conn, session_id, timings=None):
+    # Sessions that are not cached are deleted, so they don't pile up on the Enterprise Manager
+    try:
+        with phase('auth', timings):
+            conn.request("DELETE", f"/api/logonSessions/{session_id}", headers={'X-RestSvcSessionId': session_id})
+            count(len(conn.getresponse().read()), timings)
+    except Exception:
+        pass
+
+def session_cache_file(cache_dir, url, username):
+    if cache_dir is None or not private_dir(cache_dir):
+        return None
+    key = hashlib.sha256(f"{url}\0{username}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"emsession-{key}.json")
+
+def load_session(cache_file):
+    try:
+        with open(cache_file, 'r') as file:
+            cached = json.load(file)
+        if cached['expires_at'] > time.time():
+            return cached['session_id']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def save_session(cache_file, session_id, ttl):
+    # EM sessions expire after being idle, so every use extends the cached lifetime
+    try:
+        write_atomic(cache_file, json.dumps({'session_id': session_id, 'expires_at': time.time() + ttl}))
+        return True
+    except OSError:
+        return False
+
+REPORT_TYPES = {
+    'json': 'application/json',
+    'xml': 'application/xml',
+}
+
+NAMESPACE = '{http://www.veeam.com/ent/v1.0}'
 
+def get_repository_space(conn, session_id, report_format='json', timings=None):
+    """
+    Request the repository report and return (format, response) with the body still unread
+    """
     headers = {
-        'Content-Type': 'application/json',
+        'Accept': REPORT_TYPES[report_format],
         'X-RestSvcSessionId': session_id
     }
 
     try:
-        conn.request("GET", "/api/reports/summary/repository", headers=headers)
-        response = conn.getresponse()
-        response_body = response.read().decode('utf-8')
-#        print(f"DEBUG: Repository space response status: {response.status}")
-#        print(f"DEBUG: Repository space response headers: {response.getheaders()}")
-#        print(f"DEBUG: Repository space response body: {response_body}")
+        with phase('fetch', timings):
+            conn.request("GET", "/api/reports/summary/repository", headers=headers)
+            response = conn.getresponse()
+        # The body is counted while it is parsed
+        count(0, timings)
 
+        if response.status == 401:
+            response.read()
+            raise SessionExpired()
         if response.status != 200:
+            response_body = response.read().decode('utf-8', 'replace')
             print(f"CRITICAL: Failed to retrieve repository space: {response.status} {response.reason}. Response: {response_body}")
             sys.exit(CRITICAL)
-        return response_body
+        return report_type(response), response
+    except SessionExpired:
+        raise
     except Exception as e:
         print(f"CRITICAL: Failed to retrieve repository space: {e}")
         sys.exit(CRITICAL)
+
+def report_type(response):
+    # The Content-Type decides the parser, the EM may answer XML regardless of the Accept header
+    content_type = (response.getheader('Content-Type') or '').lower()
+    if 'json' in content_type:
+        return 'json'
+    if 'xml' in content_type:
+        return 'xml'
+    # No usable Content-Type, look at the first byte instead of trying both parsers
+    return 'xml' if response.peek(1)[:1] == b'<' else 'json'
+
+def drain(response):
+    try:
+        while response.read(65536):
+            pass
+    except Exception:
+        pass
+
+def fetch_repository_report(url, username, password, handle, cache_dir=None, session_ttl=600, report_format='json', timings=None,
+                            conn=None):
+    """
+    Download the repository report and return handle(repositories)
+
+    handle gets an iterator over the repositories that is parsed while the report is
+    downloaded, it must be consumed before handle returns. With timings, the download of
+    the body is part of the decode phase for that reason.
+
+    A connection from connect() can be passed to keep it open for further reports,
+    otherwise one is opened and closed.
+    """
+    cache_file = session_cache_file(cache_dir, url, username)
+    own = conn is None
+    if own:
+        conn = connect(url, timings)
+    session_id = None
+    response = None
+    keep = False
+
+    try:
+        if cache_file:
+            session_id = load_session(cache_file)
+        cached = session_id is not None
+        if not cached:
+            session_id = get_session(conn, username, password, timings)
+
+        try:
+            data_format, response = get_repository_space(conn, session_id, report_format, timings)
+        except SessionExpired:
+            if not cached:
+                print("CRITICAL: Failed to retrieve repository space: session was rejected")
+                sys.exit(CRITICAL)
+            # The cached session has expired on the server
+            session_id = get_session(conn, username, password, timings)
+            data_format, response = get_repository_space(conn, session_id, report_format, timings)
+
+        # The session works, it is kept even when handle exits early, e.g. for an unknown repository
+        keep = cache_file is not None and save_session(cache_file, session_id, session_ttl)
+        with phase('decode', timings):
+            return handle(parse_repositories(response if timings is None else CountingReader(response, timings), data_format))
+    except SessionExpired:
+        print("CRITICAL: Failed to retrieve repository space: session was rejected")
+        sys.exit(CRITICAL)
     finally:
-        conn.close()
+        if response is not None and (not own or (session_id and not keep)):
+            # handle may stop early, the rest of the body has to go before the connection is used again
+            drain(response)
+        if session_id and not keep:
+            logout(conn, session_id, timings)
+            if cache_file:
+                # The logged out session may be the cached one
+                try:
+                    os.unlink(cache_file)
+                except OSError:
+                    pass
+        if own:
+            conn.close()
 
 def bytes_to_gb(bytes_value):
     return bytes_value / (1024 ** 3)
 
-def parse_repository_space(data, repository_name):
+def repository_usage(name, capacity, free_space):
+    used_space = capacity - free_space
+    used_percentage = (used_space / capacity) * 100 if capacity else 0.0
+    return name, capacity, free_space, used_space, used_percentage
+
+def parse_json_repositories(stream):
+    json_data = json.load(stream)
+    for period in json_data.get('Periods', []):
+        yield repository_usage(period.get('Name'), period.get('Capacity'), period.get('FreeSpace'))
+
+def parse_xml_repositories(stream):
+    # Parsed incrementally, finished Period elements are cleared so memory stays flat for large reports
+    root = None
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if root is None:
+            root = element
+        elif event == 'end' and element.tag == NAMESPACE + 'Period':
+            yield repository_usage(element.findtext(NAMESPACE + 'Name'),
+                                   int(element.findtext(NAMESPACE + 'Capacity')),
+                                   int(element.findtext(NAMESPACE + 'FreeSpace')))
+            element.clear()
+            root.clear()
+
+def parse_repositories(stream, data_format):
+    """
+    Iterate over the usage of every repository in a report stream
+    """
     try:
-        # Try to parse as JSON first
-        json_data = json.loads(data)
-        # Check if the JSON data contains the expected structure
-        if 'Periods' in json_data:
-            for period in json_data['Periods']:
-                name = period.get('Name')
-                if name == repository_name:
-                    capacity = period.get('Capacity')
-                    free_space = period.get('FreeSpace')
-                    used_space = capacity - free_space
-                    used_percentage = (used_space / capacity) * 100
-                    return name, capacity, free_space, used_space, used_percentage
-        print(f"UNKNOWN: Repository '{repository_name}' not found in JSON response.")
-        sys.exit(UNKNOWN)
-    except json.JSONDecodeError:
-        # If JSON parsing fails, try to parse as XML
+        if data_format == 'xml':
+            yield from parse_xml_repositories(stream)
+        else:
+            yield from parse_json_repositories(stream)
+    except ET.ParseError as e:
+        print(f"CRITICAL: Failed to parse XML data: {e}")
+        sys.exit(CRITICAL)
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"CRITICAL: Failed to parse {data_format.upper()} data: {e}")
+        sys.exit(CRITICAL)
+
+def parse_repository_space(repositories, repository_name):
+    for repository in repositories:
+        if repository[0] == repository_name:
+            return repository
+    print(f"UNKNOWN: Repository '{repository_name}' not found in response.")
+    sys.exit(UNKNOWN)
+
+def parse_thresholds(values):
+    """
+    Parse '<repository>=<warning>:<critical>' options into {repository: (warning, critical)}
+    """
+    thresholds = {}
+    for value in values or []:
         try:
-            root = ET.fromstring(data)
-            namespace = {'ns': 'http://www.veeam.com/ent/v1.0'}
-
-            for period in root.findall('ns:Period', namespace):
-                name = period.find('ns:Name', namespace).text
-                if name == repository_name:
-                    capacity = int(period.find('ns:Capacity', namespace).text)
-                    free_space = int(period.find('ns:FreeSpace', namespace).text)
-                    used_space = capacity - free_space
-                    used_percentage = (used_space / capacity) * 100
-                    return name, capacity, free_space, used_space, used_percentage
-
-            print(f"UNKNOWN: Repository '{repository_name}' not found in XML response.")
+            name, levels = value.rsplit('=', 1)
+            warning, critical = levels.split(':')
+            thresholds[name] = (float(warning), float(critical))
+        except ValueError:
+            print(f"UNKNOWN: Invalid repository threshold '{value}', expected <repository>=<warning>:<critical>")
             sys.exit(UNKNOWN)
-        except ET.ParseError as e:
-            print(f"CRITICAL: Failed to parse XML data: {e}")
- #           print(f"DEBUG: XML data: {data}")
-            sys.exit(CRITICAL)
+    return thresholds
+
+def repository_state(used_percentage, warning_threshold, critical_threshold):
+    if used_percentage >= critical_threshold:
+        return CRITICAL
+    if used_percentage >= warning_threshold:
+        return WARNING
+    return OK
+
+def submit_passive(command_file, host, service_template, results):
+    """
+    Write one PROCESS_SERVICE_CHECK_RESULT per repository to the Nagios external command file
+    """
+    now = int(time.time())
+    with open(command_file, 'a') as f:
+        f.write(''.join(f"[{now}] PROCESS_SERVICE_CHECK_RESULT;{host};{service_template.format(repository=name)};{state};{message}\n"
+                        for name, state, message, _ in results))
+
+STATE_NAMES = {OK: 'OK', WARNING: 'WARNING', CRITICAL: 'CRITICAL', UNKNOWN: 'UNKNOWN'}
+
+class Forecaster:
+    """
+    Records the used space of every checked repository and forecasts when it is full
+
+    The used space is kept in a fixed-size ring buffer per repository, the forecast is a
+    least-squares line through the samples of the last window_days.
+    """
+
+    # Fewer samples give wild forecasts
+    MIN_SAMPLES = 3
+
+    def __init__(self, directory, window_days=7, warning_days=30, critical_days=7, history_size=8640, min_interval=60):
+        self.directory = directory
+        self.window_days = window_days
+        self.warning_days = warning_days
+        self.critical_days = critical_days
+        self.history_size = history_size
+        self.min_interval = min_interval
+
+    def days_until_full(self, url, name, capacity, used_space):
+        history = RingHistory.for_series(self.directory, url, name, size=self.history_size)
+        if history is None:
+            return None
+
+        now = time.time()
+        try:
+            # Checks that run more often than min_interval don't add samples
+            history.append(now, used_space, self.min_interval)
+        except OSError:
+            pass
+
+        times, values = history.samples(since=now - self.window_days * 86400)
+        if len(times) < self.MIN_SAMPLES:
+            return None
+        fit = linear_fit(times, values)
+        if fit is None or fit[0] <= 0:
+            return None
+
+        slope, used_now = fit
+        return max(capacity - used_now, 0) / slope / 86400
+
+    def evaluate(self, url, name, capacity, used_space, label='days_until_full'):
+        """
+        Return (state, message, perfdata) of the forecast, message and perfdata are empty without one
+        """
+        days = self.days_until_full(url, name, capacity, used_space)
+        if days is None:
+            return OK, '', ''
+
+        state = OK
+        if days <= self.critical_days:
+            state = CRITICAL
+        elif days <= self.warning_days:
+            state = WARNING
+        return (state, f", Days until full: {days:.1f}",
+                f"'{label}'={days:.2f};{self.warning_days:g}:;{self.critical_days:g}:;0")
+
+def evaluate_repositories(url, repositories, selection, warning_threshold, critical_threshold, thresholds=None, forecaster=None):
+    """
+    Return (name, state, message, perfdata) of every repository whose name matches the compiled selection
+    """
+    thresholds = thresholds or {}
+    results = []
+    for name, capacity, free_space, used_space, used_percentage in repositories:
+        if not selection.search(name):
+            continue
+        warning, critical = thresholds.get(name, (warning_threshold, critical_threshold))
+        state = repository_state(used_percentage, warning, critical)
+        message = (f"Repository: {name}, "
+                   f"Capacity: {bytes_to_gb(capacity):.2f} GB, "
+                   f"Free Space: {bytes_to_gb(free_space):.2f} GB, "
+                   f"Used Space: {bytes_to_gb(used_space):.2f} GB, "
+                   f"Used Percentage: {used_percentage:.2f}%")
+        perfdata = f"'{name}'={used_percentage:.2f}%;{warning:g};{critical:g};0;100"
+        if forecaster:
+            forecast_state, forecast_message, forecast_perfdata = forecaster.evaluate(url, name, capacity, used_space,
+                                                                                      f"{name} days_until_full")
+            state = max(state, forecast_state)
+            message += forecast_message
+            perfdata = f"{perfdata} {forecast_perfdata}".rstrip()
+        results.append((name, state, f"{STATE_NAMES[state]}: {message} | {perfdata}", perfdata))
+
+    return results
+
+def check_all_repositories(url, credentials_file, pattern, warning_threshold, critical_threshold, thresholds=None, cache_dir=None,
+                           session_ttl=600, passive_host=None, command_file=None, service_template='{repository}', report_format='json',
+                           forecaster=None, timings=None):
+    """
+    Evaluate every repository whose name matches pattern with one login and one report download
+    """
+    try:
+        selection = re.compile(pattern)
+    except re.error as e:
+        print(f"UNKNOWN: Invalid repository pattern '{pattern}': {e}")
+        sys.exit(UNKNOWN)
 
-def check_repository_space(url, credentials_file, repository_name, warning_threshold, critical_threshold):
     username, password = read_credentials(credentials_file)
-    session_id = get_session(url, username, password)
-    data = get_repository_space(url, session_id)
-    name, capacity, free_space, used_space, used_percentage = parse_repository_space(data, repository_name)
+    repositories = fetch_repository_report(url, username, password, list, cache_dir, session_ttl, report_format, timings)
+    with phase('output', timings):
+        results = evaluate_repositories(url, repositories, selection, warning_threshold, critical_threshold, thresholds, forecaster)
 
-    capacity_gb = bytes_to_gb(capacity)
-    free_space_gb = bytes_to_gb(free_space)
-    used_space_gb = bytes_to_gb(used_space)
+        if not results:
+            print(f"UNKNOWN: No repository matches '{pattern}'")
+            sys.exit(UNKNOWN)
 
-    message = (f"Repository: {name} | "
-               f"Capacity: {capacity_gb:.2f} GB, "
-               f"Free Space: {free_space_gb:.2f} GB, "
-               f"Used Space: {used_space_gb:.2f} GB, "
-               f"Used Percentage: {used_percentage:.2f}%")
+        if passive_host:
+            submit_passive(command_file, passive_host, service_template, results)
 
-    if used_percentage >= critical_threshold:
-        print(f"CRITICAL: {message}")
-        sys.exit(CRITICAL)
-    elif used_percentage >= warning_threshold:
-        print(f"WARNING: {message}")
-        sys.exit(WARNING)
-    else:
-        print(f"OK: {message}")
-        sys.exit(OK)
+        state = max(result[1] for result in results)
+        counts = ', '.join(f"{sum(1 for result in results if result[1] == level)} {STATE_NAMES[level].lower()}"
+                           for level in (CRITICAL, WARNING, OK))
+    print(f"{STATE_NAMES[state]}: {counts} of {len(results)} repositories | {' '.join(result[3] for result in results)}"
+          f"{perfdata_suffix(timings, ' ')}")
+    # Worst first, so the repositories that need attention are on top of the long output
+    for _, _, message, _ in sorted(results, key=lambda result: -result[1]):
+        print(message.split(' | ', 1)[0])
+    sys.exit(state)
+
+def check_repository_space(url, credentials_file, repository_name, warning_threshold, critical_threshold, cache_dir=None, session_ttl=600,
+                           report_format='json', forecaster=None, timings=None):
+    username, password = read_credentials(credentials_file)
+    name, capacity, free_space, used_space, used_percentage = fetch_repository_report(
+        url, username, password, lambda repositories: parse_repository_space(repositories, repository_name),
+        cache_dir, session_ttl, report_format, timings)
+
+    with phase('output', timings):
+        capacity_gb = bytes_to_gb(capacity)
+        free_space_gb = bytes_to_gb(free_space)
+        used_space_gb = bytes_to_gb(used_space)
+
+        message = (f"Repository: {name}, "
+                   f"Capacity: {capacity_gb:.2f} GB, "
+                   f"Free Space: {free_space_gb:.2f} GB, "
+                   f"Used Space: {used_space_gb:.2f} GB, "
+                   f"Used Percentage: {used_percentage:.2f}%")
+
+        state = repository_state(used_percentage, warning_threshold, critical_threshold)
+        if forecaster:
+            forecast_state, forecast_message, forecast_perfdata = forecaster.evaluate(url, name, capacity, used_space)
+            state = max(state, forecast_state)
+            message += forecast_message
+            message += f" | used_percentage={used_percentage:.2f}%;{warning_threshold:g};{critical_threshold:g};0;100 {forecast_perfdata}".rstrip()
+
+    message += perfdata_suffix(timings, ' ' if ' | ' in message else ' | ')
+    print(f"{STATE_NAMES[state]}: {message}")
+    sys.exit(state)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 6:
-        print("Usage: python check_repo5.py <url> <credentials_file> <repository_name> <warning_threshold> <critical_threshold>")
-        sys.exit(UNKNOWN)
+    parser = argparse.ArgumentParser(description='Check the space of a Veeam repository via Enterprise Manager')
+    parser.add_argument('url', help='Enterprise Manager URL, e.g. https://<server>:9398')
+    parser.add_argument('credentials_file', help='File with username and password on two lines')
+    parser.add_argument('repository_name', help='Name of the repository, a regular expression with --all_repositories')
+    parser.add_argument('warning_threshold', type=float, help='Warning threshold for used space in percent')
+    parser.add_argument('critical_threshold', type=float, help='Critical threshold for used space in percent')
+    parser.add_argument('--cache_dir', default=default_cache_dir('check_veeam'), help='Directory for the cached EM session')
+    parser.add_argument('--session_ttl', type=int, default=600,
+                        help='Seconds a session is reused after its last use, keep below the EM session timeout. Defaults to 600')
+    parser.add_argument('--no_session_cache', action='store_true', help='Log in and out on every run')
+    parser.add_argument('--report_format', choices=sorted(REPORT_TYPES), default='json',
+                        help='Report format to request from the Enterprise Manager. Defaults to json')
+    parser.add_argument('--all_repositories', action='store_true',
+                        help='Check every repository matching repository_name (e.g. ".*") from one report download')
+    parser.add_argument('--repo_threshold', action='append',
+                        help='Thresholds of one repository with --all_repositories, <repository>=<warning>:<critical>. Can be repeated')
+    parser.add_argument('--passive_host', help='With --all_repositories, submit a passive result per repository for this host')
+    parser.add_argument('--command_file', default='/usr/local/nagios/var/rw/nagios.cmd', help='Nagios external command file')
+    parser.add_argument('--service_template', default='{repository}', help='Service name of the passive results. Defaults to {repository}')
+    parser.add_argument('--forecast', action='store_true', help='Record the used space and alert on the forecast days until full')
+    parser.add_argument('--forecast_window', type=float, default=7, help='Days of history the forecast is based on. Defaults to 7')
+    parser.add_argument('--forecast_warning', type=float, default=30, help='Warning when full within this many days. Defaults to 30')
+    parser.add_argument('--forecast_critical', type=float, default=7, help='Critical when full within this many days. Defaults to 7')
+    parser.add_argument('--history_size', type=int, default=8640,
+                        help='Samples kept per repository, fixed when its history is created. Defaults to 8640 (30 days every 5 minutes)')
+    parser.add_argument('--timings', action='store_true',
+                        help='Append the duration of every phase, the request count and the response bytes as perfdata')
+    try:
+        args = parser.parse_args()
+    except SystemExit as e:
+        # Usage errors are UNKNOWN for Nagios, not the argparse default of 2
+        sys.exit(UNKNOWN if e.code else OK)
 
-    url = sys.argv[1]
-    credentials_file = sys.argv[2]
-    repository_name = sys.argv[3]
-    warning_threshold = float(sys.argv[4])
-    critical_threshold = float(sys.argv[5])
+    cache_dir = None if args.no_session_cache else args.cache_dir
+    timings = Timings() if args.timings else None
+    forecaster = None
+    if args.forecast:
+        forecaster = Forecaster(os.path.join(args.cache_dir, 'repohistory'), args.forecast_window, args.forecast_warning,
+                                args.forecast_critical, args.history_size)
+    if args.all_repositories:
+        check_all_repositories(args.url, args.credentials_file, args.repository_name, args.warning_threshold, args.critical_threshold,
+                               parse_thresholds(args.repo_threshold), cache_dir, args.session_ttl,
+                               args.passive_host, args.command_file, args.service_template, args.report_format, forecaster, timings)
 
-    check_repository_space(url, credentials_file, repository_name, warning_threshold, critical_threshold)
+    check_repository_space(args.url, args.credentials_file, args.repository_name, args.warning_threshold, args.critical_threshold,
+                           cache_dir, args.session_ttl, args.report_format, forecaster, timings)
@@ -1,64 +1,214 @@
 #!/usr/bin/python3
 #### Usage ####
 # check_veeam_backup.py --url https://<veeam server>:9419 --credentials_file <path> --vm_name <VM Name> --max_backup_age <Age in hours>
-import json
+#### Bulk usage, one run for many VMs ####
+# check_veeam_backup.py --url ... --credentials_file <path> --vm_list <file> --max_backup_age <Age in hours> [--passive_host <host>]
+# check_veeam_backup.py --url ... --credentials_file <path> --all_vms --max_backup_age <Age in hours> [--passive_host <host>]
+import os
 import sys
+import json
+import time
+import hashlib
 import argparse
 import logging
 from datetime import datetime, timedelta
-import urllib.request
-import urllib.parse
+from plugin_cache import default_cache_dir, private_dir, write_atomic, file_lock
+from veeam_rest import VeeamClient, VeeamError
+from plugin_timings import Timings, phase, perfdata_suffix
 
 logging.basicConfig(level=logging.INFO)
 
-def get_token(url, username, password):
-    headers = {
-        'accept': 'application/json',
-        'x-api-version': '1.2-rev0',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    data = urllib.parse.urlencode({
-        'grant_type': 'password',
-        'username': username,
-        'password': password
-    })
+def get_token(client):
     try:
-        req = urllib.request.Request(f'{url}/api/oauth2/token', data=data.encode('utf-8'), headers=headers)
-        response = urllib.request.urlopen(req)
-        token_response = json.loads(response.read().decode('utf-8'))
-        return token_response['access_token']
+        # Reuses the token of previous checks until it expires, then refreshes it
+        return client.token()
     except Exception as e:
         print(f"CRITICAL: Failed to get token: {e}")
         sys.exit(2)
 
-def get_restore_points(url, token):
-    headers = {
-        'accept': 'application/json',
-        'x-api-version': '1.2-rev0',
-        'Authorization': f'Bearer {token}'
-    }
+def get_restore_points(client):
     try:
-        req = urllib.request.Request(f'{url}/api/v1/restorePoints', headers=headers)
-        response = urllib.request.urlopen(req)
-        return json.loads(response.read().decode('utf-8'))
+        return client.get('/api/v1/restorePoints')
     except Exception as e:
         print(f"CRITICAL: Failed to get restore points: {e}")
         sys.exit(2)
 
-def get_backup_status(url, token, backup_id):
-    headers = {
-        'accept': 'application/json',
-        'x-api-version': '1.2-rev0',
-        'Authorization': f'Bearer {token}'
-    }
+def get_backup_status(client, backup_id):
     try:
-        req = urllib.request.Request(f'{url}/api/v1/backups/{backup_id}', headers=headers)
-        response = urllib.request.urlopen(req)
-        return json.loads(response.read().decode('utf-8'))
+        return client.get(f'/api/v1/backups/{backup_id}')
     except Exception as e:
         print(f"CRITICAL: Failed to get backup status: {e}")
         sys.exit(2)
 
+def vm_index_file(cache_dir, url):
+    if cache_dir is None or not private_dir(cache_dir):
+        return None
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f'vmindex-{key}.json')
+
+def load_vm_index(path):
+    """
+    Cached VM index, None when it is missing or not a valid index
+    """
+    try:
+        with open(path, 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A truncated or edited index is rebuilt like a missing one
+    if not isinstance(index, dict) or not isinstance(index.get('created'), (int, float)):
+        return None
+    objects = index.get('objects')
+    if not isinstance(objects, dict) or not all(
+            isinstance(object_ids, list) and all(isinstance(object_id, str) for object_id in object_ids)
+            for object_ids in objects.values()):
+        return None
+    return index
+
+def build_vm_index(client):
+    # A VM can be part of several backups, so a name maps to all its backup object IDs
+    objects = {}
+    for backup_object in client.paginate('/api/v1/backupObjects'):
+        objects.setdefault(backup_object['name'], []).append(backup_object['id'])
+    return {'created': time.time(), 'objects': objects}
+
+def get_vm_index(client, path, max_age, force=False):
+    """
+    Return the cached VM name -> backup object IDs index, rebuilding it when needed
+
+    A stale index is rebuilt by one process only, the others keep using the stale
+    index while that happens instead of waiting for it. Raises VeeamError when there is
+    no index yet and the process building it does not finish within the lock wait.
+    """
+    index = load_vm_index(path)
+    if index is not None and not force and time.time() - index['created'] < max_age:
+        return index
+
+    started = time.time()
+    wait = 30 if index is None or force else 0
+    with file_lock(path + '.lock', wait) as locked:
+        if not locked:
+            if index is None:
+                raise VeeamError('VM index is still being built by another check')
+            return index
+        current = load_vm_index(path)
+        if current is not None and current['created'] >= started:
+            # Rebuilt by another process while we waited for the lock
+            return current
+        index = build_vm_index(client)
+        try:
+            write_atomic(path, json.dumps(index))
+        except OSError:
+            pass
+        return index
+
+def get_latest_restore_point(client, object_ids):
+    """
+    Query the newest restore point of each backup object directly, limit 1
+    """
+    latest = None
+    for object_id in object_ids:
+        page = client.get(f'/api/v1/backupObjects/{object_id}/restorePoints',
+                          {'orderColumn': 'CreationTime', 'orderAsc': 'false', 'limit': 1})
+        for restore_point in page.get('data', [])[:1]:
+            if latest is None or restore_point['creationTime'] > latest['creationTime']:
+                latest = restore_point
+    return latest
+
+def lookup_vm(client, vm_name, path, max_age, min_refresh=300):
+    """
+    Latest restore point of one VM via the cached index, None when the VM is unknown
+
+    A VM missing from the index triggers a rebuild, at most every min_refresh seconds.
+    """
+    index = get_vm_index(client, path, max_age)
+    if vm_name not in index['objects'] and time.time() - index['created'] > min_refresh:
+        index = get_vm_index(client, path, max_age, force=True)
+    object_ids = index['objects'].get(vm_name)
+    if not object_ids:
+        return None
+    return get_latest_restore_point(client, object_ids)
+
+def index_restore_points(restore_points, vm_names=None):
+    """
+    Build a VM name -> latest restore point index in one pass
+
+    restore_points can be a generator over the pages of the API. With vm_names only those
+    VMs are indexed.
+    """
+    index = {}
+    for restore_point in restore_points:
+        name = restore_point['name']
+        if vm_names is not None and name not in vm_names:
+            continue
+        latest = index.get(name)
+        if latest is None or restore_point['creationTime'] > latest['creationTime']:
+            index[name] = restore_point
+    return index
+
+def evaluate_vm(vm_name, latest_restore_point, backup_status, max_backup_age):
+    """
+    Return (state, message) for the latest restore point of a VM
+    """
+    if latest_restore_point is None:
+        return 2, f"CRITICAL: No restore points found for VM {vm_name}"
+
+    if latest_restore_point['malwareStatus']!= 'Clean':
+        return 2, f"CRITICAL: Malware status for VM {vm_name} is not Clean"
+
+    if not backup_status:
+        return 2, f"CRITICAL: Failed to get backup status for VM {vm_name}"
+
+    creation_time = datetime.strptime(latest_restore_point['creationTime'], '%Y-%m-%dT%H:%M:%S.%f%z')
+    time_diff = datetime.now(creation_time.tzinfo) - creation_time
+    if time_diff.total_seconds() / 3600 > max_backup_age:
+        return 2, f"CRITICAL: Backup for VM {vm_name} is older than {max_backup_age} hours"
+
+    return 0, f"OK: Backup for VM {vm_name} is successful and within the allowed age of {max_backup_age} hours"
+
+def check_bulk(client, vm_names, max_backup_age):
+    """
+    Evaluate many VMs from one streamed pass over the restore points
+
+    Every distinct backup is fetched once. Returns a list of (vm_name, state, message),
+    vm_names None evaluates every VM that has restore points.
+    """
+    try:
+        index = index_restore_points(client.paginate('/api/v1/restorePoints'), vm_names)
+    except Exception as e:
+        print(f"CRITICAL: Failed to get restore points: {e}")
+        sys.exit(2)
+
+    backups = {}
+    results = []
+    for vm_name in sorted(vm_names if vm_names is not None else index):
+        latest_restore_point = index.get(vm_name)
+        backup_status = None
+        if latest_restore_point is not None and latest_restore_point['malwareStatus'] == 'Clean':
+            backup_id = latest_restore_point['backupId']
+            if backup_id not in backups:
+                try:
+                    backups[backup_id] = client.get(f'/api/v1/backups/{backup_id}')
+                except Exception:
+                    backups[backup_id] = None
+            backup_status = backups[backup_id]
+        state, message = evaluate_vm(vm_name, latest_restore_point, backup_status, max_backup_age)
+        results.append((vm_name, state, message))
+    return results
+
+def submit_passive(command_file, host, service_template, results):
+    """
+    Write one PROCESS_SERVICE_CHECK_RESULT per VM to the Nagios external command file
+    """
+    now = int(time.time())
+    with open(command_file, 'a') as f:
+        f.write(''.join(f"[{now}] PROCESS_SERVICE_CHECK_RESULT;{host};{service_template.format(vm=vm_name)};{state};{message}\n"
+                        for vm_name, state, message in results))
+
+def read_vm_list(vm_list):
+    with open(vm_list, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
 def read_credentials(credentials_file):
     try:
         with open(credentials_file, 'r') as f:
@@ -77,42 +227,107 @@ def main():
     parser = argparse.ArgumentParser(description='Check Veeam restore points')
     parser.add_argument('--url', help='Veeam server URL', required=True)
     parser.add_argument('--credentials_file', help='Path to credentials file', required=True)
-    parser.add_argument('--vm_name', help='Name of the VM to check', required=True)
+    parser.add_argument('--vm_name', help='Name of the VM to check, can be used multiple times', action='append')
+    parser.add_argument('--vm_list', help='File with the names of the VMs to check, one per line')
+    parser.add_argument('--all_vms', help='Check every VM that has restore points', action='store_true')
     parser.add_argument('--max_backup_age', help='Maximum allowed backup age in hours', required=True, type=int)
+    parser.add_argument('--passive_host', help='Submit every VM as passive service result for this host instead of printing it')
+    parser.add_argument('--command_file', help='Nagios external command file used with --passive_host',
+                        default='/usr/local/nagios/var/rw/nagios.cmd')
+    parser.add_argument('--service_template', help='Service description of passive results, {vm} is replaced by the VM name',
+                        default='{vm}')
+    parser.add_argument('--vm_index_age', help='Seconds the cached VM name index is used before it is rebuilt. Defaults to 3600',
+                        type=int, default=3600)
+    parser.add_argument('--no_vm_index', help='Search the full restore point list instead of the cached VM index', action='store_true')
+    parser.add_argument('--refresh_vm_index', help='Only rebuild the cached VM index, e.g. from cron', action='store_true')
+    parser.add_argument('--cache_dir', help='Directory for cached API tokens, versions and the VM index', default=default_cache_dir('check_veeam'))
+    parser.add_argument('--no_token_cache', help='Authenticate with the password on every run', action='store_true')
+    parser.add_argument('--api_version', help='Use this x-api-version (e.g. 1.2-rev0) instead of negotiating it', default=None)
+    parser.add_argument('--timings', help='Append the duration of every phase, the request count and the response bytes as perfdata',
+                        action='store_true')
     args = parser.parse_args()
 
-    # Suppress HTTPS warnings
-    import ssl
-    ssl._create_default_https_context = ssl._create_unverified_context
+    vm_names = list(args.vm_name or [])
+    if args.vm_list:
+        vm_names += read_vm_list(args.vm_list)
+    if not vm_names and not args.all_vms and not args.refresh_vm_index:
+        parser.error('one of --vm_name, --vm_list or --all_vms is required')
 
     username, password = read_credentials(args.credentials_file)
-    token = get_token(args.url, username, password)
-    restore_points = get_restore_points(args.url, token)
+    timings = Timings() if args.timings else None
+    client = VeeamClient(args.url, username, password, args.cache_dir, args.api_version, token_cache=not args.no_token_cache,
+                         timings=timings)
+    get_token(client)
+    index_path = None if args.no_vm_index else vm_index_file(args.cache_dir, args.url)
 
-    vm_restore_points = [restore_point for restore_point in restore_points['data'] if restore_point['name'] == args.vm_name]
-    if not vm_restore_points:
-        print(f"CRITICAL: No restore points found for VM {args.vm_name}")
-        sys.exit(2)
+    if args.refresh_vm_index:
+        if index_path is None:
+            print("UNKNOWN: No usable cache directory for the VM index")
+            sys.exit(3)
+        try:
+            index = get_vm_index(client, index_path, 0, force=True)
+        except Exception as e:
+            print(f"CRITICAL: Failed to build the VM index: {e}")
+            sys.exit(2)
+        print(f"OK: VM index contains {len(index['objects'])} VMs{perfdata_suffix(timings)}")
+        sys.exit(0)
 
-    latest_restore_point = max(vm_restore_points, key=lambda x: x['creationTime'])
-    if latest_restore_point['malwareStatus']!= 'Clean':
-        print(f"CRITICAL: Malware status for VM {args.vm_name} is not Clean")
-        sys.exit(2)
+    if len(vm_names) > 1 or args.all_vms or args.passive_host:
+        # The restore points are indexed while they are fetched, the requests are timed on their own
+        with phase('output', timings):
+            results = check_bulk(client, None if args.all_vms else set(vm_names), args.max_backup_age)
+        client.close()
+        sys.exit(report_bulk(args, results, timings))
 
-    backup_id = latest_restore_point['backupId']
-    backup_status = get_backup_status(args.url, token, backup_id)
-    if not backup_status:
-        print(f"CRITICAL: Failed to get backup status for VM {args.vm_name}")
-        sys.exit(2)
+    vm_name = vm_names[0]
+    latest_restore_point = None
+    use_index = index_path is not None
+    if use_index:
+        try:
+            latest_restore_point = lookup_vm(client, vm_name, index_path, args.vm_index_age)
+        except VeeamError as e:
+            # e.g. an API version without backup objects, search the full list instead
+            logging.debug("VM index lookup failed: %s", e)
+            use_index = False
 
-    creation_time = datetime.strptime(latest_restore_point['creationTime'], '%Y-%m-%dT%H:%M:%S.%f%z')
-    time_diff = datetime.now(creation_time.tzinfo) - creation_time
-    if time_diff.total_seconds() / 3600 > args.max_backup_age:
-        print(f"CRITICAL: Backup for VM {args.vm_name} is older than {args.max_backup_age} hours")
-        sys.exit(2)
+    if not use_index:
+        restore_points = get_restore_points(client)
+        with phase('output', timings):
+            vm_restore_points = [restore_point for restore_point in restore_points['data'] if restore_point['name'] == vm_name]
+            latest_restore_point = max(vm_restore_points, key=lambda x: x['creationTime']) if vm_restore_points else None
+
+    backup_status = None
+    if latest_restore_point is not None and latest_restore_point['malwareStatus'] == 'Clean':
+        backup_status = get_backup_status(client, latest_restore_point['backupId'])
+    client.close()
+
+    with phase('output', timings):
+        state, message = evaluate_vm(vm_name, latest_restore_point, backup_status, args.max_backup_age)
+    print(message + perfdata_suffix(timings))
+    sys.exit(state)
+
+def report_bulk(args, results, timings=None):
+    """
+    Print or submit the bulk results, returns the exit code
+    """
+    with phase('output', timings):
+        failed = [result for result in results if result[1] != 0]
+
+        if args.passive_host:
+            submit_passive(args.command_file, args.passive_host, args.service_template, results)
+            summary = f"OK: Submitted {len(results)} passive results, {len(failed)} not OK"
+        elif failed:
+            summary = f"CRITICAL: {len(failed)} of {len(results)} VMs have backup problems"
+        else:
+            summary = f"OK: Backups of all {len(results)} VMs are successful and within the allowed age of {args.max_backup_age} hours"
 
-    print(f"OK: Backup for VM {args.vm_name} is successful and within the allowed age of {args.max_backup_age} hours")
-    sys.exit(0)
+    print(summary + perfdata_suffix(timings))
+    if args.passive_host:
+        return 0
+    # Problems first, so they are visible in the truncated long output
+    for _, _, message in failed + [result for result in results if result[1] == 0]:
+        print(message)
+    return max([state for _, state, _ in results] + [0])
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+#Any Veeam API Version, the x-api-version is negotiated once per server and cached
+# ./check_veeam_backupjobs.py --url https://<VEEAM SERVER>:9419 --credentials_file <PATH> --max_backup_age <AGE> --job_filter "<OPTIONAL FILTER>"
+import re
+import sys
+import time
+import argparse
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from plugin_cache import default_cache_dir
+from veeam_rest import VeeamClient, VeeamError
+from plugin_timings import Timings, phase, perfdata_suffix
+
+logging.basicConfig(level=logging.INFO)
+
+PAGE_SIZE = 500
+
+def read_credentials(credentials_file):
+    with open(credentials_file, 'r') as f:
+        lines = f.readlines()
+        username = lines[0].strip()
+        password = lines[1].strip()
+        return username, password
+
+TIMESTAMP = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?(Z|[+-]\d\d:?\d\d)?$')
+
+def parse_timestamp(value):
+    """
+    Parse a Veeam ISO 8601 timestamp (up to 7 fractional digits) into an aware datetime
+
+    One precompiled regex is a lot cheaper than strptime per job.
+    """
+    match = TIMESTAMP.match(value)
+    if match is None:
+        raise ValueError(f'Unexpected timestamp {value}')
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    tz = timezone.utc
+    if offset and offset != 'Z':
+        offset = offset.replace(':', '')
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        tz = timezone(timedelta(minutes=-minutes if offset[0] == '-' else minutes))
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                    int((fraction or '0')[:6].ljust(6, '0')), tz)
+
+def server_filters(cutoff, job_filter):
+    """
+    jobs/states query parameters that let the server do the filtering
+    """
+    filters = {'lastRunAfterFilter': cutoff.strftime('%Y-%m-%dT%H:%M:%S.000Z')}
+    if job_filter:
+        filters['nameFilter'] = f'*{job_filter}*'
+    return filters
+
+def classify_jobs(jobs, cutoff, job_filter):
+    """
+    Split streamed jobs into (failed, warning, successful count)
+
+    The filters are applied here as well, in case a server ignores some of them.
+    """
+    failed_jobs = []
+    warning_jobs = []
+    successful_jobs = 0
+    job_filter = job_filter.lower() if job_filter else None
+
+    for job in jobs:
+        if job['lastRun'] is None:
+            continue
+        if job_filter is not None and job_filter not in job['name'].lower():
+            continue
+        if parse_timestamp(job['lastRun']) <= cutoff:
+            continue
+        if job['lastResult'] == 'Success':
+            successful_jobs += 1
+        elif job['lastResult'] == 'Warning':
+            warning_jobs.append(job)
+        elif job['lastResult'] == 'Failed':
+            failed_jobs.append(job)
+
+    return failed_jobs, warning_jobs, successful_jobs
+
+def unique_jobs(jobs):
+    """
+    Skip jobs that were already streamed, e.g. when pages overlap
+    """
+    seen = set()
+    for job in jobs:
+        if job['id'] in seen:
+            continue
+        seen.add(job['id'])
+        yield job
+
+def fetch_jobs_states(client, cutoff, job_filter, server_filter=True):
+    """
+    Return (failed, warning, successful count) of the jobs that ran after cutoff
+
+    With server_filter only the failed and warning jobs are transferred, page by page,
+    successful jobs are just counted by the server. Raises VeeamError.
+    """
+    if not server_filter:
+        return classify_jobs(client.paginate('/api/v1/jobs/states', page_size=PAGE_SIZE), cutoff, job_filter)
+
+    filters = server_filters(cutoff, job_filter)
+
+    def jobs_with_result(result):
+        # A server that ignores lastResultFilter returns every job
+        return (job for job in client.paginate('/api/v1/jobs/states', dict(filters, lastResultFilter=result), page_size=PAGE_SIZE)
+                if job['lastResult'] == result)
+
+    failed_jobs, warning_jobs, _ = classify_jobs(unique_jobs(itertools.chain(jobs_with_result('Failed'), jobs_with_result('Warning'))),
+                                                 cutoff, job_filter)
+
+    successful = client.get('/api/v1/jobs/states', dict(filters, lastResultFilter='Success', limit=1))
+    total = successful.get('pagination', {}).get('total')
+    if not isinstance(total, int) or any(job.get('lastResult') != 'Success' for job in successful.get('data', [])):
+        # No usable count from the server, count the successful jobs here
+        total = classify_jobs(unique_jobs(jobs_with_result('Success')), cutoff, job_filter)[2]
+    return failed_jobs, warning_jobs, total
+
+def get_jobs_states(client, cutoff, job_filter, server_filter=True):
+    try:
+        return fetch_jobs_states(client, cutoff, job_filter, server_filter)
+    except VeeamError as e:
+        print(f'CRITICAL: Failed to retrieve jobs from Veeam API: {e}')
+        sys.exit(2)
+
+def get_failure_details(client, job, timeout):
+    """
+    Return the latest session of a job and its unsuccessful task sessions
+
+    All requests for the job together must finish within timeout seconds, each request
+    only gets the time that is left.
+    """
+    deadline = time.monotonic() + timeout
+
+    def remaining():
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise VeeamError(f'no details within {timeout}s')
+        return left
+
+    sessions = client.get('/api/v1/sessions', {
+        'jobIdFilter': job['id'],
+        'orderColumn': 'CreationTime',
+        'orderAsc': 'false',
+        'limit': 1,
+    }, timeout=remaining())
+    if not sessions.get('data'):
+        return None, []
+
+    session = sessions['data'][0]
+    tasks = client.get(f"/api/v1/sessions/{session['id']}/taskSessions", timeout=remaining())
+    failed_tasks = [task for task in tasks.get('data', []) if (task.get('result') or {}).get('result') not in (None, 'Success')]
+    return session, failed_tasks
+
+def get_jobs_details(client, jobs, workers, timeout):
+    """
+    Fetch the failure details of all jobs concurrently, returns {job id: detail lines}
+    """
+    def details(job):
+        try:
+            session, failed_tasks = get_failure_details(client, job, timeout)
+        except VeeamError as e:
+            return [f'details unavailable: {e}']
+        if session is None:
+            return ['no sessions found']
+
+        result = session.get('result') or {}
+        lines = [f"last session {session.get('creationTime')}: {result.get('result')} {result.get('message') or ''}".rstrip()]
+        for task in failed_tasks:
+            task_result = task['result']
+            lines.append(f"{task.get('name')}: {task_result.get('result')} {task_result.get('message') or ''}".rstrip())
+        return lines
+
+    if not jobs:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        return dict(zip([job['id'] for job in jobs], executor.map(details, jobs)))
+
+def job_lines(jobs, details):
+    lines = []
+    for job in jobs:
+        lines.append(f"  - {job['name']}")
+        for line in details.get(job['id'], []):
+            lines.append(f"      {line}")
+    return lines
+
+def jobs_report(failed_jobs, warning_jobs, successful_jobs, max_backup_age, details=None):
+    """
+    Return (state, output lines) of the check
+    """
+    details = details or {}
+    if failed_jobs:
+        lines = ["CRITICAL: Failed jobs within the allowed age range:"] + job_lines(failed_jobs, details)
+        if warning_jobs:
+            lines.append(f"Warning jobs: {len(warning_jobs)}")
+            lines += job_lines(warning_jobs, details)
+        lines.append(f"Successful jobs: {successful_jobs}")
+        return 2, lines
+    elif warning_jobs:
+        lines = ["WARNING: Warning jobs within the allowed age range:"] + job_lines(warning_jobs, details)
+        lines.append(f"Successful jobs: {successful_jobs}")
+        return 1, lines
+    else:
+        return 0, [f"OK: No failed or warning jobs found within the allowed age of {max_backup_age} hours",
+                   f"Successful jobs: {successful_jobs}"]
+
+def main():
+    parser = argparse.ArgumentParser(description='Check Veeam backup jobs')
+    parser.add_argument('--url', help='Veeam server URL', required=True)
+    parser.add_argument('--credentials_file', help='Path to credentials file', required=True)
+    parser.add_argument('--max_backup_age', help='Maximum allowed backup age in hours', required=True, type=int)
+    parser.add_argument('--job_filter', help='Filter jobs by name', default=None)
+    parser.add_argument('--no_server_filter', help='Download all job states and filter them locally', action='store_true')
+    parser.add_argument('--details', help='Show the latest session and task failure reasons of failed and warning jobs', action='store_true')
+    parser.add_argument('--details_workers', help='Number of concurrent detail requests', default=8, type=int)
+    parser.add_argument('--details_timeout', help='Seconds allowed for the details of one job', default=10, type=float)
+    parser.add_argument('--cache_dir', help='Directory for cached API tokens and versions', default=default_cache_dir('check_veeam'))
+    parser.add_argument('--no_token_cache', help='Authenticate with the password on every run', action='store_true')
+    parser.add_argument('--api_version', help='Use this x-api-version (e.g. 1.1-rev2) instead of negotiating it', default=None)
+    parser.add_argument('--timings', help='Append the duration of every phase, the request count and the response bytes as perfdata',
+                        action='store_true')
+    args = parser.parse_args()
+
+    username, password = read_credentials(args.credentials_file)
+    timings = Timings() if args.timings else None
+    client = VeeamClient(args.url, username, password, args.cache_dir, args.api_version, token_cache=not args.no_token_cache,
+                         pool_size=max(args.details_workers, 1), timings=timings)
+    # Computed once, so every job only costs one timestamp parse and compare
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=args.max_backup_age)
+    try:
+        # The jobs are classified while their pages are fetched, the requests are timed on their own
+        with phase('output', timings):
+            failed_jobs, warning_jobs, successful_jobs = get_jobs_states(client, cutoff, args.job_filter, not args.no_server_filter)
+        details = {}
+        if args.details:
+            details = get_jobs_details(client, failed_jobs + warning_jobs, max(args.details_workers, 1), args.details_timeout)
+    finally:
+        client.close()
+
+    with phase('output', timings):
+        state, lines = jobs_report(failed_jobs, warning_jobs, successful_jobs, args.max_backup_age, details)
+    lines[0] += perfdata_suffix(timings)
+    print("\n".join(lines))
+    sys.exit(state)
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,14 @@ Supported Modes:
 * cluster-status - retrieves the overall NSX-T cluster status from the API
 * alarms - Retrieve and display open alarms from the API
 * capacity-usage - Retrieves and checks capacity indicators from the API
+* capacity-trend - Records the capacity indicators locally and checks their growth rate and
+  projected threshold crossing
+* all - Runs cluster-status, alarms and capacity-usage in one process over one pooled session,
+  capacity-trend keeps local history and has to be requested explicitly
+
+--mode can be given multiple times. With more than one mode the API requests run
+concurrently and every mode is reported as its own result block. Use --passive-host
+to submit each mode as a passive result for its own Nagios service instead.
 
 General API Documentation: https://code.vmware.com/apis/1083/nsx-t
 
@@ -36,12 +44,16 @@ import sys
 import argparse
 import logging
 import datetime
-import ssl
 import re
-from urllib.parse import urljoin
-import urllib3
-import requests
-from requests.auth import HTTPBasicAuth
+import time
+import json
+import hashlib
+from urllib.parse import urljoin, urlencode
+# ssl, requests, urllib3 and concurrent.futures are imported where they are used,
+# so --help, --version and usage errors don't load the HTTP stack
+from plugin_cache import ResponseCache, write_atomic, default_cache_dir, private_dir
+from plugin_history import MappedHistory, linear_fit
+from plugin_timings import Timings, phase, count, instrument_session
 
 
 __version__ = '0.2.0'
@@ -58,6 +70,10 @@ STATES = {
     UNKNOWN: "UNKNOWN",
 }
 
+MODES = ['cluster-status', 'alarms', 'capacity-usage', 'capacity-trend']
+# Modes of --mode all
+ALL_MODES = ['cluster-status', 'alarms', 'capacity-usage']
+
 
 def fix_tls_cert_store(cafile_path):
     """
@@ -71,6 +87,8 @@ def fix_tls_cert_store(cafile_path):
     if not cafile_path:
         return
 
+    import requests.adapters # pylint: disable=import-outside-toplevel
+
     # If CA file contains something, set as default
     if os.stat(cafile_path).st_size > 0:
         requests.utils.DEFAULT_CA_BUNDLE_PATH = cafile_path
@@ -83,6 +101,33 @@ class CriticalException(Exception):
     """
 
 
+class RequestStats:
+    """
+    Counters about the API requests of one check result, reported as perfdata
+
+    The cache counters are reported when caching is used, the per-phase Timings with --timings.
+    """
+
+    def __init__(self, caching=True, timings=None):
+        self.caching = caching
+        self.timings = timings
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_coalesced = 0
+
+    def perfdata(self):
+        perfdata = []
+        if self.caching:
+            perfdata += [
+                "cache_hits=%d;;;0" % self.cache_hits,
+                "cache_misses=%d;;;0" % self.cache_misses,
+                "cache_coalesced=%d;;;0" % self.cache_coalesced,
+            ]
+        if self.timings is not None:
+            perfdata += self.timings.perfdata()
+        return perfdata
+
+
 class Client:
     """
     Simple API client for VMware NSX-T
@@ -90,64 +135,199 @@ class Client:
 
     API_PREFIX = '/api/v1/'
 
-    def __init__(self, api, username, password, logger=None, verify=True, max_age=5):
+    # Maximum page size the NSX-T API accepts for list requests
+    PAGE_SIZE = 1000
+
+    def __init__(self, api, username, password, logger=None, verify=True, max_age=5, severities=None, cache=None,
+                 history_dir=None, trend_window=168, trend_warning=7, trend_critical=1, timings=False):
         self.api = api
         self.username = username
         self.password = password
         self.verify = verify
         self.max_age = max_age
+        self.severities = severities
+        self.cache = cache
+        self.history_dir = history_dir
+        self.trend_window = trend_window
+        self.trend_warning = trend_warning
+        self.trend_critical = trend_critical
+        self.timings = timings
 
         if logger is None:
             logger = logging.getLogger()
 
         self.logger = logger
 
-    def request(self, url, method='GET'):
+        import requests # pylint: disable=import-outside-toplevel
+        from requests.auth import HTTPBasicAuth # pylint: disable=import-outside-toplevel
+
+        # One keep-alive session for all requests of this process, so multiple
+        # modes share the TCP/TLS connection and the auth setup
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(self.username, self.password)
+        self.session.verify = self.verify
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=len(MODES))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if self.timings:
+            instrument_session(self.session)
+
+    def new_stats(self):
+        """
+        RequestStats for the requests of one check result
+        """
+        return RequestStats(caching=self.cache is not None, timings=Timings() if self.timings else None)
+
+    def request(self, url, method='GET', stats=None):
         """
         Basic JSON request handling
 
-        Handles authentication and returns the JSON result when successful
+        Handles authentication and returns the JSON result when successful.
+        GET requests are answered from the ResponseCache while they are within their TTL,
+        and coalesced with other processes requesting the same path when configured.
+        """
+        if stats is None:
+            stats = RequestStats()
+
+        if self.cache is None or method != 'GET':
+            return self.fetch(url, method, stats)
+
+        # The fetch of a cache miss is timed as its own phase
+        with phase('cache', stats.timings):
+            cache_key = self.cache.key(self.api, url, self.username)
+            ttl = self.cache.ttl_for(url)
+            if ttl > 0:
+                data = self.cache.get(cache_key, ttl)
+                if data is not None:
+                    self.logger.debug("using cached API response for: %s", url)
+                    stats.cache_hits += 1
+                    return data
+                stats.cache_misses += 1
+
+            data, coalesced = self.cache.fetch(cache_key, lambda: self.fetch(url, method, stats), store=ttl > 0)
+            if coalesced:
+                self.logger.debug("reused API response of another process for: %s", url)
+                stats.cache_coalesced += 1
+
+        return data
+
+    def fetch(self, url, method='GET', stats=None):
         """
+        Send the API request and decode the JSON result
+        """
+        import requests # pylint: disable=import-outside-toplevel
 
         base_url = urljoin(self.api, self.API_PREFIX)
         request_url = urljoin(base_url, url)
+        timings = stats.timings if stats is not None else None
 
         self.logger.debug("starting API %s request from: %s", method, url)
 
         try:
-            response = requests.request(method, request_url, auth=HTTPBasicAuth(self.username, self.password), verify=self.verify, timeout=10)
+            # verify is passed per request, REQUESTS_CA_BUNDLE would override the session setting
+            with phase('fetch', timings):
+                response = self.session.request(method, request_url, verify=self.verify, timeout=10)
         except requests.exceptions.RequestException as req_exc:
             raise CriticalException(req_exc) # pylint: disable=raise-missing-from
 
+        count(len(response.content), timings)
+
         if response.status_code != 200:
             # TODO What about 300 Redirects?
             raise CriticalException('Request to %s was not successful: %s' % (request_url, response.status_code))
 
         try:
-            return response.json()
+            with phase('decode', timings):
+                return response.json()
         except Exception as json_exc:
             raise CriticalException('Could not decode API JSON: ' + str(json_exc)) # pylint: disable=raise-missing-from
 
+    def paginate(self, url, params, stats=None):
+        """
+        Generator over the results of a list request, following the cursor page by page
+
+        Only one page of the response is held in memory at a time.
+        """
+        params = dict(params, page_size=self.PAGE_SIZE)
+
+        while True:
+            page = self.request(url + '?' + urlencode(params), stats=stats)
+
+            for item in page.get('results', []):
+                yield item
+
+            cursor = page.get('cursor')
+            if not cursor or not page.get('results'):
+                return
+
+            params['cursor'] = cursor
+
+    def attach_stats(self, result, stats):
+        """
+        Attach the RequestStats to a CheckResult, they are only reported with a cache or --timings
+        """
+        if self.cache is not None or self.timings:
+            result.stats = stats
+        return result
+
     def get_cluster_status(self, excludes=None):
         """
         GET and build ClusterStatus
         """
-        return ClusterStatus(self.request('cluster/status'), excludes)
+        stats = self.new_stats()
+        result = ClusterStatus(self.request('cluster/status', stats=stats), excludes)
+        return self.attach_stats(result, stats)
 
     def get_alarms(self, excludes=None):
         """
         GET and build Alarms
         """
-        status = "OPEN"
-        # status = "RESOLVED" # for testing
-        result = self.request('alarms?page_size=100&status=%s&sort_ascending=false' % status)
-        return Alarms(data=result['results'], excludes=excludes)
+        params = {
+            'status': 'OPEN',
+            # 'status': 'RESOLVED', # for testing
+            'sort_ascending': 'false',
+        }
+        if self.severities:
+            params['severity'] = ','.join(self.severities)
+
+        stats = self.new_stats()
+        result = Alarms(data=self.paginate('alarms', params, stats=stats), excludes=excludes)
+        return self.attach_stats(result, stats)
 
     def get_capacity_usage(self, excludes=None):
         """
         GET and build CapacityUsage
         """
-        return CapacityUsage(self.request('capacity/usage'), self.max_age, excludes)
+        stats = self.new_stats()
+        result = CapacityUsage(self.request('capacity/usage', stats=stats), self.max_age, excludes)
+        return self.attach_stats(result, stats)
+
+    def get_capacity_trend(self, excludes=None):
+        """
+        GET capacity usage, record it and build CapacityTrend
+        """
+        stats = self.new_stats()
+        result = CapacityTrend(self.request('capacity/usage', stats=stats), self.max_age, excludes, self.history_dir, self.api,
+                               self.trend_window, self.trend_warning, self.trend_critical)
+        return self.attach_stats(result, stats)
+
+    def get_mode(self, mode, excludes=None):
+        """
+        GET and build the CheckResult for a check mode
+        """
+        if mode == 'cluster-status':
+            return self.get_cluster_status(excludes)
+        if mode == 'alarms':
+            return self.get_alarms(excludes)
+        if mode == 'capacity-usage':
+            return self.get_capacity_usage(excludes)
+        if mode == 'capacity-trend':
+            return self.get_capacity_trend(excludes)
+
+        raise ValueError("unknown mode %s" % mode)
+
+    def close(self):
+        self.session.close()
 
 
 class CheckResult:
@@ -159,21 +339,32 @@ class CheckResult:
         self.summary = []
         self.output = []
         self.perfdata = []
+        # RequestStats of the API requests, set by the Client
+        self.stats = None
 
     def build_output(self):
         raise NotImplementedError("build_output not implemented in %s" % type(self))
 
     def get_output(self):
-        if len(self.summary) == 0:
-            self.build_output()
-        if self.state < 0:
-            self.build_status()
+        timings = self.stats.timings if self.stats is not None else None
+
+        # Alarms fetch their pages while the output is built, those requests are timed on their own
+        with phase('output', timings):
+            if len(self.summary) == 0:
+                self.build_output()
+            if self.state < 0:
+                self.build_status()
 
-        output = ' - '.join(self.summary)
-        if len(self.output) > 0:
-            output += "\n\n" + "\n".join(self.output)
-        if len(self.perfdata) > 0:
-            output += "\n| " + " ".join(self.perfdata)
+            output = ' - '.join(self.summary)
+            if len(self.output) > 0:
+                output += "\n\n" + "\n".join(self.output)
+
+        perfdata = self.perfdata
+        if self.stats is not None:
+            perfdata = perfdata + self.stats.perfdata()
+
+        if len(perfdata) > 0:
+            output += "\n| " + " ".join(perfdata)
 
         try:
             state = STATES[self.state]
@@ -198,6 +389,23 @@ class CheckResult:
         return self.get_status()
 
 
+class ErrorResult(CheckResult):
+    """
+    CheckResult for a mode that failed while the other modes of the same run succeeded
+    """
+
+    def __init__(self, message, state=CRITICAL):
+        super().__init__()
+        self.message = message
+        self.error_state = state
+
+    def build_output(self):
+        self.summary.append(self.message)
+
+    def build_status(self):
+        self.state = self.error_state
+
+
 class ClusterStatus(CheckResult):
     """
     See API Documentation: https://code.vmware.com/apis/1083/nsx-t
@@ -240,28 +448,31 @@ class Alarms(CheckResult):
 
     def __init__(self, data, excludes):
         super().__init__()
+        # data may be a generator over the pages of the API, it is consumed once in build_output
         self.data = data
-        self.excludes = excludes
-        if excludes is None:
-            self.excludes = []
+        self.excludes = compile_excludes(excludes)
 
     def _is_excluded(self, alarm):
         # to exclude via --exclude
+        if not self.excludes:
+            return False
+
         identifier = "%s %s %s %s" % (
             alarm['severity'],
             alarm['node_display_name'],
             alarm['feature_display_name'],
             alarm['event_type_display_name'])
-        for exclude in self.excludes:
-            regexp = re.compile(exclude)
-            if bool(regexp.search(identifier)):
-                return True
-        return False
+        return self.excludes.search(identifier)
 
     def build_output(self):
+        # Classify, count, format and derive the state in a single pass over the alarms
         states = {}
+        check_states = set()
+        total = 0
 
         for alarm in self.data:
+            total += 1
+
             if self._is_excluded(alarm):
                 continue
 
@@ -271,6 +482,9 @@ class Alarms(CheckResult):
             else:
                 states[severity] = 1
 
+            # HIGH == CRITICAL
+            check_states.add(WARNING if severity in ['MEDIUM', 'LOW'] else CRITICAL)
+
             self.output.append("[%s] (%s) (%s) %s/%s - %s" % (
                 severity,
                 time_iso(alarm['_create_time']),
@@ -280,31 +494,23 @@ class Alarms(CheckResult):
                 alarm['summary'],
                 ))
 
-        count = len(self.data)
-        self.summary.append("%d alarms" % count)
-        self.perfdata.append("alarms=%d;;;0" % count)
+        self.summary.append("%d alarms" % total)
+        self.perfdata.append("alarms=%d;;;0" % total)
 
         for state, value in states.items():
             self.summary.append("%d %s" % (value, state.lower()))
             self.perfdata.append("alarms.%s=%d;;;0" % (state.lower(), value))
 
-
-    def build_status(self):
-        states = []
-
-        for alarm in self.data:
-            if self._is_excluded(alarm):
-                continue
-
-            # HIGH == CRITICAL
-            state = WARNING if alarm['severity'] in ['MEDIUM', 'LOW'] else CRITICAL
-            states.append(state)
-
-        if len(states) > 0:
-            self.state = worst_state(*states)
+        if len(check_states) > 0:
+            self.state = worst_state(*check_states)
         else:
             self.state = OK
 
+    def build_status(self):
+        # The state is derived by build_output
+        if len(self.summary) == 0:
+            self.build_output()
+
 
 class CapacityUsage(CheckResult):
     """
@@ -316,24 +522,22 @@ class CapacityUsage(CheckResult):
         super().__init__()
         self.data = data
         self.max_age = max_age
-        self.excludes = excludes
-        if excludes is None:
-            self.excludes = []
+        self.excludes = compile_excludes(excludes)
 
     def _is_excluded(self, usage):
         # to exclude via --exclude
+        if not self.excludes:
+            return False
+
         identifier = "%s %s" % (
             usage['severity'],
             usage['display_name'])
-
-        for exclude in self.excludes:
-            regexp = re.compile(exclude)
-            if bool(regexp.search(identifier)):
-                return True
-        return False
+        return self.excludes.search(identifier)
 
     def build_output(self):
+        # Classify, count, format and derive the state in a single pass over the usages
         states = {}
+        check_states = set()
 
         for usage in self.data['capacity_usage']:
             if self._is_excluded(usage):
@@ -347,14 +551,15 @@ class CapacityUsage(CheckResult):
                 states[severity] = 1
 
             if severity == "INFO":
-                state = "OK"
+                state = OK
             elif severity == "WARNING":
-                state = "WARNING"
+                state = WARNING
             else:
-                state = "CRITICAL"
+                state = CRITICAL
+            check_states.add(state)
 
             self.output.append("[%s] [%s] %s: %d of %d (%g%%)" % (
-                state,
+                STATES[state],
                 usage['severity'],
                 usage['display_name'],
                 usage['current_usage_count'],
@@ -375,32 +580,333 @@ class CapacityUsage(CheckResult):
 
         self.summary.append("last update: " + time_iso(self.data['meta_info']['last_updated_timestamp']))
 
-    def build_status(self):
-        states = []
-
         now = datetime.datetime.now()
         last_updated = build_datetime(self.data['meta_info']['last_updated_timestamp'])
 
         if (now-last_updated).total_seconds() / 60 > self.max_age:
-            states.append(WARNING)
+            check_states.add(WARNING)
             self.summary.append("last update older than %s minutes" % (self.max_age))
 
+        self.state = worst_state(*check_states)
+
+    def build_status(self):
+        # The state is derived by build_output
+        if len(self.summary) == 0:
+            self.build_output()
+
+
+class ExcludeMatcher:
+    """
+    Combined matcher for --exclude and --exclude-file rules
+
+    Every rule is analysed once for the literal text a match has to start with. An
+    identifier only reaches the combined regular expression when it starts with one
+    of the anchored literals or contains one of the floating ones, so most identifiers
+    are rejected with plain string operations. Rules without a literal prefix disable
+    the prefilter.
+    """
+
+    # Characters that end the literal prefix of a rule
+    META = set('.^$*+?{}[]|()\\')
+
+    def __init__(self, rules=None, prefixes=None):
+        self.rules = []
+        self.prefixes = []
+        self.anchored = ()
+        self.floating = ()
+        self.unfiltered = False
+        self._search = None
+
+        if rules:
+            self.add(rules, prefixes)
+
+    def __bool__(self):
+        return len(self.rules) > 0
+
+    def add(self, rules, prefixes=None):
+        """
+        Add rules, prefixes can be passed when they were analysed before
+        """
+        if prefixes is None:
+            prefixes = [self.literal_prefix(rule) for rule in rules]
+
+        self.rules.extend(rules)
+        self.prefixes.extend(prefixes)
+
+        anchored = set()
+        floating = set()
+        self.unfiltered = False
+        for is_anchored, literal in self.prefixes:
+            if not literal:
+                self.unfiltered = True
+            elif is_anchored:
+                anchored.add(literal)
+            else:
+                floating.add(literal)
+
+        self.anchored = tuple(anchored)
+        self.floating = tuple(floating)
+        self._search = None
+
+    @classmethod
+    def literal_prefix(cls, rule):
+        """
+        Return (anchored, literal) with the literal text every match of rule starts with
+
+        An empty literal means the rule can not be prefiltered.
+        """
+        flags = re.compile(rule).flags
+        if '|' in rule or flags & (re.IGNORECASE | re.VERBOSE):
+            return False, ''
+
+        anchored = rule.startswith('^')
+        position = 1 if anchored else 0
+        literal = []
+
+        while position < len(rule):
+            char = rule[position]
+            if char == '\\':
+                escaped = rule[position + 1:position + 2]
+                if not escaped or escaped.isalnum():
+                    break
+                char = escaped
+                step = 2
+            elif char in cls.META:
+                break
+            else:
+                step = 1
+
+            following = rule[position + step:position + step + 1]
+            if following and following in '*?{':
+                # the character is optional, so it is not part of every match
+                break
+
+            literal.append(char)
+            position += step
+            if following == '+':
+                break
+
+        return anchored, ''.join(literal)
+
+    def _compile(self):
+        # Backreferences would be renumbered in the combined expression
+        if any(re.search(r'\\[1-9]|\(\?P=', rule) for rule in self.rules):
+            patterns = [re.compile(rule) for rule in self.rules]
+            return lambda identifier: any(p.search(identifier) for p in patterns)
+
+        try:
+            return re.compile('|'.join('(?:%s)' % rule for rule in self.rules)).search
+        except re.error:
+            patterns = [re.compile(rule) for rule in self.rules]
+            return lambda identifier: any(p.search(identifier) for p in patterns)
+
+    def search(self, identifier):
+        """
+        Check if any rule matches the identifier
+        """
+        if not self.rules:
+            return False
+
+        if not self.unfiltered:
+            if not identifier.startswith(self.anchored) and not any(literal in identifier for literal in self.floating):
+                return False
+
+        # The combined expression is only compiled once an identifier passes the prefilter
+        if self._search is None:
+            self._search = self._compile()
+
+        return bool(self._search(identifier))
+
+    @classmethod
+    def from_file(cls, path, cache_dir=None, logger=None):
+        """
+        Load the rules of an exclude file, one regular expression per line
+
+        Empty lines and lines starting with # are ignored. The analysed rules are cached
+        in cache_dir and only analysed again when the mtime or size of the file changes.
+        Python can not persist compiled expressions, the combined expression is compiled
+        lazily by search.
+
+        The cache is only used when cache_dir is private to the current user, otherwise
+        anyone could plant rules that silence every alarm.
+        """
+        if logger is None:
+            logger = logging.getLogger()
+
+        stat = os.stat(path)
+        cache_file = None
+
+        if cache_dir and not private_dir(cache_dir):
+            logger.debug("exclude cache %s is not private, analysing %s without cache", cache_dir, path)
+            cache_dir = None
+
+        if cache_dir:
+            key = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()
+            cache_file = os.path.join(cache_dir, 'excludes-%s.json' % key)
+            try:
+                with open(cache_file, 'r') as cached_file:
+                    cached = json.load(cached_file)
+                if cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+                    return cls(cached['rules'], [tuple(prefix) for prefix in cached['prefixes']])
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+        rules = []
+        with open(path, 'r') as rules_file:
+            for number, line in enumerate(rules_file, 1):
+                rule = line.strip()
+                if not rule or rule.startswith('#'):
+                    continue
+                try:
+                    re.compile(rule)
+                except re.error as rule_exc:
+                    raise ValueError("invalid exclude rule in %s line %d: %s" % (path, number, rule_exc)) # pylint: disable=raise-missing-from
+                rules.append(rule)
+
+        matcher = cls(rules)
+
+        if cache_file:
+            try:
+                write_atomic(cache_file, json.dumps({
+                    'mtime_ns': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'rules': matcher.rules,
+                    'prefixes': matcher.prefixes,
+                }))
+            except OSError as cache_exc:
+                logger.debug("could not write exclude cache %s: %s", cache_file, cache_exc)
+
+        return matcher
+
+
+class CapacityTrend(CapacityUsage):
+    """
+    Growth of the capacity indicators, based on a local history per manager and usage_type
+
+    Every run appends current_usage_percentage to a MappedHistory, the growth rate is a
+    least-squares fit over the last trend_window hours. The state is derived from the
+    days until an indicator is projected to reach its max_threshold_percentage.
+    """
+
+    # Samples of the same capacity update are only recorded once
+    MIN_INTERVAL = 60
+    # Fewer samples give wild projections
+    MIN_SAMPLES = 3
+
+    def __init__(self, data, max_age, excludes, history_dir, manager, window=168, warning_days=7, critical_days=1):
+        super().__init__(data, max_age, excludes)
+        self.history_dir = history_dir
+        self.manager = manager
+        self.window = window
+        self.warning_days = warning_days
+        self.critical_days = critical_days
+
+    def trend(self, usage, timestamp):
+        """
+        Record the usage and return (samples, growth per day, days until max threshold)
+        """
+        history = MappedHistory.for_series(self.history_dir, self.manager, usage['usage_type'])
+        if history is None:
+            raise CriticalException("capacity history directory %s is not usable" % self.history_dir)
+
+        history.append(timestamp, usage['current_usage_percentage'], self.MIN_INTERVAL)
+        times, values = history.samples(since=timestamp - self.window * 3600)
+        if len(times) < self.MIN_SAMPLES:
+            return len(times), None, None
+
+        fit = linear_fit(times, values)
+        if fit is None:
+            return len(times), None, None
+
+        growth = fit[0] * 86400
+        threshold = usage['max_threshold_percentage']
+        current = usage['current_usage_percentage']
+        if growth <= 0 or current >= threshold:
+            return len(times), growth, None
+
+        return len(times), growth, (threshold - current) / growth
+
+    def build_output(self):
+        check_states = {}
+        growing = 0
+        collecting = 0
+        timestamp = self.data['meta_info']['last_updated_timestamp'] / 1000
+
         for usage in self.data['capacity_usage']:
             if self._is_excluded(usage):
                 continue
 
-            severity = usage['severity']  # INFO, WARNING, CRITICAL, ERROR
+            samples, growth, days = self.trend(usage, timestamp)
+            label = usage['usage_type'].lower()
 
-            if severity == "INFO":
-                state = OK
-            elif severity == "WARNING":
+            if growth is None:
+                collecting += 1
+                self.output.append("[OK] %s: %g%%, collecting history (%d samples)" % (
+                    usage['display_name'], usage['current_usage_percentage'], samples))
+                continue
+
+            state = OK
+            if days is not None and days <= self.critical_days:
+                state = CRITICAL
+            elif days is not None and days <= self.warning_days:
                 state = WARNING
+            check_states[state] = check_states.get(state, 0) + 1
+
+            if growth > 0:
+                growing += 1
+
+            text = "[%s] %s: %g%%, %+.2f%%/day" % (STATES[state], usage['display_name'], usage['current_usage_percentage'], growth)
+            if days is not None:
+                text += ", %d%% in %.1f days" % (usage['max_threshold_percentage'], days)
+                self.perfdata.append("%s_days=%.2f;%g:;%g:;0" % (label, days, self.warning_days, self.critical_days))
+            self.output.append(text)
+            self.perfdata.append("%s_growth=%.4f%%;;;" % (label, growth))
+
+        self.summary.append("%d growing" % growing)
+        for state in (CRITICAL, WARNING):
+            if state in check_states:
+                self.summary.append("%d %s" % (check_states[state], STATES[state].lower()))
+        if collecting:
+            self.summary.append("%d collecting history" % collecting)
+
+        self.summary.append("window %gh" % self.window)
+        self.state = worst_state(*check_states) if check_states else OK
+
+
+def compile_excludes(excludes):
+    """
+    Build an ExcludeMatcher from --exclude patterns, flattening the nested lists argparse builds
+
+    An ExcludeMatcher is returned as is.
+    """
+    if isinstance(excludes, ExcludeMatcher):
+        return excludes
+
+    def flatten(items):
+        for item in items or []:
+            if isinstance(item, (list, tuple)):
+                yield from flatten(item)
             else:
-                state = CRITICAL
+                yield item
 
-            states.append(state)
+    return ExcludeMatcher(list(flatten(excludes)))
 
-        self.state = worst_state(*states)
+
+def load_excludes(excludes, exclude_files, cache_dir=None):
+    """
+    Combine the --exclude patterns and the rules of all --exclude-file into one matcher
+    """
+    matcher = ExcludeMatcher()
+
+    for path in exclude_files or []:
+        loaded = ExcludeMatcher.from_file(path, cache_dir)
+        matcher.add(loaded.rules, loaded.prefixes)
+
+    patterns = compile_excludes(excludes)
+    if patterns:
+        matcher.add(patterns.rules, patterns.prefixes)
+
+    return matcher
 
 
 def build_datetime(timestamp_ms):
@@ -454,16 +960,49 @@ def commandline(args):
                         **environ_or_required('CHECK_VMWARE_NSXT_API_PASSWORD'),
                         help='Password for Basic Auth')
 
-    parser.add_argument('--mode', '-m', choices=['cluster-status', 'alarms', 'capacity-usage'],
-                        help='Check mode to execute. Hint: alarms will only include open alarms.', required=True)
+    parser.add_argument('--mode', '-m', choices=MODES + ['all'], action='append',
+                        help='Check mode to execute, can be used multiple times. Hint: alarms will only include open alarms.',
+                        required=True)
     #parser.add_argument('--exclude', nargs='*', action='extend', type=str,
     #                    help="Exclude alarms or usage from the check results. Can be used multiple times and supports regular expressions.")
     parser.add_argument('--exclude', nargs='*', action='append', type=str,
                          help="Exclude alarms or usage from the check results. Can be used multiple times and supports regular expressions.")
+    parser.add_argument('--exclude-file', action='append',
+                        help="File with exclude rules, one regular expression per line. Lines starting with # are ignored.\n"
+                             "Can be used multiple times.")
+    parser.add_argument('--cache-dir',
+                        default=os.environ.get('CHECK_VMWARE_NSXT_CACHE_DIR', default_cache_dir('check_vmware_nsxt')),
+                        help='Directory for cached state like analysed exclude files and API responses')
+    parser.add_argument('--cache-ttl', action='append', metavar='[ENDPOINT=]SECONDS',
+                        help="Cache API responses in --cache-dir for SECONDS, optionally only for one endpoint\n"
+                             "(e.g. alarms=30 or capacity/usage=120). Can be used multiple times. Defaults to no caching.")
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help='Maximum size of the response cache in MB, least recently used entries are removed. Defaults to 64')
+    parser.add_argument('--coalesce-wait', type=float, default=0, metavar='SECONDS',
+                        help="Coalesce identical API requests of concurrent plugin processes: one process fetches,\n"
+                             "the others wait up to SECONDS for its result before fetching on their own. Defaults to 0 (off)")
+    parser.add_argument('--severity', action='append', choices=['CRITICAL', 'HIGH', 'MEDIUM', 'LOW'],
+                        help='Only retrieve alarms of this severity, filtered by the API. Can be used multiple times.')
     parser.add_argument('--max-age', '-M', type=int,
                         help='Max age in minutes for capacity usage updates. Defaults to 5', default=5, required=False)
+    parser.add_argument('--trend-window', type=float, default=168,
+                        help='Hours of capacity history the capacity-trend growth rate is based on. Defaults to 168')
+    parser.add_argument('--trend-warning', type=float, default=7,
+                        help='capacity-trend warns when an indicator reaches its max threshold within this many days. Defaults to 7')
+    parser.add_argument('--trend-critical', type=float, default=1,
+                        help='capacity-trend is critical when an indicator reaches its max threshold within this many days. Defaults to 1')
+    parser.add_argument('--passive-host',
+                        help='Submit every mode as passive service result for this host to the Nagios command file', required=False)
+    parser.add_argument('--command-file',
+                        help='Nagios external command file used with --passive-host. Defaults to /usr/local/nagios/var/rw/nagios.cmd',
+                        default='/usr/local/nagios/var/rw/nagios.cmd', required=False)
+    parser.add_argument('--service-prefix',
+                        help='Prefix for the service description of passive results, the mode name is appended', default='', required=False)
     parser.add_argument('--insecure',
                         help='Do not verify TLS certificate', action='store_true', required=False)
+    parser.add_argument('--timings',
+                        help='Append the duration of every phase (dns, connect, tls, fetch, decode, cache, output),\n'
+                             'the request count and the response bytes as perfdata', action='store_true')
     parser.add_argument('--version', '-V',
                         help='Print version', action='store_true')
 
@@ -471,26 +1010,133 @@ def commandline(args):
 
 
 def main(args):
+    if args.version:
+        print(f"check_vmware_nsxt version {__version__}")
+        return 3
+
+    import ssl # pylint: disable=import-outside-toplevel
     fix_tls_cert_store(ssl.get_default_verify_paths().cafile)
 
     if args.insecure:
+        import urllib3 # pylint: disable=import-outside-toplevel
         urllib3.disable_warnings()
 
-    if args.version:
-        print(f"check_vmware_nsxt version {__version__}")
-        return 3
+    client = Client(args.api, args.username, args.password, verify=(not args.insecure), max_age=args.max_age,
+                    severities=args.severity, cache=build_cache(args), history_dir=os.path.join(args.cache_dir, 'capacity-history'),
+                    trend_window=args.trend_window, trend_warning=args.trend_warning, trend_critical=args.trend_critical,
+                    timings=args.timings)
+
+    modes = expand_modes(args.mode)
+    excludes = load_excludes(args.exclude, args.exclude_file, args.cache_dir)
+
+    try:
+        if len(modes) == 1 and not args.passive_host:
+            return client.get_mode(modes[0], excludes).print_and_return()
+
+        results = run_modes(client, modes, excludes)
+    finally:
+        client.close()
+
+    if args.passive_host:
+        return submit_passive(args.command_file, args.passive_host, args.service_prefix, results)
 
-    client = Client(args.api, args.username, args.password, verify=(not args.insecure), max_age=args.max_age)
+    outputs = []
+    for mode, result in results:
+        outputs.append("%s: %s" % (mode, result.get_output()))
+    print("\n\n".join(outputs))
+
+    return worst_state(*[result.get_status() for _, result in results])
+
+
+def build_cache(args):
+    """
+    Build the ResponseCache from the --cache-* arguments, None when neither a TTL nor coalescing is set
+
+    Cached responses decide the check results, so there is no cache when --cache-dir is
+    not private to the current user.
+    """
+    if not args.cache_ttl and args.coalesce_wait <= 0:
+        return None
+
+    if not private_dir(args.cache_dir):
+        logging.getLogger().warning("cache directory %s is not private, API responses are not cached", args.cache_dir)
+        return None
+
+    default_ttl = 0
+    ttls = {}
+    for value in args.cache_ttl or []:
+        endpoint, _, seconds = value.rpartition('=')
+        if endpoint:
+            ttls[endpoint] = int(seconds)
+        else:
+            default_ttl = int(seconds)
+
+    return ResponseCache(os.path.join(args.cache_dir, 'responses'), ttls, default_ttl, args.cache_size * 1024 * 1024,
+                         coalesce_wait=args.coalesce_wait)
+
+
+def expand_modes(modes):
+    """
+    Flatten the --mode arguments into a list of unique modes, resolving "all"
+    """
+    expanded = []
+
+    for mode in modes:
+        for name in ALL_MODES if mode == 'all' else [mode]:
+            if name not in expanded:
+                expanded.append(name)
+
+    return expanded
+
+
+def run_modes(client, modes, excludes=None):
+    """
+    Fetch and build the CheckResult of every mode concurrently over the shared session
+
+    Returns a list of (mode, CheckResult) in the order of modes, failed requests are
+    returned as ErrorResult so the other modes are still reported.
+    """
+    from concurrent.futures import ThreadPoolExecutor # pylint: disable=import-outside-toplevel
+
+    def run(mode):
+        try:
+            result = client.get_mode(mode, excludes)
+            # Build in the worker as well, so output and state are ready when joined
+            result.get_output()
+            return result
+        except CriticalException as exc:
+            return ErrorResult(str(exc))
+
+    with ThreadPoolExecutor(max_workers=len(modes)) as executor:
+        return list(zip(modes, executor.map(run, modes)))
+
+
+def passive_lines(host, service_prefix, results):
+    """
+    Format (mode, CheckResult) pairs as PROCESS_SERVICE_CHECK_RESULT external commands
+    """
+    now = int(time.time())
+    lines = []
+
+    for mode, result in results:
+        output = result.get_output().replace("\n", "\\n")
+        lines.append("[%d] PROCESS_SERVICE_CHECK_RESULT;%s;%s%s;%d;%s\n" % (
+            now, host, service_prefix, mode, result.get_status(), output))
+
+    return lines
+
+
+def submit_passive(command_file, host, service_prefix, results):
+    """
+    Write one PROCESS_SERVICE_CHECK_RESULT per mode to the Nagios external command file
+    """
+    lines = passive_lines(host, service_prefix, results)
 
-    if args.mode == 'cluster-status':
-        return client.get_cluster_status(args.exclude).print_and_return()
-    if args.mode == 'alarms':
-        return client.get_alarms(args.exclude).print_and_return()
-    if args.mode == 'capacity-usage':
-        return client.get_capacity_usage(args.exclude).print_and_return()
+    with open(command_file, 'a') as cmd:
+        cmd.write("".join(lines))
 
-    print("[UNKNOWN] unknown mode %s" % args.mode)
-    return UNKNOWN
+    print("[OK] submitted %d passive results for %s" % (len(lines), host))
+    return OK
 
 
 if __package__ == '__main__' or __package__ is None: # pragma: no cover
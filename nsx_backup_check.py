@@ -1,22 +1,19 @@
 #!/usr/bin/python3
-#./nsx_backup_check.py --nsx-manager <NSX_MANAGER_URL> --credential-file <CREDENTIALS_FILE_PATH> --time-period <TIME_PERIOD_IN_HOURS>
+#./nsx_backup_check.py --nsx-manager <NSX_MANAGER_URL> --credential-file <CREDENTIALS_FILE_PATH> --time-period <TIME_PERIOD_IN_HOURS> [--timings]
   
-import requests
 import json
 import sys
 from datetime import datetime, timedelta
-import urllib3
 import argparse
 
-# Disable InsecureRequestWarning
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
+from plugin_timings import Timings, phase, count, perfdata_suffix, instrument_session
 
 # Define the command-line arguments
 parser = argparse.ArgumentParser(description='NSX Backup Check')
 parser.add_argument('--nsx-manager', required=True, help='NSX Manager URL')
 parser.add_argument('--credential-file', required=True, help='Path to the credentials file')
 parser.add_argument('--time-period', type=int, required=True, help='Time period in hours')
+parser.add_argument('--timings', action='store_true', help='Append the duration of every phase, the request count and the response bytes as perfdata')
 
 # Parse the command-line arguments
 args = parser.parse_args()
@@ -30,6 +27,8 @@ credentials_file = args.credential_file
 # Set the time period
 time_period_in_hours = args.time_period
 
+timings = Timings() if args.timings else None
+
 # Read the credentials from the file
 try:
     with open(credentials_file, 'r') as f:
@@ -43,21 +42,35 @@ except FileNotFoundError:
     print(f"Credentials file {credentials_file} not found")
     exit(2)
 
+# Imported after the arguments are parsed, usage errors don't load the HTTP stack
+import requests
+import urllib3
+
+# Disable InsecureRequestWarning
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
 # Get the backup status
 backup_url = nsx_manager + '/policy/api/v1/cluster/backups/overview'
-response = requests.get(backup_url, auth=(nsx_username, nsx_password), verify=False)
+session = requests.Session()
+if timings:
+    instrument_session(session)
+with phase('fetch', timings):
+    response = session.get(backup_url, auth=(nsx_username, nsx_password), verify=False)
+count(len(response.content), timings)
 if response.status_code!= 200:
-    print(f"HTTP Error {response.status_code}: {response.reason}")
+    print(f"HTTP Error {response.status_code}: {response.reason}{perfdata_suffix(timings)}")
     print(response.text)
     exit(2)
 
 # Check the backup status
-backup_data = response.json()
+with phase('decode', timings):
+    backup_data = response.json()
 if 'backup_operation_history' in backup_data and 'cluster_backup_statuses' in backup_data['backup_operation_history']:
     cluster_backup_statuses = backup_data['backup_operation_history']['cluster_backup_statuses']
-    recent_backups = [backup for backup in cluster_backup_statuses if (datetime.now() - datetime.fromtimestamp(backup['start_time'] / 1000)).total_seconds() / 3600 <= time_period_in_hours]
+    with phase('output', timings):
+        recent_backups = [backup for backup in cluster_backup_statuses if (datetime.now() - datetime.fromtimestamp(backup['start_time'] / 1000)).total_seconds() / 3600 <= time_period_in_hours]
     if recent_backups:
-        print(f"OK - Found {len(recent_backups)} backups within the last {time_period_in_hours} hours")
+        print(f"OK - Found {len(recent_backups)} backups within the last {time_period_in_hours} hours{perfdata_suffix(timings)}")
         for backup in recent_backups:
             print(f"Backup ID: {backup['backup_id']}, Start Time: {datetime.fromtimestamp(backup['start_time'] / 1000)}, End Time: {datetime.fromtimestamp(backup['end_time'] / 1000)}")
         exit(0)
@@ -65,8 +78,8 @@ if 'backup_operation_history' in backup_data and 'cluster_backup_statuses' in ba
         last_backup = min(cluster_backup_statuses, key=lambda x: abs(datetime.now() - datetime.fromtimestamp(x['start_time'] / 1000)))
         last_backup_time = datetime.fromtimestamp(last_backup['start_time'] / 1000)
         time_since_last_backup = (datetime.now() - last_backup_time).total_seconds() / 3600
-        print(f"CRITICAL - No backups found within the last {time_period_in_hours} hours. Last backup was {time_since_last_backup:.2f} hours ago on {last_backup_time}")
+        print(f"CRITICAL - No backups found within the last {time_period_in_hours} hours. Last backup was {time_since_last_backup:.2f} hours ago on {last_backup_time}{perfdata_suffix(timings)}")
         exit(2)
 else:
-    print(f"UNKNOWN - Failed to retrieve backup status")
+    print(f"UNKNOWN - Failed to retrieve backup status{perfdata_suffix(timings)}")
     exit(3)
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Long-running collector that submits the NSX and Veeam checks as passive results
+
+Instead of Nagios starting a plugin process per service and interval, this daemon
+keeps one API client per configured upstream (pooled connections, cached tokens and
+sessions), polls every upstream once per interval with the check logic of the plugins
+and writes PROCESS_SERVICE_CHECK_RESULT lines to the Nagios external command file.
+
+The polls are scheduled with asyncio, the blocking API clients run in a thread pool.
+
+Configuration is a JSON file:
+
+    {
+      "command_file": "/usr/local/nagios/var/rw/nagios.cmd",
+      "checks": [
+        {"type": "nsxt", "host": "nsx01", "api": "https://nsx01.example.com",
+         "credentials_file": "/etc/nagios/nsx.cred", "modes": ["all"], "interval": 60,
+         "service_prefix": "NSX "},
+        {"type": "veeam-jobs", "host": "vbr01", "url": "https://vbr01:9419",
+         "credentials_file": "/etc/nagios/veeam.cred", "max_backup_age": 24, "service": "Veeam Jobs"},
+        {"type": "veeam-backup", "host": "vbr01", "url": "https://vbr01:9419",
+         "credentials_file": "/etc/nagios/veeam.cred", "max_backup_age": 24, "vms": ["vm01", "vm02"],
+         "service_template": "Backup {vm}"},
+        {"type": "veeam-repo", "host": "em01", "url": "https://em01:9398",
+         "credentials_file": "/etc/nagios/veeam.cred", "pattern": ".*", "warning": 80, "critical": 90,
+         "service_template": "Repository {repository}"}
+      ]
+    }
+
+Credentials files contain the username and the password on two lines, like for the
+plugins. "interval" defaults to 300 seconds, "veeam-backup" without "vms" checks
+every VM that has restore points.
+
+A failed poll is reported as CRITICAL for the services of the check, with the error
+message the plugin would have printed. veeam-backup
+without "vms" and veeam-repo only know their services after a successful poll, until
+then a failure is reported as DOWN host result.
+
+Usage: passive_collector.py --config <file> [--once]
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import select
+import signal
+import asyncio
+import logging
+import argparse
+import threading
+import contextlib
+import importlib.util
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+OK = 0
+WARNING = 1
+CRITICAL = 2
+UNKNOWN = 3
+
+# Passive host check result
+HOST_DOWN = 1
+
+DEFAULT_INTERVAL = 300
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_plugin(name, filename):
+    """
+    Import a plugin script as module, the file names are not all valid module names
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PLUGIN_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_credentials(path):
+    with open(path, 'r') as credentials_file:
+        lines = credentials_file.read().splitlines()
+    if len(lines) < 2:
+        raise ValueError("%s does not contain a username and a password line" % path)
+    return lines[0].strip(), lines[1].strip()
+
+
+def command_line(host, service, state, output):
+    # The external command file takes one line per command
+    return "[%d] PROCESS_SERVICE_CHECK_RESULT;%s;%s;%d;%s\n" % (
+        time.time(), host, service, state, output.strip().replace("\n", "\\n"))
+
+
+def host_command_line(host, state, output):
+    return "[%d] PROCESS_HOST_CHECK_RESULT;%s;%d;%s\n" % (
+        time.time(), host, state, output.strip().replace("\n", "\\n"))
+
+
+class CheckExit(Exception):
+    """
+    A plugin function exited during a poll, output is what it printed before
+    """
+
+    def __init__(self, code, output):
+        super().__init__("exit code %s: %s" % (code, output))
+        self.code = code
+        self.output = output
+
+
+class ThreadOutput:
+    """
+    sys.stdout replacement that collects the output of a thread while it is captured
+
+    The plugin functions print their error message before they exit, the polls run in
+    parallel threads so contextlib.redirect_stdout can not be used.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextlib.contextmanager
+    def capture(self):
+        self.local.buffer = io.StringIO()
+        try:
+            yield self.local.buffer
+        finally:
+            self.local.buffer = None
+
+
+def close_if_dropped(conn):
+    """
+    Close a kept http.client connection the server has closed meanwhile
+
+    An idle connection is only readable when the server closed it, the next request
+    then opens a new one instead of failing on the dead socket.
+    """
+    if conn.sock is None:
+        return
+    try:
+        readable = select.select([conn.sock], [], [], 0)[0]
+    except (OSError, ValueError):
+        readable = True
+    if readable:
+        conn.close()
+
+
+class Check:
+    """
+    One configured upstream, poll() is blocking and returns external command lines
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.host = config['host']
+        self.interval = config.get('interval', DEFAULT_INTERVAL)
+        self.name = "%s %s" % (config['type'], self.host)
+
+    def poll(self):
+        raise NotImplementedError("poll not implemented in %s" % type(self))
+
+    def failed(self, output):
+        """
+        Lines reporting a failed poll for the services of this check
+        """
+        raise NotImplementedError("failed not implemented in %s" % type(self))
+
+    def close(self):
+        pass
+
+
+class NsxtCheck(Check):
+    """
+    check_vmware_nsxt.py modes, one Client and session for the life of the daemon
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        nsxt = load_plugin('check_vmware_nsxt', 'check_vmware_nsxt.py')
+        username, password = read_credentials(config['credentials_file'])
+        cache_dir = config.get('cache_dir', nsxt.default_cache_dir('check_vmware_nsxt'))
+
+        # Same certificate store as the plugin
+        import ssl # pylint: disable=import-outside-toplevel
+        nsxt.fix_tls_cert_store(ssl.get_default_verify_paths().cafile)
+        if config.get('insecure'):
+            import urllib3 # pylint: disable=import-outside-toplevel
+            urllib3.disable_warnings()
+
+        self.nsxt = nsxt
+        self.modes = nsxt.expand_modes(config.get('modes', ['all']))
+        self.service_prefix = config.get('service_prefix', '')
+        self.excludes = nsxt.load_excludes(config.get('excludes'), config.get('exclude_files'), cache_dir)
+        self.client = nsxt.Client(config['api'], username, password, verify=not config.get('insecure', False),
+                                  max_age=config.get('max_age', 5), severities=config.get('severities'),
+                                  history_dir=os.path.join(cache_dir, 'capacity-history'),
+                                  trend_window=config.get('trend_window', 168), trend_warning=config.get('trend_warning', 7),
+                                  trend_critical=config.get('trend_critical', 1))
+
+    def poll(self):
+        results = self.nsxt.run_modes(self.client, self.modes, self.excludes)
+        return self.nsxt.passive_lines(self.host, self.service_prefix, results)
+
+    def failed(self, output):
+        return [command_line(self.host, self.service_prefix + mode, CRITICAL, output) for mode in self.modes]
+
+    def close(self):
+        self.client.close()
+
+
+class VeeamJobsCheck(Check):
+    """
+    check_veeam_backupjobs.py as one service
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        jobs = load_plugin('check_veeam_backupjobs', 'check_veeam_backupjobs.py')
+        veeam_rest = load_plugin('veeam_rest', 'veeam_rest.py')
+        username, password = read_credentials(config['credentials_file'])
+
+        self.jobs = jobs
+        self.service = config.get('service', 'Veeam Jobs')
+        self.client = veeam_rest.VeeamClient(config['url'], username, password,
+                                             config.get('cache_dir', jobs.default_cache_dir('check_veeam')),
+                                             config.get('api_version'))
+
+    def poll(self):
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=self.config['max_backup_age'])
+        failed_jobs, warning_jobs, successful_jobs = self.jobs.fetch_jobs_states(
+            self.client, cutoff, self.config.get('job_filter'), self.config.get('server_filter', True))
+        state, lines = self.jobs.jobs_report(failed_jobs, warning_jobs, successful_jobs, self.config['max_backup_age'])
+        return [command_line(self.host, self.service, state, "\n".join(lines))]
+
+    def failed(self, output):
+        return [command_line(self.host, self.service, CRITICAL, output)]
+
+    def close(self):
+        self.client.close()
+
+
+class VeeamBackupCheck(Check):
+    """
+    check_veeam_backup.py bulk mode, one service per VM
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        backup = load_plugin('check_veeam_backup', 'check_veeam_backup.py')
+        veeam_rest = load_plugin('veeam_rest', 'veeam_rest.py')
+        username, password = read_credentials(config['credentials_file'])
+
+        self.backup = backup
+        self.vms = config.get('vms')
+        self.service_template = config.get('service_template', '{vm}')
+        self.seen = []
+        self.client = veeam_rest.VeeamClient(config['url'], username, password,
+                                             config.get('cache_dir', backup.default_cache_dir('check_veeam')),
+                                             config.get('api_version'))
+
+    def poll(self):
+        results = self.backup.check_bulk(self.client, set(self.vms) if self.vms else None, self.config['max_backup_age'])
+        self.seen = [vm_name for vm_name, _, _ in results]
+        return [command_line(self.host, self.service_template.format(vm=vm_name), state, message)
+                for vm_name, state, message in results]
+
+    def failed(self, output):
+        vm_names = self.vms or self.seen
+        if not vm_names:
+            # No VM is known before the first successful poll
+            return [host_command_line(self.host, HOST_DOWN, output)]
+        return [command_line(self.host, self.service_template.format(vm=vm_name), CRITICAL, output) for vm_name in vm_names]
+
+    def close(self):
+        self.client.close()
+
+
+class VeeamRepoCheck(Check):
+    """
+    check_veeam-EM-Repo-space.py all repositories mode, one service per repository
+
+    The connection and the cached EM session are kept between polls.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        repo = load_plugin('check_veeam_em_repo_space', 'check_veeam-EM-Repo-space.py')
+        self.username, self.password = read_credentials(config['credentials_file'])
+
+        self.repo = repo
+        self.selection = re.compile(config.get('pattern', '.*'))
+        self.thresholds = repo.parse_thresholds(config.get('thresholds'))
+        self.service_template = config.get('service_template', '{repository}')
+        self.cache_dir = config.get('cache_dir', repo.default_cache_dir('check_veeam'))
+        self.seen = []
+        self.conn = None
+
+    def poll(self):
+        if self.conn is None:
+            self.conn = self.repo.connect(self.config['url'])
+        else:
+            close_if_dropped(self.conn)
+
+        try:
+            repositories = self.repo.fetch_repository_report(self.config['url'], self.username, self.password, list, self.cache_dir,
+                                                             self.config.get('session_ttl', 600), self.config.get('report_format', 'json'),
+                                                             conn=self.conn)
+        except BaseException:
+            # The connection may be in the middle of a response
+            self.close()
+            raise
+        results = self.repo.evaluate_repositories(self.config['url'], repositories, self.selection, self.config['warning'],
+                                                  self.config['critical'], self.thresholds)
+        self.seen = [name for name, _, _, _ in results]
+        return [command_line(self.host, self.service_template.format(repository=name), state, message)
+                for name, state, message, _ in results]
+
+    def failed(self, output):
+        if not self.seen:
+            # No repository is known before the first successful poll
+            return [host_command_line(self.host, HOST_DOWN, output)]
+        return [command_line(self.host, self.service_template.format(repository=name), CRITICAL, output) for name in self.seen]
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+CHECK_TYPES = {
+    'nsxt': NsxtCheck,
+    'veeam-jobs': VeeamJobsCheck,
+    'veeam-backup': VeeamBackupCheck,
+    'veeam-repo': VeeamRepoCheck,
+}
+
+
+class Collector:
+    """
+    Schedules the polls of all checks and writes their results to the command file
+    """
+
+    def __init__(self, checks, command_file, loop, workers=8, logger=None):
+        self.checks = checks
+        self.command_file = command_file
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.write_lock = asyncio.Lock()
+        self.stopping = asyncio.Event()
+        # check: (future of the poll in the thread pool, loop time it started)
+        self.pending = {}
+        self.stdout = sys.stdout
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        self.output = sys.stdout
+
+        if logger is None:
+            logger = logging.getLogger()
+
+        self.logger = logger
+
+    def write(self, lines):
+        with open(self.command_file, 'a') as cmd:
+            cmd.write("".join(lines))
+
+    async def submit(self, lines):
+        if not lines:
+            return
+        # One writer at a time, so the lines of different checks don't interleave in the FIFO
+        async with self.write_lock:
+            await self.loop.run_in_executor(self.executor, self.write, lines)
+
+    def run_poll(self, check):
+        """
+        check.poll in a worker thread, with what the plugin printed before an exit
+        """
+        with self.output.capture() as output:
+            try:
+                return check.poll()
+            except SystemExit as exc:
+                raise CheckExit(exc.code, output.getvalue().strip()) from None
+
+    def discard(self, check, future):
+        """
+        Done callback of a timed out poll, its late result is not submitted
+        """
+        if not future.cancelled() and future.exception() is not None:
+            self.logger.debug("%s: timed out poll failed: %s", check.name, future.exception())
+
+    async def poll(self, check):
+        started = time.monotonic()
+
+        # The thread of a timed out poll can not be stopped. Until it finishes, no new poll
+        # is started with the same client and the services are reported as failed instead
+        future, since = self.pending.get(check, (None, None))
+        if future is not None and not future.done():
+            running = self.loop.time() - since
+            self.logger.warning("%s: previous poll still running after %.0fs, skipped", check.name, running)
+            await self.submit(check.failed("previous poll still running after %.0fs" % running))
+            return
+
+        future = self.loop.run_in_executor(self.executor, self.run_poll, check)
+        self.pending[check] = (future, self.loop.time())
+        try:
+            # Shielded, so the future tracks the thread after a timeout
+            lines = await asyncio.wait_for(asyncio.shield(future), timeout=check.interval)
+        except asyncio.TimeoutError:
+            self.logger.warning("%s: poll timed out after %ss", check.name, check.interval)
+            future.add_done_callback(lambda done: self.discard(check, done))
+            lines = check.failed("poll timed out after %ss" % check.interval)
+        except CheckExit as exc:
+            # Plugin functions report some errors by printing them and exiting
+            self.logger.warning("%s: check exited with %s: %s", check.name, exc.code, exc.output)
+            lines = check.failed(exc.output or "check failed with exit code %s" % exc.code)
+        except Exception as exc: # pylint: disable=broad-except
+            self.logger.warning("%s: poll failed: %s", check.name, exc)
+            lines = check.failed("poll failed: %s" % exc)
+
+        await self.submit(lines)
+        self.logger.debug("%s: %d results in %.2fs", check.name, len(lines), time.monotonic() - started)
+
+    async def run_check(self, check, offset):
+        # Spread the first polls over the interval instead of starting every check at once
+        await self.sleep(offset)
+        while not self.stopping.is_set():
+            started = self.loop.time()
+            await self.poll(check)
+            await self.sleep(max(check.interval - (self.loop.time() - started), 0))
+
+    async def sleep(self, seconds):
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        count = len(self.checks)
+        await asyncio.gather(*[self.run_check(check, check.interval * index / count) for index, check in enumerate(self.checks)])
+
+    async def run_once(self):
+        await asyncio.gather(*[self.poll(check) for check in self.checks])
+
+    def stop(self):
+        self.stopping.set()
+
+    def close(self):
+        for check in self.checks:
+            check.close()
+        self.executor.shutdown(wait=False)
+        sys.stdout = self.stdout
+
+
+async def collect(checks, command_file, once=False, workers=8):
+    """
+    Poll the checks once or until SIGINT/SIGTERM, within the event loop of asyncio.run
+    """
+    loop = asyncio.get_running_loop()
+    collector = Collector(checks, command_file, loop, workers)
+
+    try:
+        if once:
+            await collector.run_once()
+            return OK
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, collector.stop)
+        logging.info("polling %d checks", len(checks))
+        await collector.run()
+        return OK
+    finally:
+        collector.close()
+
+
+def build_checks(config):
+    checks = []
+    for check_config in config.get('checks', []):
+        try:
+            check_type = CHECK_TYPES[check_config['type']]
+        except KeyError:
+            raise ValueError("unknown check type %s, supported are %s" % (
+                check_config.get('type'), ', '.join(sorted(CHECK_TYPES)))) from None
+        checks.append(check_type(check_config))
+    return checks
+
+
+def commandline(args):
+    parser = argparse.ArgumentParser(description='Submit the NSX and Veeam checks as passive results from one long-running process')
+    parser.add_argument('--config', '-c', required=True, help='JSON configuration file')
+    parser.add_argument('--once', action='store_true', help='Poll every check once and exit')
+    parser.add_argument('--workers', type=int, default=8, help='Threads for the blocking API requests. Defaults to 8')
+    parser.add_argument('--debug', action='store_true', help='Log every poll')
+    return parser.parse_args(args)
+
+
+def main(args):
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    with open(args.config, 'r') as config_file:
+        config = json.load(config_file)
+
+    checks = build_checks(config)
+    return asyncio.run(collect(checks, config.get('command_file', '/usr/local/nagios/var/rw/nagios.cmd'), args.once, args.workers))
+
+
+if __name__ == '__main__':
+    sys.exit(main(commandline(sys.argv[1:])))
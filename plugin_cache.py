@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Local state shared between runs and processes of the check plugins
+
+Only uses the standard library, so the plugins can import it without pulling in
+their HTTP stacks. Everything is stored in a private cache directory (mode 0700)
+with files written atomically.
+
+* write_atomic - write a file next to its destination and rename it into place
+* file_lock - bounded wait for an exclusive lock file
+* ResponseCache - decoded API responses with TTLs, LRU size cap and request coalescing
+* TokenStore - OAuth2 tokens per server and user, renewed with their refresh token
+"""
+
+import os
+import time
+import json
+import fcntl
+import hashlib
+import logging
+import tempfile
+import contextlib
+
+
+def default_cache_dir(name):
+    """
+    Default cache directory of a plugin, below the system temp directory
+    """
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def private_dir(path):
+    """
+    Create path with mode 0700 and check nobody else can use it
+
+    Returns False when the directory belongs to another user or is accessible by others,
+    secrets must not be stored there then.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        stat = os.stat(path)
+    except OSError:
+        return False
+
+    if stat.st_uid != os.geteuid():
+        return False
+    if stat.st_mode & 0o077:
+        try:
+            os.chmod(path, 0o700)
+        except OSError:
+            return False
+
+    return True
+
+
+def write_atomic(path, content, mode='w'):
+    """
+    Write a file next to its destination and rename it into place
+
+    The file is only readable by the current user.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    handle, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(handle, mode) as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout):
+    """
+    Hold an exclusive flock on path, waiting at most timeout seconds
+
+    Yields True when the lock was acquired and False when the wait timed out, the caller
+    decides whether to go on without the lock.
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+
+    with open(path, 'a') as lock_file:
+        deadline = time.monotonic() + timeout
+        locked = False
+
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.02)
+
+        try:
+            if locked:
+                # Used by ResponseCache.prune to find lock files nobody uses anymore
+                os.utime(path, None)
+            yield locked
+        finally:
+            if locked:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ResponseCache:
+    """
+    Local cache for decoded API responses shared between plugin runs
+
+    Entries are keyed on manager, request path and user and expire after a per-endpoint
+    TTL. Files are written atomically, and the least recently used entries are removed
+    once the directory grows over max_size bytes.
+
+    With coalesce_wait set, concurrent processes fetching the same key are serialized by
+    a lock file per key: the first one does the request, the others wait for it and
+    reuse its result. After coalesce_wait seconds a waiting process fetches on its own.
+
+    Responses decide the check results, so nothing is cached when the directory is not
+    private to the current user.
+    """
+
+    PREFIX = 'resp-'
+    LOCK_PREFIX = 'lock-'
+
+    # Lock files not used for this many seconds are removed by prune
+    LOCK_MAX_AGE = 86400
+
+    def __init__(self, directory, ttls=None, default_ttl=0, max_size=64 * 1024 * 1024, coalesce_wait=0, logger=None):
+        self.directory = directory
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+        self.coalesce_wait = coalesce_wait
+
+        if logger is None:
+            logger = logging.getLogger()
+
+        self.logger = logger
+        self.usable = private_dir(directory)
+        if not self.usable:
+            self.logger.warning("response cache %s is not private, responses are not cached", directory)
+
+    def ttl_for(self, url):
+        """
+        TTL in seconds for a request path, 0 disables caching
+        """
+        endpoint = url.split('?', 1)[0]
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def key(self, api, url, username):
+        return hashlib.sha256(("%s\0%s\0%s" % (api, url, username)).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, self.PREFIX + key + '.json')
+
+    def get(self, key, ttl):
+        """
+        Return the cached data or None when it is missing or older than ttl
+        """
+        if not self.usable:
+            return None
+
+        path = self.path(key)
+
+        try:
+            with open(path, 'r') as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            age = time.time() - entry['created']
+        except (KeyError, TypeError):
+            return None
+        # Entries from the future would never expire
+        if age > ttl or age < 0:
+            return None
+
+        try:
+            # Recently used entries are kept longest when the cache is pruned
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return entry.get('data')
+
+    def put(self, key, data):
+        if not self.usable:
+            return
+
+        try:
+            write_atomic(self.path(key), json.dumps({'created': time.time(), 'data': data}))
+            self.prune()
+        except OSError as cache_exc:
+            self.logger.debug("could not write response cache: %s", cache_exc)
+
+    def fetch(self, key, fetch, store=True):
+        """
+        Call fetch for key, coalescing with other processes fetching the same key
+
+        Returns (data, coalesced) where coalesced tells if the result of another process
+        was reused. The result is stored when store is set or other processes may wait for it.
+        """
+        # Lock files and results of other processes are not trusted outside a private directory
+        if self.coalesce_wait <= 0 or not self.usable:
+            data = fetch()
+            if store:
+                self.put(key, data)
+            return data, False
+
+        started = time.time()
+        lock_path = os.path.join(self.directory, self.LOCK_PREFIX + key)
+
+        with file_lock(lock_path, self.coalesce_wait) as locked:
+            if locked:
+                # Someone else held the lock, reuse what they fetched since we started waiting
+                data = self.get(key, time.time() - started)
+                if data is not None:
+                    return data, True
+            else:
+                self.logger.debug("waited %ss for %s, fetching without lock", self.coalesce_wait, key)
+
+            data = fetch()
+            self.put(key, data)
+            return data, False
+
+    def prune(self):
+        """
+        Remove the least recently used entries until the cache fits max_size
+        """
+        entries = []
+        total = 0
+        now = time.time()
+
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            if entry.name.startswith(self.LOCK_PREFIX):
+                if now - stat.st_mtime > self.LOCK_MAX_AGE:
+                    with contextlib.suppress(OSError):
+                        os.unlink(entry.path)
+                continue
+
+            if not entry.name.startswith(self.PREFIX):
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+            total -= size
+
+
+class TokenStore:
+    """
+    Local store for OAuth2 tokens per server and user
+
+    A cached access token is used until margin seconds before it expires, then it is
+    renewed with the refresh token. Only when there is no token or the refresh fails a
+    new password grant is done. Renewals are serialized by a lock file, so concurrent
+    checks don't use the same refresh token twice.
+    """
+
+    PREFIX = 'token-'
+
+    def __init__(self, directory, margin=60, lock_timeout=10, logger=None):
+        self.directory = directory
+        self.margin = margin
+        self.lock_timeout = lock_timeout
+
+        if logger is None:
+            logger = logging.getLogger()
+
+        self.logger = logger
+        self.usable = private_dir(directory)
+        if not self.usable:
+            self.logger.warning("token cache %s is not private, tokens are not cached", directory)
+
+    def path(self, server, username):
+        key = hashlib.sha256(("%s\0%s" % (server, username)).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, self.PREFIX + key + '.json')
+
+    def load(self, path):
+        try:
+            with open(path, 'r') as token_file:
+                return json.load(token_file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, path, token_response):
+        entry = {
+            'access_token': token_response['access_token'],
+            'refresh_token': token_response.get('refresh_token'),
+            'expires_at': time.time() + int(token_response.get('expires_in', 0)),
+        }
+        try:
+            write_atomic(path, json.dumps(entry))
+        except OSError as token_exc:
+            self.logger.debug("could not write token cache: %s", token_exc)
+
+    def valid(self, entry):
+        return entry is not None and entry.get('expires_at', 0) - self.margin > time.time()
+
+    def invalidate(self, server, username):
+        """
+        Forget the cached token, e.g. after the server rejected it
+        """
+        with contextlib.suppress(OSError):
+            os.unlink(self.path(server, username))
+
+    def get_token(self, server, username, password_grant, refresh_grant):
+        """
+        Return an access token for server and user
+
+        password_grant() and refresh_grant(refresh_token) do the token requests and return
+        the decoded token response. A failing refresh_grant must raise an exception.
+        """
+        if not self.usable:
+            return password_grant()['access_token']
+
+        path = self.path(server, username)
+        entry = self.load(path)
+        if self.valid(entry):
+            return entry['access_token']
+
+        with file_lock(path + '.lock', self.lock_timeout):
+            # Another check may have renewed the token while we waited for the lock
+            entry = self.load(path)
+            if self.valid(entry):
+                return entry['access_token']
+
+            token_response = None
+            if entry is not None and entry.get('refresh_token'):
+                try:
+                    token_response = refresh_grant(entry['refresh_token'])
+                except Exception as refresh_exc: # pylint: disable=broad-except
+                    self.logger.debug("token refresh failed, using password grant: %s", refresh_exc)
+
+            if token_response is None:
+                token_response = password_grant()
+
+            self.save(path, token_response)
+            return token_response['access_token']
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Compact local sample history for the trend and forecast checks
+
+Only uses the standard library. Every series is a fixed-size binary ring buffer,
+so a year of samples costs a fixed number of bytes on disk and an append is one
+small write at a computed offset, no matter how long the history is.
+
+* RingHistory - ring buffer of (timestamp, value) samples in one file
+* MappedHistory - the same file accessed through mmap, reads only touch the requested window
+* linear_fit - least-squares line through samples
+"""
+
+import os
+import math
+import mmap
+import array
+import struct
+import bisect
+import hashlib
+import operator
+from plugin_cache import file_lock, private_dir
+
+
+class RingHistory:
+    """
+    Fixed-size ring buffer of (timestamp, value) samples stored in one file
+
+    The file is a header followed by two columns of doubles, all timestamps then all
+    values, so both load straight into array('d') without per-sample unpacking. The
+    size is fixed when the file is created, later size arguments are ignored.
+    """
+
+    MAGIC = b'RHS1'
+    # magic, size, index of the next write, number of samples
+    HEADER = struct.Struct('<4sIII')
+    SAMPLE = struct.Struct('<d')
+
+    def __init__(self, path, size=8640):
+        self.path = path
+        self.size = size
+
+    @classmethod
+    def for_series(cls, directory, *key, size=8640):
+        """
+        History of the series identified by key, e.g. server and repository name
+
+        Returns None when directory can not be used.
+        """
+        if not private_dir(directory):
+            return None
+        name = hashlib.sha256('\0'.join(key).encode('utf-8')).hexdigest()
+        return cls(os.path.join(directory, 'ring-%s.bin' % name), size)
+
+    def _read_header(self, history_file):
+        history_file.seek(0)
+        header = history_file.read(self.HEADER.size)
+        if len(header) != self.HEADER.size:
+            return None
+        magic, size, head, count = self.HEADER.unpack(header)
+        if magic != self.MAGIC or size == 0 or head >= size or count > size:
+            return None
+        return size, head, count
+
+    def _create(self, history_file):
+        history_file.seek(0)
+        history_file.truncate()
+        history_file.write(self.HEADER.pack(self.MAGIC, self.size, 0, 0))
+        # Sparse on most file systems until the slots are written
+        history_file.truncate(self.HEADER.size + 2 * self.size * self.SAMPLE.size)
+        return self.size, 0, 0
+
+    def append(self, timestamp, value, min_interval=0):
+        """
+        Add a sample, unless the newest sample is less than min_interval seconds old
+
+        Returns True when the sample was written.
+        """
+        with file_lock(self.path + '.lock', 5):
+            mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+            with open(self.path, mode) as history_file:
+                header = self._read_header(history_file) or self._create(history_file)
+                size, head, count = header
+
+                if count and min_interval > 0:
+                    last = (head - 1) % size
+                    history_file.seek(self.HEADER.size + last * self.SAMPLE.size)
+                    if timestamp - self.SAMPLE.unpack(history_file.read(self.SAMPLE.size))[0] < min_interval:
+                        return False
+
+                history_file.seek(self.HEADER.size + head * self.SAMPLE.size)
+                history_file.write(self.SAMPLE.pack(timestamp))
+                history_file.seek(self.HEADER.size + (size + head) * self.SAMPLE.size)
+                history_file.write(self.SAMPLE.pack(value))
+                history_file.seek(0)
+                history_file.write(self.HEADER.pack(self.MAGIC, size, (head + 1) % size, min(count + 1, size)))
+        return True
+
+    def samples(self, since=None):
+        """
+        Return (timestamps, values) as array('d') in time order, only samples at or after since
+        """
+        times = array.array('d')
+        values = array.array('d')
+
+        try:
+            with open(self.path, 'rb') as history_file:
+                header = self._read_header(history_file)
+                if header is None:
+                    return times, values
+                size, head, count = header
+                times.fromfile(history_file, size)
+                values.fromfile(history_file, size)
+        except (OSError, EOFError):
+            return array.array('d'), array.array('d')
+
+        if count == size:
+            # Full ring, the oldest sample is at head
+            times = times[head:] + times[:head]
+            values = values[head:] + values[:head]
+        else:
+            times = times[:count]
+            values = values[:count]
+
+        if since is not None:
+            start = bisect.bisect_left(times, since)
+            times = times[start:]
+            values = values[start:]
+
+        return times, values
+
+
+class MappedHistory(RingHistory):
+    """
+    RingHistory accessed through mmap
+
+    Appends are two pack_into calls and a header update on the mapping. Reading a
+    window bisects the mapped timestamps and copies only the samples inside the
+    window, so the pages of older samples are never read.
+    """
+
+    def _open(self):
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        history_file = open(self.path, mode)
+        header = self._read_header(history_file) or self._create(history_file)
+        history_file.flush()
+        return history_file, header
+
+    def append(self, timestamp, value, min_interval=0):
+        with file_lock(self.path + '.lock', 5):
+            history_file, header = self._open()
+            with history_file, mmap.mmap(history_file.fileno(), 0) as mapped:
+                size, head, count = header
+                times_offset = self.HEADER.size
+                values_offset = self.HEADER.size + size * self.SAMPLE.size
+
+                if count and min_interval > 0:
+                    last = self.SAMPLE.unpack_from(mapped, times_offset + (head - 1) % size * self.SAMPLE.size)[0]
+                    if timestamp - last < min_interval:
+                        return False
+
+                self.SAMPLE.pack_into(mapped, times_offset + head * self.SAMPLE.size, timestamp)
+                self.SAMPLE.pack_into(mapped, values_offset + head * self.SAMPLE.size, value)
+                self.HEADER.pack_into(mapped, 0, self.MAGIC, size, (head + 1) % size, min(count + 1, size))
+        return True
+
+    def samples(self, since=None):
+        times = array.array('d')
+        values = array.array('d')
+
+        try:
+            history_file = open(self.path, 'rb')
+        except OSError:
+            return times, values
+
+        with history_file:
+            header = self._read_header(history_file)
+            if header is None:
+                return times, values
+            size, head, count = header
+            if count == 0:
+                return times, values
+
+            with mmap.mmap(history_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    column = view[self.HEADER.size:self.HEADER.size + 2 * size * self.SAMPLE.size].cast('d')
+                    try:
+                        # Oldest first, a full ring wraps around at head
+                        segments = [(head, size), (0, head)] if count == size else [(0, count)]
+                        for start, end in segments:
+                            first = bisect.bisect_left(column[start:end], since) + start if since is not None else start
+                            times.extend(column[first:end])
+                            values.extend(column[size + first:size + end])
+                    finally:
+                        column.release()
+                finally:
+                    view.release()
+
+        return times, values
+
+
+def linear_fit(times, values):
+    """
+    Least-squares line through the samples, returns (slope per second, value at the last sample)
+
+    The sums run over whole arrays with map and sum, there is no per-sample Python code, so
+    a year of 5 minute samples fits in milliseconds. Returns None for fewer than two samples
+    or samples that all have the same timestamp.
+    """
+    count = len(times)
+    if count < 2:
+        return None
+
+    # Timestamps relative to the last sample keep the sums of squares precise
+    last = times[-1]
+    shifted = array.array('d', map(last.__rsub__, times))
+
+    mean_t = math.fsum(shifted) / count
+    mean_v = math.fsum(values) / count
+    sxx = sum(map(operator.mul, shifted, shifted)) - count * mean_t * mean_t
+    sxy = sum(map(operator.mul, shifted, values)) - count * mean_t * mean_v
+    if sxx <= 0:
+        return None
+
+    slope = sxy / sxx
+    return slope, mean_v - slope * mean_t
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Per-phase timings of a check run, reported as Nagios perfdata with --timings
+
+Only uses the standard library at import time, like plugin_cache. Durations are
+measured with time.monotonic and are exclusive: a phase that runs inside another one
+(the TCP connect inside the fetch of a request, the fetch of the next alarms page inside
+the output formatting) is subtracted from the enclosing phase, so the phases of a check
+add up to its run time. Phases of concurrent requests add up across threads.
+
+* Timings - durations per phase, request count and response bytes of one check result
+* phase - context manager timing a phase, for the Timings of the enclosing phase when none is given
+* perfdata_suffix - the perfdata to append to the first output line
+* CountingReader - counts the response bytes of a body that is parsed while it is read
+* connection_class - http.client connection class timing dns, connect and tls
+* instrument_session - the same for the connections of a requests session
+
+Phase names used by the plugins: dns, connect, tls, auth, fetch (request sent until the
+response is read), decode (JSON/XML), cache, output (classification and formatting).
+"""
+
+import time
+import socket
+import threading
+import contextlib
+
+_local = threading.local()
+
+
+class Timings:
+    """
+    Monotonic per-phase durations, request count and response bytes of one check result
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.durations = {}
+        self.requests = 0
+        self.response_bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def count(self, response_bytes, requests=1):
+        """
+        Count an API request and the size of its response body
+        """
+        with self.lock:
+            self.requests += requests
+            self.response_bytes += response_bytes
+
+    def phase(self, name):
+        return phase(name, self)
+
+    def perfdata(self):
+        perfdata = ["time_%s=%.4fs;;;0" % (name, seconds) for name, seconds in sorted(self.durations.items())]
+        perfdata.append("time_total=%.4fs;;;0" % (time.monotonic() - self.started))
+        perfdata.append("requests=%d;;;0" % self.requests)
+        perfdata.append("response_bytes=%dB;;;0" % self.response_bytes)
+        return perfdata
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current():
+    """
+    Timings of the innermost open phase of this thread, None outside of phases
+    """
+    stack = _stack()
+    return stack[-1][0] if stack else None
+
+
+@contextlib.contextmanager
+def phase(name, timings=None):
+    """
+    Time a phase for timings, or for the Timings of the enclosing phase of this thread
+
+    Does nothing when there is neither, so the plugins call it unconditionally.
+    """
+    if timings is None:
+        timings = current()
+    if timings is None:
+        yield
+        return
+
+    # [timings, time spent in nested phases]
+    frame = [timings, 0.0]
+    stack = _stack()
+    stack.append(frame)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        stack.pop()
+        timings.add(name, elapsed - frame[1])
+        if stack:
+            stack[-1][1] += elapsed
+
+
+def count(response_bytes, timings=None, requests=1):
+    """
+    Count a request for timings or the Timings of the enclosing phase, if any
+    """
+    timings = timings or current()
+    if timings is not None:
+        timings.count(response_bytes, requests)
+
+
+class CountingReader:
+    """
+    File-like wrapper of a streamed response body that counts the bytes read from it
+    """
+
+    def __init__(self, stream, timings):
+        self.stream = stream
+        self.timings = timings
+
+    def read(self, size=None):
+        # HTTPResponse.read(-1) waits for the end of a keep-alive connection
+        data = self.stream.read(size)
+        self.timings.count(len(data), requests=0)
+        return data
+
+
+def perfdata_suffix(timings, separator=' | '):
+    """
+    Perfdata of timings to append to the first output line, empty without timings
+
+    Use separator ' ' when the line has perfdata already.
+    """
+    if timings is None:
+        return ''
+    return separator + ' '.join(timings.perfdata())
+
+
+def resolve(host, port):
+    """
+    Addresses to connect to, timed as dns phase
+    """
+    with phase('dns'):
+        return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+
+def open_socket(addresses, timeout, source_address=None, socket_options=None):
+    """
+    Connect to the first reachable of the resolved addresses, timed as connect phase
+    """
+    error = OSError('no addresses to connect to')
+    with phase('connect'):
+        for family, socktype, proto, _, address in addresses:
+            sock = socket.socket(family, socktype, proto)
+            try:
+                for option in socket_options or []:
+                    sock.setsockopt(*option)
+                # Skips the default timeout sentinels of socket and urllib3
+                if isinstance(timeout, (int, float)):
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(address)
+                return sock
+            except OSError as exc:
+                error = exc
+                sock.close()
+    raise error
+
+
+_connection_classes = {}
+
+
+def connection_class(https=True):
+    """
+    http.client connection class timing dns, connect and, with https, tls
+
+    Built on first use, so http.client is not imported with this module.
+    """
+    if _connection_classes:
+        return _connection_classes[https]
+
+    import http.client # pylint: disable=import-outside-toplevel
+
+    class TimedHTTPConnection(http.client.HTTPConnection):
+
+        def connect(self):
+            self.sock = open_socket(resolve(self.host, self.port), self.timeout, self.source_address)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self._tunnel_host:
+                self._tunnel()
+
+    class TimedHTTPSConnection(http.client.HTTPSConnection):
+
+        def connect(self):
+            TimedHTTPConnection.connect(self)
+            with phase('tls'):
+                self.sock = self._context.wrap_socket(self.sock, server_hostname=self._tunnel_host or self.host)
+
+    _connection_classes.update({False: TimedHTTPConnection, True: TimedHTTPSConnection})
+    return _connection_classes[https]
+
+
+def instrument_session(session):
+    """
+    Time dns, connect and tls of the connections of a requests session
+
+    Replaces the connection classes of the pools of the mounted adapters, the adapters
+    keep their settings.
+    """
+    from urllib3 import connectionpool, connection # pylint: disable=import-outside-toplevel
+    from urllib3.exceptions import NewConnectionError # pylint: disable=import-outside-toplevel
+
+    class TimedConnectionMixin:
+
+        def _new_conn(self):
+            try:
+                addresses = resolve(self._dns_host, self.port)
+                return open_socket(addresses, self.timeout, self.source_address, self.socket_options)
+            except OSError as exc:
+                raise NewConnectionError(self, "Failed to establish a new connection: %s" % exc) # pylint: disable=raise-missing-from
+
+    class TimedHTTPConnection(TimedConnectionMixin, connection.HTTPConnection):
+        pass
+
+    class TimedHTTPSConnection(TimedConnectionMixin, connection.HTTPSConnection):
+
+        def connect(self):
+            # Everything after the socket is connected is the TLS handshake
+            with phase('tls'):
+                super().connect()
+
+    class TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    for adapter in set(session.adapters.values()):
+        adapter.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Minimal client for the Veeam Backup & Replication REST API (port 9419)
+
+Shared by check_veeam_backup.py and check_veeam_backupjobs.py. Requests are sent in
+process over keep-alive connections (http.client, no curl fork). OAuth2 tokens are
+cached with plugin_cache.TokenStore, and the x-api-version the server accepts is
+negotiated once per server and cached, so one script serves every VBR version.
+With a plugin_timings.Timings the requests are timed per phase (auth, fetch, decode and
+the dns, connect and tls of new connections).
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import urllib.parse
+from plugin_cache import TokenStore, private_dir, write_atomic
+from plugin_timings import phase, count, connection_class
+
+
+class VeeamError(Exception):
+    """
+    Raised when the Veeam API can not be reached or returns an error
+    """
+
+
+class VeeamClient:
+    """
+    REST client for one VBR server and user
+    """
+
+    # Tried newest first when the server's version is not known yet
+    API_VERSIONS = [
+        '1.3-rev1', '1.3-rev0',
+        '1.2-rev1', '1.2-rev0',
+        '1.1-rev2', '1.1-rev1', '1.1-rev0',
+        '1.0-rev2', '1.0-rev1',
+    ]
+
+    def __init__(self, url, username, password, cache_dir=None, api_version=None, token_cache=True, timeout=30, pool_size=4,
+                 logger=None, timings=None):
+        parsed = urllib.parse.urlsplit(url)
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or 9419
+        self.username = username
+        self.password = password
+        self.cache_dir = cache_dir
+        self.token_cache = token_cache and cache_dir is not None
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.timings = timings
+
+        if logger is None:
+            logger = logging.getLogger()
+
+        self.logger = logger
+
+        # http.client and ssl are imported on first use, so the plugins' usage errors don't load them
+        import ssl # pylint: disable=import-outside-toplevel
+
+        # The VBR REST API usually runs with a self-signed certificate
+        self.context = ssl._create_unverified_context()
+        self.pool = []
+        self.pool_lock = threading.Lock()
+
+        self.pinned = api_version is not None
+        self.api_version = api_version
+        if self.api_version is None:
+            self.api_version = self.load_version()
+
+        self.access_token = None
+        self.token_cached = False
+
+    def version_file(self):
+        if self.cache_dir is None or not private_dir(self.cache_dir):
+            return None
+        key = hashlib.sha256(("%s:%d" % (self.host, self.port)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, 'apiversion-%s.json' % key)
+
+    def load_version(self):
+        path = self.version_file()
+        if path is None:
+            return None
+        try:
+            with open(path, 'r') as version_file:
+                return json.load(version_file)['api_version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save_version(self, version):
+        path = self.version_file()
+        if path is None:
+            return
+        try:
+            write_atomic(path, json.dumps({'api_version': version, 'negotiated': time.time()}))
+        except OSError as version_exc:
+            self.logger.debug("could not cache api version: %s", version_exc)
+
+    def candidates(self):
+        if self.pinned:
+            return [self.api_version]
+        if self.api_version is None:
+            return list(self.API_VERSIONS)
+        return [self.api_version] + [version for version in self.API_VERSIONS if version != self.api_version]
+
+    def _acquire(self):
+        import http.client # pylint: disable=import-outside-toplevel
+
+        with self.pool_lock:
+            if self.pool:
+                return self.pool.pop(), True
+        conn_class = http.client.HTTPSConnection if self.timings is None else connection_class()
+        return conn_class(self.host, self.port, context=self.context, timeout=self.timeout), False
+
+    def _release(self, conn):
+        with self.pool_lock:
+            if len(self.pool) < self.pool_size:
+                self.pool.append(conn)
+                return
+        conn.close()
+
+    def _set_timeout(self, conn, timeout):
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+    def send(self, method, path, headers, body=None, timeout=None, phase_name='fetch'):
+        """
+        Send one request over a pooled connection and return (status, decoded body)
+
+        timeout overrides the client's socket timeout for this request only.
+        """
+        import http.client # pylint: disable=import-outside-toplevel
+
+        timeout = self.timeout if timeout is None else timeout
+        conn, reused = self._acquire()
+        try:
+            with phase(phase_name, self.timings):
+                try:
+                    self._set_timeout(conn, timeout)
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    if not reused:
+                        raise
+                    # The server closed the idle keep-alive connection, retry once on a new one
+                    conn.close()
+                    conn, reused = self._acquire()
+                    self._set_timeout(conn, timeout)
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                raw = response.read()
+        except (OSError, http.client.HTTPException) as send_exc:
+            conn.close()
+            raise VeeamError('Request to %s failed: %s' % (path, send_exc)) # pylint: disable=raise-missing-from
+
+        self._release(conn)
+        count(len(raw), self.timings)
+
+        with phase('decode', self.timings):
+            try:
+                data = json.loads(raw.decode('utf-8')) if raw else None
+            except ValueError:
+                data = raw.decode('utf-8', 'replace')
+
+        return response.status, data
+
+    def send_versioned(self, method, path, headers, body=None, timeout=None, phase_name='fetch'):
+        """
+        Send a request, trying the known x-api-versions until the server accepts one
+
+        The accepted version is cached per server, so later runs need no extra round trips.
+        """
+        for version in self.candidates():
+            status, data = self.send(method, path, dict(headers, **{'x-api-version': version}), body, timeout, phase_name)
+            if status == 400 and 'version' in str(data).lower() and not self.pinned:
+                self.logger.debug("server rejected x-api-version %s", version)
+                continue
+
+            # Server errors say nothing about the version, only cache it when the request was understood
+            if version != self.api_version and status < 500:
+                self.api_version = version
+                self.save_version(version)
+            return status, data
+
+        raise VeeamError('Server at %s supports none of the x-api-versions %s' % (self.url, ', '.join(self.candidates())))
+
+    def request_token(self, form):
+        status, data = self.send_versioned('POST', '/api/oauth2/token', {
+            'Accept': 'application/json',
+            'Content-Type': 'application/x-www-form-urlencoded',
+        }, urllib.parse.urlencode(form), phase_name='auth')
+
+        if status != 200 or not isinstance(data, dict) or 'access_token' not in data:
+            raise VeeamError('Failed to authenticate with Veeam API: %s %s' % (status, data))
+        return data
+
+    def password_grant(self):
+        self.token_cached = False
+        return self.request_token({
+            'grant_type': 'password',
+            'username': self.username,
+            'password': self.password,
+        })
+
+    def refresh_grant(self, refresh_token):
+        self.token_cached = False
+        return self.request_token({
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token,
+        })
+
+    def token_store(self):
+        return TokenStore(os.path.join(self.cache_dir, 'tokens'), logger=self.logger)
+
+    def token(self):
+        if self.access_token is None:
+            with phase('auth', self.timings):
+                if not self.token_cache:
+                    self.access_token = self.password_grant()['access_token']
+                else:
+                    self.token_cached = True
+                    self.access_token = self.token_store().get_token(self.url, self.username, self.password_grant, self.refresh_grant)
+        return self.access_token
+
+    def get(self, path, params=None, timeout=None):
+        """
+        GET an API path and return the decoded JSON
+        """
+        if params:
+            path += '?' + urllib.parse.urlencode(params)
+
+        def send():
+            return self.send_versioned('GET', path, {
+                'Accept': 'application/json',
+                'Authorization': 'Bearer %s' % self.token(),
+            }, timeout=timeout)
+
+        status, data = send()
+        if status == 401 and self.token_cached:
+            # The cached token was revoked, e.g. by a restart of the VBR server
+            self.token_store().invalidate(self.url, self.username)
+            self.access_token = None
+            status, data = send()
+
+        if status != 200:
+            raise VeeamError('Request to %s was not successful: %s %s' % (path, status, data))
+
+        return data
+
+    def paginate(self, path, params=None, page_size=1000):
+        """
+        Generator over the data of a collection, requesting it page by page with skip/limit
+
+        Only one page is held in memory at a time.
+        """
+        params = dict(params or {}, limit=page_size)
+        skip = 0
+
+        while True:
+            params['skip'] = skip
+            page = self.get(path, params)
+            data = page.get('data', [])
+            yield from data
+
+            skip += len(data)
+            total = page.get('pagination', {}).get('total')
+            if not data or len(data) < page_size or (total is not None and skip >= total):
+                return
+
+    def close(self):
+        with self.pool_lock:
+            for conn in self.pool:
+                conn.close()
+            self.pool = []